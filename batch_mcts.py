@@ -0,0 +1,206 @@
+import time
+import numpy as np
+
+'''
+Monte carlo tree search that evaluates a batch of leaves per iteration.
+
+Each search picks batch_size leaves before evaluating any of them. Every edge on a
+selected path gets a pending (virtual) visit with a value penalty of virtual_loss, so
+the next selection in the same batch is steered to a different leaf. The walkers
+descend together with array operations over the batch. All picked leaves are then
+expanded together and evaluated with one model call, and the pending visits are
+replaced by real ones.
+
+The tree is stored in arrays indexed by node id (grown by doubling), with a dict
+from state to node id so transpositions share a node:
+    children[node, action]: node id of the neighbor, -1 while node is unexpanded
+    visits[node, action], values[node, action]: edge statistics
+    pending[node, action]: in flight selections of the edge
+
+Subclasses implement:
+    expand(states): list of leaf states -> (list of neighbor lists, (N, nactions) bool
+        array of which neighbors are solved)
+    evaluate(states): list of states -> array of N values, ideally one forward pass
+'''
+
+class BatchMCTS(object):
+    def __init__(self, root_state, nactions, coeff=1, batch_size=16, virtual_loss=1, capacity=4096):
+        '''
+        root_state: hashable state to search from
+        nactions: number of neighbors of every state
+        coeff: float, how much to weight exploration
+        batch_size: number of leaves to evaluate per search
+        virtual_loss: value penalty per pending selection of an edge
+        capacity: initial number of nodes to allocate
+        '''
+        self.root = root_state
+        self.nactions = nactions
+        self.coeff = coeff
+        self.batch_size = batch_size
+        self.virtual_loss = virtual_loss
+        self.node_idx = {}
+        self.states = []
+        self.nexpanded = 0
+        self.children = np.full((capacity, nactions), -1, dtype=np.int64)
+        self.visits = np.zeros((capacity, nactions))
+        self.values = np.zeros((capacity, nactions))
+        self.pending = np.zeros((capacity, nactions))
+        self.node(root_state)
+
+    @property
+    def nexplored(self):
+        return self.nexpanded
+
+    @property
+    def capacity(self):
+        return len(self.children)
+
+    def _grow(self):
+        cap = self.capacity
+        self.children = np.concatenate([self.children, np.full((cap, self.nactions), -1, dtype=np.int64)])
+        self.visits = np.concatenate([self.visits, np.zeros((cap, self.nactions))])
+        self.values = np.concatenate([self.values, np.zeros((cap, self.nactions))])
+        self.pending = np.concatenate([self.pending, np.zeros((cap, self.nactions))])
+
+    def node(self, state):
+        '''
+        Returns: node id of the state, allocating a new node if the state is not in the tree
+        '''
+        idx = self.node_idx.get(state)
+        if idx is None:
+            idx = len(self.states)
+            if idx == self.capacity:
+                self._grow()
+            self.node_idx[state] = idx
+            self.states.append(state)
+        return idx
+
+    def is_expanded(self, node):
+        return self.children[node, 0] >= 0
+
+    def _select(self, nodes, counts):
+        '''
+        UCB actions of the walkers on each node. Walker j on a node sees the pending visits
+        of walkers 0..j-1 on it, so the actions are the top counts[g] of the candidate
+        scores for every action a and j pending visits to a, which decrease in j. The
+        exploration total is frozen at the visits plus counts[g] - 1 new ones.
+        nodes: distinct node ids (G,)
+        counts: number of walkers on each node (G,)
+        Returns: (G, counts.max()) array, row g holds the actions of the walkers on nodes[g]
+        '''
+        m = counts.max()
+        pending = self.pending[nodes][:, :, None] + np.arange(m)
+        visits = self.visits[nodes][:, :, None] + pending
+        sqrt_n = np.sqrt(self.visits[nodes].sum(axis=1) + self.pending[nodes].sum(axis=1) + counts - 1)
+        uq = self.coeff * sqrt_n[:, None, None] / (visits + 1) + self.values[nodes][:, :, None] - self.virtual_loss * pending
+        uq = uq.reshape(len(nodes), -1)
+        # ties broken at random
+        order = np.lexsort((np.random.random(uq.shape), -uq))
+        return order[:, :m] // m
+
+    def search_leaves(self, nwalkers):
+        '''
+        Walk nwalkers paths from the root to unexpanded nodes, adding a pending visit to every
+        edge taken. The walkers move down one level at a time (see _select).
+        Returns: tuple of the leaf node ids (nwalkers,) and the node ids and actions along the
+            paths, (depth, nwalkers) arrays padded with -1
+        '''
+        curr = np.zeros(nwalkers, dtype=np.int64)
+        path_nodes = []
+        path_actions = []
+        while True:
+            walkers = np.flatnonzero(self.children[curr, 0] >= 0)
+            if len(walkers) == 0:
+                break
+
+            nodes = curr[walkers]
+            uniq, inv, counts = np.unique(nodes, return_inverse=True, return_counts=True)
+            # position of each walker among the walkers on its node
+            order = np.argsort(inv, kind='stable')
+            rank = np.empty(len(walkers), dtype=np.int64)
+            rank[order] = np.arange(len(walkers)) - np.repeat(np.cumsum(counts) - counts, counts)
+            acts = self._select(uniq, counts)[inv, rank]
+            np.add.at(self.pending, (nodes, acts), 1)
+
+            # random action if repeated state
+            nxt = self.children[nodes, acts]
+            repeat = np.zeros(len(walkers), dtype=bool)
+            for level in path_nodes:
+                repeat |= level[walkers] == nxt
+            if repeat.any():
+                np.subtract.at(self.pending, (nodes[repeat], acts[repeat]), 1)
+                acts[repeat] = np.random.randint(self.nactions, size=repeat.sum())
+                np.add.at(self.pending, (nodes[repeat], acts[repeat]), 1)
+                nxt = self.children[nodes, acts]
+
+            level_nodes = np.full(nwalkers, -1, dtype=np.int64)
+            level_actions = np.full(nwalkers, -1, dtype=np.int64)
+            level_nodes[walkers] = nodes
+            level_actions[walkers] = acts
+            path_nodes.append(level_nodes)
+            path_actions.append(level_actions)
+            curr[walkers] = nxt
+
+        shape = (len(path_nodes), nwalkers)
+        return curr, np.array(path_nodes, dtype=np.int64).reshape(shape), np.array(path_actions, dtype=np.int64).reshape(shape)
+
+    def search(self):
+        '''
+        Run batch_size simulations.
+        Returns: list of actions from the root to a solved state if one was found, otherwise None
+        '''
+        leaves, path_nodes, path_actions = self.search_leaves(self.batch_size)
+        uniq, inv = np.unique(leaves, return_inverse=True)
+        leaf_states = [self.states[leaf] for leaf in uniq]
+        nbrs, solved = self.expand(leaf_states)
+        leaf_vals = np.asarray(self.evaluate(leaf_states), dtype=np.float64).reshape(len(uniq))
+
+        for leaf, leaf_nbrs in zip(uniq, nbrs):
+            nbr_nodes = [self.node(s) for s in leaf_nbrs]
+            self.children[leaf] = nbr_nodes
+        self.nexpanded += len(uniq)
+
+        valid = path_nodes >= 0
+        edges = (path_nodes[valid], path_actions[valid])
+        np.subtract.at(self.pending, edges, 1)
+        self.backup_leaf(edges, np.broadcast_to(leaf_vals[inv], path_nodes.shape)[valid])
+
+        solved = np.asarray(solved, dtype=bool)
+        solved_walkers = np.flatnonzero(solved[inv].any(axis=1))
+        if len(solved_walkers):
+            w = solved_walkers[0]
+            actions = path_actions[valid[:, w], w].tolist()
+            return actions + [int(np.random.choice(np.flatnonzero(solved[inv[w]])))]
+        return None
+
+    def backup_leaf(self, edges, values):
+        '''
+        edges: tuple of node id and action arrays of the edges on the paths to the leaves
+        values: array of the leaf value for each edge
+        '''
+        np.maximum.at(self.values, edges, values)
+        np.add.at(self.visits, edges, 1)
+
+def batch_solve(tree, time_limit=None, max_steps=None):
+    '''
+    Search with the tree until a solution is found or the limits are hit.
+    tree: BatchMCTS
+    time_limit: int seconds allowed to run
+    max_steps: int number of simulations allowed
+    Returns: tuple of the list of solution actions (None if not solved) and the tree
+    '''
+    nsteps = 0
+    start = time.time()
+    while True:
+        sol_path = tree.search()
+        if sol_path:
+            return sol_path, tree
+        nsteps += tree.batch_size
+
+        if max_steps and nsteps > max_steps:
+            break
+
+        if time_limit and (time.time() - start) > time_limit:
+            break
+
+    return None, tree
@@ -0,0 +1,171 @@
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+
+'''
+Checkpoints for the long running transform jobs.
+
+A job is split into chunks (a rank's rows, a list of split files, a DataFrame chunk, ...).
+Each chunk has its own Checkpoint file holding the partial result (ex: the accumulated
+fourier matrix) and the offset of the next row to process. Files are written to a temp
+file and renamed, so a job killed mid write leaves the previous checkpoint intact.
+On restart, finished chunks are loaded instead of recomputed and unfinished chunks resume
+from their offset. JobCheckpoints groups the chunk checkpoints of one job in a directory.
+'''
+
+def atomic_save(fname, **arrays):
+    '''
+    Save the arrays to the npz file fname, replacing it atomically.
+    '''
+    dirname = os.path.dirname(os.path.abspath(fname))
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, fname)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+class Checkpoint:
+    def __init__(self, fname, key='', every_rows=None, every_secs=None):
+        '''
+        fname: npz file name of the checkpoint
+        key: string identifying the work of this chunk (ex: its row range). A checkpoint
+            saved with a different key is ignored.
+        every_rows: save at most every this many rows (see maybe_save)
+        every_secs: save at most every this many seconds (see maybe_save)
+        '''
+        self.fname = fname
+        self.key = str(key)
+        self.every_rows = every_rows
+        self.every_secs = every_secs
+        self._last_offset = None
+        self._last_time = time.time()
+
+    def load(self):
+        '''
+        Returns: tuple of (offset, done, partial result) or None if there is no usable checkpoint
+        '''
+        if not os.path.exists(self.fname):
+            return None
+        with np.load(self.fname) as data:
+            if str(data['key']) != self.key:
+                return None
+            offset, done, res = int(data['offset']), bool(data['done']), data['res']
+        self._last_offset = offset
+        return offset, done, res
+
+    def resume(self, start, res):
+        '''
+        Restore the partial result of this chunk into res, if there is one.
+        start: first row of the chunk
+        res: numpy array to restore the partial result into
+        Returns: the row to resume from
+        '''
+        state = self.load()
+        if state is None:
+            self._last_offset = start
+            return start
+        res[...] = state[2]
+        return state[0]
+
+    def save(self, offset, res, done=False):
+        '''
+        offset: index of the next row to process
+        res: numpy array, the partial result of the rows before offset
+        done: True if the chunk is finished
+        '''
+        atomic_save(self.fname, key=np.array(self.key), offset=np.array(offset),
+                    done=np.array(done), res=res)
+        self._last_offset = offset
+        self._last_time = time.time()
+
+    def maybe_save(self, offset, res):
+        '''
+        Save if at least every_rows rows or every_secs seconds have passed since the last save.
+        Returns: True if a checkpoint was written
+        '''
+        if self._last_offset is None:
+            self._last_offset = offset
+        if (self.every_rows is not None and offset - self._last_offset >= self.every_rows) or \
+           (self.every_secs is not None and time.time() - self._last_time >= self.every_secs):
+            self.save(offset, res)
+            return True
+        return False
+
+    def remove(self):
+        if os.path.exists(self.fname):
+            os.remove(self.fname)
+
+def checkpointed_call(ckpt, func, *args):
+    '''
+    Compute func(*args) for one chunk unless ckpt already holds its finished result.
+    ckpt: Checkpoint or None
+    Returns: the result of func(*args)
+    '''
+    if ckpt is None:
+        return func(*args)
+    state = ckpt.load()
+    if state is not None and state[1]:
+        return state[2]
+    res = func(*args)
+    ckpt.save(0, res, done=True)
+    return res
+
+class JobCheckpoints:
+    '''
+    Directory holding the chunk checkpoints of one job.
+    '''
+    def __init__(self, dirname, every_rows=None, every_secs=None):
+        self.dirname = dirname
+        self.every_rows = every_rows
+        self.every_secs = every_secs
+        os.makedirs(dirname, exist_ok=True)
+
+    def chunk(self, name, key=''):
+        '''
+        name: name of the chunk, unique within the job
+        key: see Checkpoint
+        Returns: Checkpoint for the chunk
+        '''
+        return Checkpoint(os.path.join(self.dirname, '{}.npz'.format(name)), key,
+                          self.every_rows, self.every_secs)
+
+    def rank_chunk(self, rank, start, end):
+        '''
+        Returns: Checkpoint for the rows [start, end) owned by the given rank
+        '''
+        return self.chunk('rank_{}'.format(rank), key='{}-{}'.format(start, end))
+
+    def load_bounds(self, bounds):
+        '''
+        Row partitions can depend on timings (see mpi_utils.measure_rank_weights), so the
+        first run saves its partition and restarts with the same number of pieces reuse it.
+        bounds: piece boundaries computed by this run
+        Returns: the saved boundaries if they exist and have the same length, otherwise bounds
+        '''
+        fname = os.path.join(self.dirname, 'bounds.npz')
+        if os.path.exists(fname):
+            with np.load(fname) as data:
+                saved = data['bounds']
+            if len(saved) == len(bounds) and saved[-1] == bounds[-1]:
+                return saved
+        atomic_save(fname, bounds=np.asarray(bounds))
+        return bounds
+
+    def cleanup(self):
+        shutil.rmtree(self.dirname, ignore_errors=True)
+
+def ckpt_dir(savename):
+    '''
+    savename: file name of the final result of a job
+    Returns: directory name for the job's checkpoints
+    '''
+    root, ext = os.path.splitext(savename)
+    return (root if ext == '.npy' else savename) + '_ckpt'
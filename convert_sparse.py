@@ -6,52 +6,21 @@ import pickle
 import argparse
 from tqdm import tqdm
 import numpy as np
-from wreath import get_mat
+from wreath import get_mat, InducedRepTable
 from utils import load_irrep, check_memory
-from scipy.sparse import csr_matrix
 
 def convert(alpha, parts, prefix='/local/hopan/cube/', irrep_dict=None):
     if irrep_dict is None: 
         irrep_dict = load_irrep(prefix, alpha, parts)
+    table = InducedRepTable.from_block_dict(irrep_dict)
     sp_dict = {}
-
-    keys = list(irrep_dict.keys())
-    for k in keys:
-        matdict = irrep_dict[k]
-        sp_dict[k] = convert_mat_dict(matdict, alpha, parts)
+    for k in irrep_dict.keys():
+        sp_mat = table[k].to_csr()
+        sp_mat.eliminate_zeros()
+        sp_dict[k] = sp_mat
 
     return sp_dict
 
-def convert_row_idx(rowidxs, i, j, block_size):
-    '''
-    Convert the row indices to match 
-    '''
-    return i * block_size  + rowidxs
-
-def convert_col_idx(colidxs, i, j, block_size):
-    return j * block_size  + colidxs 
-    
-def convert_mat_dict(matdict, alpha, parts):
-    # need block size, number of blocks (num cosets)
-    rows = []
-    cols = []
-    vals = []
-    num_blocks = len(matdict) # (i, j) -> block
-    block_size = 0
-
-    for (i, j), mat in matdict.items():
-        block_size = mat.shape[0]
-        nzrows, nzcols = mat.nonzero()
-        nzvals = [mat[tup] for tup in zip(nzrows, nzcols)]
-        glob_rows = convert_row_idx(nzrows, i, j, block_size)
-        glob_cols = convert_col_idx(nzcols, i, j, block_size)
-
-        vals.extend(nzvals) 
-        rows.extend(glob_rows)
-        cols.extend(glob_cols)
-        # convert these to global indices
-    return csr_matrix((vals, (rows, cols)), shape=(num_blocks * block_size, num_blocks * block_size))
-
 def save_sp_pkl(sp_dict, savedir_top, alpha, parts):
     savedir = os.path.join(savedir_top, 'pickles_sparse', str(alpha))
     savename = os.path.join(savedir, str(parts) + '.pkl')
@@ -1,5 +1,7 @@
 import pdb
+import math
 import itertools
+import numpy as np
 import perm2
 from itertools import combinations
 
@@ -71,10 +73,13 @@ def right_coset(g, H):
 # TODO: This is almost certainly not the most efficient way of getting the coset reps
 def coset_reps(G, H):
     '''
-    G: list of Perm2 objects
-    H: list of Perm2 objects
-    Returns a list of Perm2 objects
+    G: list of Perm2 objects or a PermArray
+    H: list of Perm2 objects or a PermArray
+    Returns a list of Perm2 objects (a PermArray if G is a PermArray)
     '''
+    if isinstance(G, perm2.PermArray):
+        return coset_reps_arr(G, H)
+
     reps = []
     to_visit = {g.tup_rep for g in G}
     g_map = {g.tup_rep: g for g in G}
@@ -99,6 +104,200 @@ def coset_reps(G, H):
 
     return reps
 
+def coset_reps_arr(G, H):
+    '''
+    Vectorized coset_reps. Picks the lowest rank element of each left coset gH.
+    When G is all of S_n in rank order (as perm2.sn returns it), this gives the same
+    reps in the same order as coset_reps.
+    G: PermArray
+    H: PermArray or list of Perm2 objects
+    Returns a PermArray
+    '''
+    if not isinstance(H, perm2.PermArray):
+        H = perm2.PermArray.from_perms(H)
+
+    ranks = G.rank()
+    order = np.argsort(ranks)
+    sorted_ranks = ranks[order]
+    visited = np.zeros(len(G), dtype=bool)
+    rep_idx = []
+    idx = 0
+    while len(rep_idx) < len(G) // len(H):
+        idx += np.argmin(visited[idx:])
+        g = G.perms[order[idx]]
+        coset_ranks = (perm2.PermArray(g) * H).rank()
+        visited[np.searchsorted(sorted_ranks, coset_ranks)] = True
+        rep_idx.append(order[idx])
+
+    return G[np.array(rep_idx)]
+
+def young_coset_reps(alpha):
+    '''
+    Enumerate the left coset reps of the Young subgroup S_alpha in S_n directly.
+    A coset gS_alpha is determined by the ordered set partition of {1, ..., n} into the
+    sets of values g sends each block of positions to. The rep is that set partition
+    written out with each block sorted (the lowest rank element of the coset), and the
+    reps come out in increasing rank order, the same order coset_reps gives.
+    alpha: weak partition of n
+    Returns: generator of Perm2 objects
+    '''
+    n = sum(alpha)
+    def _reps(remaining, idx):
+        if idx == len(alpha):
+            yield ()
+            return
+        for block in itertools.combinations(remaining, alpha[idx]):
+            rest = [v for v in remaining if v not in block]
+            for tail in _reps(rest, idx + 1):
+                yield block + tail
+
+    for tup in _reps(list(range(1, n + 1)), 0):
+        yield perm2.Perm2.from_tup(tup)
+
+def young_coset_reps_arr(alpha):
+    '''
+    young_coset_reps as a PermArray
+    '''
+    return perm2.PermArray.from_perms(list(young_coset_reps(alpha)))
+
+def young_coset_count(alpha):
+    cnt = math.factorial(sum(alpha))
+    for a in alpha:
+        cnt //= math.factorial(a)
+    return cnt
+
+def coset_index(g, alpha):
+    '''
+    Index of the coset gS_alpha in the order of young_coset_reps. O(n) for a fixed
+    number of blocks.
+    g: Perm2 or tuple
+    alpha: weak partition of n
+    Returns: int
+    '''
+    tup = g.tup_rep if hasattr(g, 'tup_rep') else g
+    n = len(tup)
+    # labels[v - 1] = the block of positions that g sends to value v
+    labels = [0] * n
+    idx = 0
+    for b, a in enumerate(alpha):
+        for pos in range(idx, idx + a):
+            labels[tup[pos] - 1] = b
+        idx += a
+
+    rank = 0
+    left = n
+    for b, a in enumerate(alpha):
+        # lex rank of block b's values among the a-subsets of the values not used by earlier blocks
+        need = a
+        avail = left
+        block_rank = 0
+        for lab in labels:
+            if need == 0:
+                break
+            if lab < b:
+                continue
+            avail -= 1
+            if lab == b:
+                need -= 1
+            else:
+                block_rank += math.comb(avail, need - 1)
+        rank = rank * math.comb(left, a) + block_rank
+        left -= a
+
+    return rank
+
+def coset_unrank(rank, alpha):
+    '''
+    Inverse of coset_index.
+    rank: int
+    alpha: weak partition of n
+    Returns: tuple, the coset rep
+    '''
+    n = sum(alpha)
+    radices = []
+    left = n
+    for a in alpha:
+        radices.append(math.comb(left, a))
+        left -= a
+
+    block_ranks = []
+    for radix in reversed(radices):
+        block_ranks.append(rank % radix)
+        rank //= radix
+    block_ranks.reverse()
+
+    remaining = list(range(1, n + 1))
+    tup = []
+    for a, block_rank in zip(alpha, block_ranks):
+        block = []
+        avail = len(remaining)
+        for v in remaining:
+            if len(block) == a:
+                break
+            avail -= 1
+            # combinations that take v here
+            cnt = math.comb(avail, a - len(block) - 1)
+            if block_rank < cnt:
+                block.append(v)
+            else:
+                block_rank -= cnt
+        remaining = [v for v in remaining if v not in block]
+        tup.extend(block)
+
+    return tuple(tup)
+
+def young_canonical(perms, alpha):
+    '''
+    Canonical element of each left coset gS_alpha: the values of g sorted within each
+    block of positions given by alpha. This is also the lowest rank element of the coset,
+    so it agrees with the reps that coset_reps_arr picks.
+    perms: numpy array of shape (k, n)
+    alpha: weak partition of n
+    Returns: numpy array of shape (k, n)
+    '''
+    out = np.array(perms, copy=True)
+    idx = 0
+    for a in alpha:
+        out[:, idx: idx + a] = np.sort(out[:, idx: idx + a], axis=1)
+        idx += a
+    return out
+
+def coset_action_table(alpha, reps=None):
+    '''
+    Table of the action of S_n on the left cosets of the Young subgroup H = S_alpha.
+    For every g (in perm_rank order) and coset rep t_j, g t_j = t_i h for a unique i and h in H.
+    alpha: weak partition of n
+    reps: (optional) PermArray or list of Perm2 coset reps. Defaults to young_coset_reps_arr(alpha).
+    Returns: tuple of
+        action: numpy int32 array of shape (n!, m), action[g, j] = i
+        residual: numpy int32 array of shape (n!, m), index of h in young_subgroup_perm(alpha)
+    '''
+    n = sum(alpha)
+    G = perm2.PermArray.sn(n)
+    H = perm2.PermArray.from_perms(young_subgroup_perm(alpha))
+    if reps is None:
+        reps = young_coset_reps_arr(alpha)
+    elif not isinstance(reps, perm2.PermArray):
+        reps = perm2.PermArray.from_perms(reps)
+
+    rep_ranks = perm2.perm_rank(young_canonical(reps.perms, alpha))
+    rep_order = np.argsort(rep_ranks)
+    reps_inv = reps.inv()
+    h_index = np.full(math.factorial(n), -1, dtype=np.int32)
+    h_index[H.rank()] = np.arange(len(H))
+
+    m = len(reps)
+    action = np.zeros((len(G), m), dtype=np.int32)
+    residual = np.zeros((len(G), m), dtype=np.int32)
+    for j in range(m):
+        g_tj = G * reps[j: j + 1]
+        canon_ranks = perm2.perm_rank(young_canonical(g_tj.perms, alpha))
+        i = rep_order[np.searchsorted(rep_ranks, canon_ranks, sorter=rep_order)]
+        action[:, j] = i
+        residual[:, j] = h_index[(reps_inv[i] * g_tj).rank()]
+
+    return action, residual
+
 def cos_reps_alpha2(lst, s1, s2):
     reps = []
     pstart = perm2.Perm2.from_cycle_decomp([tuple(range(1, s1+1)), tuple(range(s1+1, s1+s2+1))])
@@ -8,6 +8,8 @@ from str_cube import *
 from collections import deque
 from itertools import permutations
 import argparse
+sys.path.append('../')
+from rank_bfs import WreathPuzzle, bfs_to_file
 
 if len(sys.argv) > 1:
     if len(sys.argv) > 2:
@@ -78,6 +80,18 @@ def dist_bfs(test=False):
 
     return dist_dict
 
+def rank_bfs(save_path):
+    '''
+    BFS over all 2x2 cube states from the solved state with the fixed core moves, tracking
+    states by their wreath rank (see cube_table.state_index) instead of their strings.
+    save_path: .npy file to write the uint8 distance of every state rank to. This is the
+        layout of CubeTable.dense_dists, unreachable ranks get 255.
+    Returns: memmapped distance array
+    '''
+    puzzle = WreathPuzzle(8, 3, cube_wreath_moves())
+    otups, ptups = wreath_batch(str_to_arr([init_2cube()]))
+    return bfs_to_file(puzzle, puzzle.rank(otups, ptups), save_path)
+
 def valid_cube_perm(perm):
     '''
     Check if the given permutation (list of ints) is a valid cube permutation
@@ -171,8 +185,14 @@ if __name__ == '__main__':
     parser.add_argument('--pklpath', type=str, default='')
     parser.add_argument('--test', action='store_true')
     parser.add_argument('--wreathpath', type=str, default='')
+    parser.add_argument('--rankpath', type=str, default='', help='run the rank bfs and save the dists here')
     args = parser.parse_args()
 
+    if args.rankpath:
+        dists = rank_bfs(args.rankpath)
+        print('Reachable states: {}'.format((dists != 255).sum()))
+        sys.exit(0)
+
     print('Starting bfs')
     dist_dict = dist_bfs(args.test)
     print('Done with bfs')
@@ -3,6 +3,7 @@ import time
 import random
 from cube import Cube
 from itertools import permutations
+import numpy as np
 
 import pdb
 '''
@@ -757,6 +758,120 @@ def get_wreath(cube_str):
 def is_solved(cube_state):
     return cube_state in SOLVED_STATES
 
+# Integer array representation of the cube: a uint8 array of 24 color indices
+# (indices into COLORS) in the same facelet order as the string representation.
+# Every move is a fixed permutation of the facelets, so moves are fancy indexing
+# with the tables below and whole batches of states can be moved at once.
+COLOR_INDEX = {c: idx for idx, c in enumerate(COLORS)}
+_COLOR_LUT = np.full(256, 255, dtype=np.uint8)
+for _c, _idx in COLOR_INDEX.items():
+    _COLOR_LUT[ord(_c)] = _idx
+_COLOR_BYTES = np.frombuffer(''.join(COLORS).encode(), dtype=np.uint8)
+
+def str_to_arr(cube_strs):
+    '''
+    cube_strs: cube string or list of cube strings
+    Returns: numpy uint8 array of shape (24,) or (len(cube_strs), 24)
+    '''
+    if isinstance(cube_strs, str):
+        return _COLOR_LUT[np.frombuffer(cube_strs.encode(), dtype=np.uint8)]
+    return _COLOR_LUT[np.frombuffer(''.join(cube_strs).encode(), dtype=np.uint8)].reshape(-1, 24)
+
+def arr_to_str(states):
+    '''
+    Inverse of str_to_arr.
+    states: numpy array of shape (24,) or (N, 24)
+    Returns: cube string or list of cube strings
+    '''
+    states = np.asarray(states)
+    chars = _COLOR_BYTES[states].tobytes().decode()
+    if states.ndim == 1:
+        return chars
+    return [chars[i: i + 24] for i in range(0, len(chars), 24)]
+
+def _move_table(move):
+    # apply the string move to a cube whose facelets are all distinct to read off
+    # where each facelet comes from
+    probe = ''.join(chr(ord('a') + i) for i in range(24))
+    moved = eval('rot_{}'.format(move))(probe)
+    return np.array([ord(c) - ord('a') for c in moved], dtype=np.intp)
+
+ALL_MOVES = ['u', 'iu', 'd', 'id', 'd2', 'id2', 'l', 'il', 'l2', 'il2', 'r', 'ir',
+             'f', 'if', 'b', 'ib', 'b2', 'ib2']
+# MOVE_TABLES[m][i] is the facelet that ends up in position i after move m
+MOVE_TABLES = {m: _move_table(m) for m in ALL_MOVES}
+# rows in the order of neighbors_fixed_core
+FIXEDCORE_TABLE = np.stack([MOVE_TABLES[m] for m in FIXEDCORE_FACES])
+NORM_TABLE = np.stack([MOVE_TABLES[m] for m in NORM_MOVES])
+CUBE2_START_ARR = str_to_arr(CUBE2_START)
+
+def rotate_arr(states, move):
+    '''
+    states: numpy array of shape (..., 24)
+    move: name of the move, an element of ALL_MOVES
+    Returns: numpy array of the same shape of the moved states
+    '''
+    return states[..., MOVE_TABLES[move]]
+
+def neighbors_batch(states, table=FIXEDCORE_TABLE):
+    '''
+    Neighbors of a batch of states in one fancy indexing call.
+    states: numpy array of shape (N, 24)
+    table: (k, 24) array of move tables. Defaults to the moves of neighbors_fixed_core
+    Returns: numpy array of shape (N, k, 24) where [i, j] is the j-th neighbor of states[i]
+    '''
+    return states[:, table]
+
+def is_solved_arr(states):
+    '''
+    states: numpy array of shape (N, 24)
+    Returns: boolean array of length N
+    '''
+    return np.all(states == CUBE2_START_ARR, axis=-1)
+
+# facelet indices of each cubie, in the order used by get_cubie
+CUBIE_FACELETS = np.array([
+    [FACE_START_IDX[f] + i for f, i in facelets] for facelets in [
+        [('u', 3), ('r', 0), ('f', 1)],
+        [('d', 1), ('f', 3), ('r', 2)],
+        [('d', 0), ('l', 3), ('f', 2)],
+        [('u', 2), ('f', 0), ('l', 1)],
+        [('u', 0), ('l', 0), ('b', 1)],
+        [('d', 2), ('b', 3), ('l', 2)],
+        [('d', 3), ('r', 3), ('b', 2)],
+        [('u', 1), ('b', 0), ('r', 1)],
+    ]
+], dtype=np.intp)
+# cubie index of each color triple (base 6 code), 255 for triples that are not cubies
+_CUBIE_LUT = np.full(6 ** 3, 255, dtype=np.uint8)
+for _cstr, _idx in CMAP.items():
+    _CUBIE_LUT[sum(COLOR_INDEX[c] * 6 ** (2 - k) for k, c in enumerate(_cstr))] = _idx
+
+def wreath_batch(states):
+    '''
+    Vectorized get_wreath.
+    states: numpy array of shape (N, 24)
+    Returns: tuple of numpy uint8 arrays otups (N, 8), ptups (N, 8) (1-indexed as in get_s8_tup)
+    '''
+    states = np.asarray(states)
+    cubies = states[:, CUBIE_FACELETS].astype(np.intp)  # (N, 8, 3)
+    ud = (cubies == COLOR_INDEX['G']) | (cubies == COLOR_INDEX['B'])
+    otups = np.argmax(ud, axis=-1).astype(np.uint8)
+    cubie_idx = _CUBIE_LUT[cubies[..., 0] * 36 + cubies[..., 1] * 6 + cubies[..., 2]]
+    ptups = np.zeros(otups.shape, dtype=np.uint8)
+    rows = np.arange(len(states))[:, None]
+    ptups[rows, cubie_idx] = np.arange(1, 9, dtype=np.uint8)
+    return otups, ptups
+
+def cube_wreath_moves(moves=FIXEDCORE_FACES):
+    '''
+    The moves as elements of Z_3 wr S_8, read off from the moved solved cube.
+    moves: list of move names, elements of ALL_MOVES
+    Returns: list of (ptup, otup) tuples, in the format of rank_bfs.WreathPuzzle
+    '''
+    otups, ptups = wreath_batch(CUBE2_START_ARR[np.stack([MOVE_TABLES[m] for m in moves])])
+    return [(tuple(p), tuple(o)) for o, p in zip(otups.tolist(), ptups.tolist())]
+
 if __name__ == '__main__':
     c = init_2cube()
     fc = rotate(c, 'f')
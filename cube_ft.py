@@ -5,17 +5,22 @@ import os
 import time
 import numpy as np
 import pandas as pd
-from mpi4py import MPI
 import argparse
 
 from multiprocessing import Pool
 from tqdm import tqdm
-from utils import load_pkl, load_irrep, check_memory, chunk
+from utils import load_pkl, load_irrep, check_memory, chunk, cube2_irreps
 from wreath import cyclic_irreps, block_cyclic_irreps, wreath_rep
 from young_tableau import wreath_dim
 from perm2 import sn
-from coset_utils import young_subgroup_perm, coset_reps
-from multi import mult_yor_block, coset_size, convert_yor_matrix, clean_line
+from coset_utils import young_subgroup_perm, coset_reps, young_coset_reps
+from multi import BlockAccumulator, coset_size, clean_line, grouped_transform, multi_irrep_transform
+from cube_table import load_table
+from mpi_utils import get_comm, reduce_sum, partition_rows, measure_rank_weights
+from checkpoint import JobCheckpoints, ckpt_dir
+
+PROBE_ROWS = 2000
+CKPT_CHUNK_ROWS = 2**16
 
 def load_np_data():
     fname = '/local/hopan/cube/cube_sym_mod_tup.npy'
@@ -30,8 +35,20 @@ def load_csv():
     f = open('/local/hopan/cube/cube_sym_mod_tup.txt')
     return [clean_line(l) for l in f.readlines()] 
 
-def par_cube_ft(rank, size, alpha, parts):
+def par_cube_ft(rank, size, alpha, parts, comm=None, weighted=False, ckpt=None):
+    '''
+    Fourier transform at the irrep (alpha, parts) of this rank's piece of the cube distance table.
+    comm: communicator, only needed if weighted is True
+    weighted: see table_cube_ft
+    ckpt: (optional) JobCheckpoints. The partial sum of this rank is checkpointed in it
+        and a restarted job resumes from the last checkpoint.
+    Returns: numpy matrix, the sum over this rank's rows
+    '''
     start = time.time()
+    table = load_table('/scratch/hopan/cube/')
+    if table is not None:
+        return table_cube_ft(table, rank, size, alpha, parts, comm, weighted, ckpt)
+
     try:
         df = load_df('/scratch/hopan/cube/')
         irrep_dict = load_irrep('/scratch/hopan/cube/', alpha, parts)
@@ -40,17 +57,20 @@ def par_cube_ft(rank, size, alpha, parts):
 
     print('Rank {:3d} / {} | load irrep: {:.2f}s | mem: {}mb'.format(rank, size, time.time() - start, check_memory(verbose=False)))
 
-    cos_reps = coset_reps(sn(8), young_subgroup_perm(alpha))
-    save_dict = {}
+    cos_reps = list(young_coset_reps(alpha))
+    acc = BlockAccumulator(wreath_dim(parts), coset_size(alpha))
     cyc_irrep_func = cyclic_irreps(alpha)
 
-    chunk_size = len(df) // size
-    start_idx  = chunk_size * rank
-    #print('Rank {} | {:7d}-{:7d}'.format(rank, start_idx, start_idx + chunk_size))
+    bounds = partition_rows(len(df), size)
+    start_idx, end_idx = bounds[rank], bounds[rank + 1]
+    rank_ckpt = None if ckpt is None else ckpt.rank_chunk(rank, start_idx, end_idx)
+    if rank_ckpt is not None:
+        start_idx = rank_ckpt.resume(start_idx, acc.mat)
+    #print('Rank {} | {:7d}-{:7d}'.format(rank, start_idx, end_idx))
     if rank == 0:
         print('Rank {} | elapsed: {:.2f}s | {:.2f}mb | done load'.format(rank, time.time() - start, check_memory(verbose=False)))
 
-    for idx in range(start_idx, start_idx + chunk_size):
+    for idx in range(start_idx, end_idx):
         row = df.loc[idx]
         otup = tuple(int(i) for i in row[0])
         perm_tup = tuple(int(i) for i in row[1])
@@ -58,52 +78,171 @@ def par_cube_ft(rank, size, alpha, parts):
  
         perm_rep = irrep_dict[perm_tup]  # perm_rep is a dict of (i, j) -> matrix
         block_cyclic_rep = block_cyclic_irreps(otup, cos_reps, cyc_irrep_func)
-        mult_yor_block(perm_rep, dist, block_cyclic_rep, save_dict)
+        acc.add(perm_rep, dist, block_cyclic_rep)
+        if rank_ckpt is not None:
+            rank_ckpt.maybe_save(idx + 1, acc.mat)
 
+    if rank_ckpt is not None:
+        rank_ckpt.save(end_idx, acc.mat, done=True)
     if rank == 0:
         print('Rank {} | elapsed: {:.2f}s | {:.2f}mb | done add'.format(rank, time.time() - start, check_memory(verbose=False)))
 
     del irrep_dict
-    block_size = wreath_dim(parts)
-    n_cosets = coset_size(alpha)
-    mat = convert_yor_matrix(save_dict, block_size, n_cosets)
+    mat = acc.to_matrix()
     if rank == 0:
         print('Rank {} | elapsed: {:.2f}s | {:.2f}mb | done matrix conversion'.format(rank, time.time() - start, check_memory(verbose=False)))
 
     return mat 
 
-def mpi_main(alpha, parts):
+def _add_rows(acc, irrep_dict, cos_reps, cyc_irrep_func, otups, ptups, dists):
+    for otup, perm_tup, dist in zip(map(tuple, otups.tolist()), map(tuple, ptups.tolist()), dists.tolist()):
+        perm_rep = irrep_dict[perm_tup]
+        block_cyclic_rep = block_cyclic_irreps(otup, cos_reps, cyc_irrep_func)
+        acc.add(perm_rep, dist, block_cyclic_rep)
+
+def table_cube_ft(table, rank, size, alpha, parts, comm=None, weighted=False, ckpt=None):
+    '''
+    par_cube_ft reading this rank's rows from a CubeTable (see cube_table.py)
+    instead of a DataFrame.
+    comm: communicator, only needed if weighted is True
+    weighted: if True, every rank times the same PROBE_ROWS rows and the table
+        is split in proportion to the measured speeds (useful on mixed nodes)
+    ckpt: (optional) JobCheckpoints, see par_cube_ft
+    '''
+    start = time.time()
+    irrep_dict = load_irrep('/scratch/hopan/cube/', alpha, parts)
+    cos_reps = list(young_coset_reps(alpha))
+    acc = BlockAccumulator(wreath_dim(parts), coset_size(alpha))
+    cyc_irrep_func = cyclic_irreps(alpha)
+
+    rank_weights = None
+    if weighted:
+        probe = table.rows(0, min(PROBE_ROWS, len(table)))
+        probe_acc = BlockAccumulator(wreath_dim(parts), coset_size(alpha))
+        rank_weights = measure_rank_weights(comm, lambda: _add_rows(probe_acc, irrep_dict, cos_reps, cyc_irrep_func, *probe))
+        del probe_acc
+    bounds = partition_rows(len(table), size, rank_weights)
+    if ckpt is not None:
+        # a restart must cover the same rows even if the measured speeds changed
+        bounds = ckpt.load_bounds(bounds)
+
+    start_idx, end_idx = bounds[rank], bounds[rank + 1]
+    rank_ckpt = None if ckpt is None else ckpt.rank_chunk(rank, start_idx, end_idx)
+    if rank_ckpt is not None:
+        start_idx = rank_ckpt.resume(start_idx, acc.mat)
+
+    for st in range(start_idx, end_idx, CKPT_CHUNK_ROWS):
+        en = min(st + CKPT_CHUNK_ROWS, end_idx)
+        _add_rows(acc, irrep_dict, cos_reps, cyc_irrep_func, *table.rows(st, en))
+        if rank_ckpt is not None:
+            rank_ckpt.maybe_save(en, acc.mat)
+    if rank_ckpt is not None:
+        rank_ckpt.save(end_idx, acc.mat, done=True)
+
+    if rank == 0:
+        print('Rank {} | elapsed: {:.2f}s | {:.2f}mb | done add'.format(rank, time.time() - start, check_memory(verbose=False)))
+
+    del irrep_dict
+    return acc.to_matrix()
+
+def load_arrays(prefix='/local/hopan/cube/'):
+    '''
+    Load the cube distance table as numpy arrays.
+    Returns: tuple of otups (N, 8) uint8, ptups (N, 8) uint8, dists (N,) arrays
+    '''
+    table = load_table(prefix)
+    if table is not None:
+        return table.rows(0, len(table))
+
+    df = load_df(prefix)
+    otups = np.frombuffer(''.join(df[0]).encode(), dtype=np.uint8).reshape(-1, 8) - ord('0')
+    ptups = np.frombuffer(''.join(df[1]).encode(), dtype=np.uint8).reshape(-1, 8) - ord('0')
+    return otups, ptups, df[2].values
+
+def grouped_main(alpha, parts, prefix='/scratch/hopan/cube/'):
+    '''
+    Single node cube transform. The orientation irreps are summed per permutation
+    before doing any block matrix work (see multi.grouped_transform).
+    '''
+    savedir = os.path.join(prefix, 'fourier', str(alpha))
+    savename = os.path.join(savedir, str(parts))
+    if os.path.exists(savename + '.npy'):
+        print('File {} exists! Skipping'.format(savename))
+        return
+
+    start = time.time()
+    otups, ptups, dists = load_arrays(prefix)
+    irrep_dict = load_irrep(prefix, alpha, parts)
+    print('Done load: {:.2f}s | mem: {:.2f}mb'.format(time.time() - start, check_memory(verbose=False)))
+    res_mat = grouped_transform(otups, ptups, dists, irrep_dict, alpha, parts)
+    print('Done transform: {:.2f}s | mem: {:.2f}mb'.format(time.time() - start, check_memory(verbose=False)))
+
+    if not os.path.exists(savedir):
+        os.makedirs(savedir)
+    np.save(savename, res_mat)
+    print('Done saving in {}! | Total time: {:.2f}s'.format(savename, time.time() - start))
+
+def all_irreps_main(prefix='/scratch/hopan/cube/', max_mb=4096):
+    '''
+    Single node transform of every cube irrep that has not been saved yet. The table
+    is streamed once per pass of multi.plan_passes instead of once per irrep.
+    '''
+    table = load_table(prefix)
+    def chunk_func():
+        if table is not None:
+            for _, otups, ptups, dists in table.iter_chunks():
+                yield otups, ptups, dists
+        else:
+            yield load_arrays(prefix)
+
+    def save_func(alpha, parts, mat):
+        savedir = os.path.join(prefix, 'fourier', str(alpha))
+        if not os.path.exists(savedir):
+            os.makedirs(savedir)
+        np.save(os.path.join(savedir, str(parts)), mat)
+        print('Saved {} | {}'.format(alpha, parts))
+
+    irreps = [(alpha, parts) for alpha, parts in cube2_irreps()
+              if not os.path.exists(os.path.join(prefix, 'fourier', str(alpha), '{}.npy'.format(parts)))]
+    load_func = lambda alpha, parts: load_irrep(prefix, alpha, parts)
+    multi_irrep_transform(chunk_func, irreps, load_func, save_func, max_mb=max_mb)
+
+def mpi_main(alpha, parts, reduce_method='reduce', weighted=False, ckpt_rows=None, ckpt_mins=None):
+    '''
+    Compute the fourier transform at the irrep (alpha, parts) split over all MPI ranks.
+    reduce_method: how the per rank matrices are summed, see mpi_utils.reduce_sum
+    weighted: split the rows by measured rank speed instead of evenly
+    ckpt_rows: checkpoint each rank's partial sum every this many rows
+    ckpt_mins: checkpoint each rank's partial sum every this many minutes
+    '''
     savename = '/scratch/hopan/cube/fourier/{}/{}.npy'.format(alpha, parts)
     if os.path.exists(savename):
         print('File {} exists! Skipping'.format(savename))
         exit()
         #print('File {} exists! Running anyway!'.format(savename))
 
-    comm = MPI.COMM_WORLD
-    size = MPI.COMM_WORLD.Get_size()
-    rank = MPI.COMM_WORLD.Get_rank()
-    name = MPI.Get_processor_name()
+    comm = get_comm()
+    size = comm.Get_size()
+    rank = comm.Get_rank()
     if rank == 0:
         print('starting {} | {}'.format(alpha, parts))
 
+    ckpt = None
+    if ckpt_rows or ckpt_mins:
+        ckpt = JobCheckpoints(ckpt_dir(savename), ckpt_rows, ckpt_mins * 60 if ckpt_mins else None)
+
     _start = time.time()
     start = time.time()
     # mat = par_cube_ft(alpha, parts, irrep_dict, lst)
-    mat = par_cube_ft(rank, size, alpha, parts)
-    #all_mats = comm.gather(mat, root=0)
+    mat = par_cube_ft(rank, size, alpha, parts, comm, weighted, ckpt)
     if rank == 0:
         print('post par cube ft: {:.2f}s | mem: {:.2f}mb'.format(time.time() - start, check_memory(verbose=False)))
 
-    sendmat = mat
-    recvmat = None
-    if rank == 0:
-        recvmat = np.empty([size, *sendmat.shape], dtype=sendmat.dtype)
-        print('Before gather: {:.2f}s | mem {:.2f}mb'.format(time.time() - start, check_memory(verbose=False)))
-    comm.Gather(sendmat, recvmat, root=0)
+    # summing in place avoids holding a (size, d, d) receive buffer on the root
+    res_mat = reduce_sum(comm, mat, root=0, method=reduce_method)
 
     if rank == 0:
-        print('Elapsed for gather: {:.2f}s | mem {:.2f}mb'.format(time.time() - start, check_memory(verbose=False)))
-        res_mat = np.sum(recvmat, axis=0)
+        print('Elapsed for reduce: {:.2f}s | mem {:.2f}mb'.format(time.time() - start, check_memory(verbose=False)))
         print('All done | {:.2f}s | shape {} | mem {:.2f}mb'.format(time.time() - _start, res_mat.shape, check_memory(verbose=False)))
 
         # save dir
@@ -111,6 +250,8 @@ def mpi_main(alpha, parts):
             os.makedirs('/scratch/hopan/cube/fourier/{}'.format(alpha))
         savename = '/scratch/hopan/cube/fourier/{}/{}'.format(alpha, parts)
         np.save(savename, res_mat)
+        if ckpt is not None:
+            ckpt.cleanup()
         print('Done saving in {}! | Total time: {:.2f}s'.format(savename, time.time() - _start))
 
 def test():
@@ -126,7 +267,19 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--alpha', type=str, default='(8, 0, 0)')
     parser.add_argument('--parts', type=str, default='((7,1),(),())')
+    parser.add_argument('--grouped', action='store_true', help='single node permutation grouped transform')
+    parser.add_argument('--all', action='store_true', help='single node transform of every irrep')
+    parser.add_argument('--max_mb', type=int, default=4096)
+    parser.add_argument('--reduce', type=str, default='reduce', choices=['reduce', 'allreduce', 'tree'])
+    parser.add_argument('--weighted', action='store_true', help='split rows by measured rank speed')
+    parser.add_argument('--ckpt_rows', type=int, default=None, help='checkpoint every this many rows (off by default)')
+    parser.add_argument('--ckpt_mins', type=float, default=None, help='checkpoint every this many minutes (off by default)')
     args = parser.parse_args()
     alpha = eval(args.alpha)
     parts = eval(args.parts)
-    mpi_main(alpha, parts)
+    if args.all:
+        all_irreps_main(max_mb=args.max_mb)
+    elif args.grouped:
+        grouped_main(alpha, parts)
+    else:
+        mpi_main(alpha, parts, args.reduce, args.weighted, args.ckpt_rows, args.ckpt_mins)
@@ -5,17 +5,19 @@ import os
 import time
 import numpy as np
 import pandas as pd
-from mpi4py import MPI
 import argparse
 
 from multiprocessing import Pool
 from tqdm import tqdm
-from utils import load_pkl, load_irrep, check_memory, chunk
-from wreath import cyclic_irreps, block_cyclic_irreps, wreath_rep
+from utils import load_pkl, load_irrep, check_memory, chunk, cube2_irreps
+from wreath import cyclic_irreps, block_cyclic_irreps, wreath_rep, induced_rep_table
 from young_tableau import wreath_dim
 from perm2 import sn
-from coset_utils import young_subgroup_perm, coset_reps
-from multi import mult_yor_block, coset_size, convert_yor_matrix, clean_line
+from coset_utils import young_subgroup_perm, coset_reps, young_coset_reps
+from multi import coset_size, clean_line, grouped_inverse_transform
+from mpi_utils import get_comm, partition_rows, gather_rows
+from checkpoint import JobCheckpoints, ckpt_dir
+from cube_table import load_table, orient_unrank, N_ORIENTATIONS, N_PERMS
 
 def load_np_data():
     fname = '/local/hopan/cube/cube_sym_mod_tup.npy'
@@ -30,10 +32,18 @@ def load_csv():
     f = open('/local/hopan/cube/cube_sym_mod_tup.txt')
     return [clean_line(l) for l in f.readlines()] 
 
-def par_cube_ift(rank, size, alpha, parts):
+def par_cube_ift(rank, size, alpha, parts, ckpt=None):
+    '''
+    Evaluate the inverse fourier transform term of the irrep (alpha, parts) on this rank's rows.
+    ckpt: (optional) JobCheckpoints. This rank's values are checkpointed in it and a
+        restarted job resumes from the last checkpoint.
+    Returns: tuple of numpy array of this rank's values, piece boundaries of every rank
+    '''
     start = time.time()
+    table = load_table('/scratch/hopan/cube/')
     try:
-        df = load_df('/scratch/hopan/cube/')
+        if table is None:
+            df = load_df('/scratch/hopan/cube/')
         irrep_dict = load_irrep('/scratch/hopan/cube/', alpha, parts)
         fhat = np.load('/scratch/hopan/cube/fourier/{}/{}.npy'.format(alpha, parts))
     except Exception as e:
@@ -41,22 +51,30 @@ def par_cube_ift(rank, size, alpha, parts):
 
     print('Rank {:3d} / {} | load irrep: {:.2f}s | mem: {:.2f}mb | {} {}'.format(rank, size, time.time() - start, check_memory(verbose=False), alpha, parts))
 
-    cos_reps = coset_reps(sn(8), young_subgroup_perm(alpha))
+    cos_reps = list(young_coset_reps(alpha))
     save_dict = {}
     cyc_irrep_func = cyclic_irreps(alpha)
 
-    chunk_size = len(df) // size
-    start_idx  = chunk_size * rank
-    mat = np.zeros(chunk_size, dtype=fhat.dtype)
+    bounds = partition_rows(len(df) if table is None else len(table), size)
+    start_idx, end_idx = bounds[rank], bounds[rank + 1]
+    mat = np.zeros(end_idx - start_idx, dtype=fhat.dtype)
+    row_start = bounds[rank]
+    rank_ckpt = None if ckpt is None else ckpt.rank_chunk(rank, start_idx, end_idx)
+    if rank_ckpt is not None:
+        start_idx = rank_ckpt.resume(start_idx, mat)
     fhat_t_ravel = fhat.T.ravel()
-    #print('Rank {} | {:7d}-{:7d}'.format(rank, start_idx, start_idx + chunk_size))
+    #print('Rank {} | {:7d}-{:7d}'.format(rank, start_idx, end_idx))
     if rank == 0:
         print('Rank {} | elapsed: {:.2f}s | {:.2f}mb | mat shape: {} | done load | {} {}'.format(rank, time.time() - start, check_memory(verbose=False), fhat.shape, alpha, parts))
 
-    for idx in range(start_idx, start_idx + chunk_size):
-        row = df.loc[idx]
-        otup = tuple(int(i) for i in row[0])
-        perm_tup = tuple(int(i) for i in row[1])
+    if table is not None:
+        otups, ptups, _ = table.rows(start_idx, end_idx)
+        rows = zip(map(tuple, otups.tolist()), map(tuple, ptups.tolist()))
+    else:
+        rows = ((tuple(int(i) for i in df.loc[idx][0]), tuple(int(i) for i in df.loc[idx][1]))
+                for idx in range(start_idx, end_idx))
+
+    for idx, (otup, perm_tup) in enumerate(rows, start_idx):
         #dist = int(row[2])
         # actually want the inverse
         wmat = wreath_rep(otup, perm_tup, irrep_dict, cos_reps, cyc_irrep_func)
@@ -64,8 +82,12 @@ def par_cube_ift(rank, size, alpha, parts):
         # trace(rho(ginv) fhat) = trace(fhat rho(ginv)) = vec(fhat.T).dot(vec(rho(ginv)))
         #feval = np.dot(fhat.T.ravel(), wmat_inv.ravel())
         feval = np.dot(fhat_t_ravel, wmat_inv.ravel())
-        mat[idx - start_idx] = fhat.shape[0] * feval
+        mat[idx - row_start] = fhat.shape[0] * feval
+        if rank_ckpt is not None:
+            rank_ckpt.maybe_save(idx + 1, mat)
 
+    if rank_ckpt is not None:
+        rank_ckpt.save(end_idx, mat, done=True)
     if rank == 0:
         print('Rank {} | elapsed: {:.2f}s | {:.2f}mb | done add'.format(rank, time.time() - start, check_memory(verbose=False)))
 
@@ -73,41 +95,41 @@ def par_cube_ift(rank, size, alpha, parts):
     if rank == 0:
         print('Rank {} | elapsed: {:.2f}s | {:.2f}mb | done matrix conversion'.format(rank, time.time() - start, check_memory(verbose=False)))
 
-    return mat 
+    return mat, bounds
 
-def mpi_main(alpha, parts):
+def mpi_main(alpha, parts, ckpt_rows=None, ckpt_mins=None):
+    '''
+    ckpt_rows: checkpoint each rank's values every this many rows
+    ckpt_mins: checkpoint each rank's values every this many minutes
+    '''
     savename = '/scratch/hopan/cube/fourier_sym_eval/{}/{}.npy'.format(alpha, parts)
     if os.path.exists(savename):
         print('File {} exists! Skipping'.format(savename))
         exit()
         #print('File {} exists! Running anyway!'.format(savename))
 
-    comm = MPI.COMM_WORLD
-    size = MPI.COMM_WORLD.Get_size()
-    rank = MPI.COMM_WORLD.Get_rank()
-    name = MPI.Get_processor_name()
+    comm = get_comm()
+    size = comm.Get_size()
+    rank = comm.Get_rank()
     if rank == 0:
         print('starting {} | {}'.format(alpha, parts))
 
+    ckpt = None
+    if ckpt_rows or ckpt_mins:
+        ckpt = JobCheckpoints(ckpt_dir(savename), ckpt_rows, ckpt_mins * 60 if ckpt_mins else None)
+
     _start = time.time()
     start = time.time()
     # mat = par_cube_ft(alpha, parts, irrep_dict, lst)
-    mat = par_cube_ift(rank, size, alpha, parts)
-    #all_mats = comm.gather(mat, root=0)
+    mat, bounds = par_cube_ift(rank, size, alpha, parts, ckpt)
     if rank == 0:
         print('post par cube ft: {:.2f}s | mem: {:.2f}mb'.format(time.time() - start, check_memory(verbose=False)))
 
-    sendmat = mat
-    recvmat = None
-    if rank == 0:
-        recvmat = np.empty([size, *sendmat.shape], dtype=sendmat.dtype)
-        print('Before gather: {:.2f}s | mem {:.2f}mb'.format(time.time() - start, check_memory(verbose=False)))
-    comm.Gather(sendmat, recvmat, root=0)
+    # pieces can differ in length by a row, so gather them with Gatherv
+    res_mat = gather_rows(comm, mat, bounds, root=0)
 
     if rank == 0:
         print('Elapsed for gather: {:.2f}s | mem {:.2f}mb'.format(time.time() - start, check_memory(verbose=False)))
-        #res_mat = np.sum(recvmat, axis=0)
-        res_mat = recvmat.reshape(-1)
         print('All done | {:.2f}s | shape {} | mem {:.2f}mb'.format(time.time() - _start, res_mat.shape, check_memory(verbose=False)))
 
         # save dir
@@ -115,13 +137,53 @@ def mpi_main(alpha, parts):
             os.makedirs('/scratch/hopan/cube/fourier_sym_eval/{}'.format(alpha))
         savename = '/scratch/hopan/cube/fourier_sym_eval/{}/{}'.format(alpha, parts)
         np.save(savename, res_mat)
+        if ckpt is not None:
+            ckpt.cleanup()
         print('Done saving in {}! | Total time: {:.2f}s'.format(savename, time.time() - _start))
 
+def all_states_ift(irreps, prefix='/scratch/hopan/cube/', irrep_prefix='/local/hopan/'):
+    '''
+    Evaluate the sum of the inverse transform terms of the given irreps at every cube state
+    with the permutation grouped engine (see multi.grouped_inverse_transform).
+    irreps: list of (alpha, parts) tuples whose fourier matrices are in prefix/fourier
+    Returns: numpy float64 array of length N_ORIENTATIONS * N_PERMS, indexed by
+        cube_table.state_index (the same layout as CubeTable.dense_dists). orient_unrank
+        only produces orientation tuples that sum to 0 mod 3, so every entry is a cube
+        state and all 2187 * 40320 of them are evaluated.
+    '''
+    otups = orient_unrank(np.arange(N_ORIENTATIONS))
+    vals = np.zeros((N_ORIENTATIONS, N_PERMS), dtype=np.float64)
+    for alpha, parts in irreps:
+        start = time.time()
+        fhat = np.load(os.path.join(prefix, 'fourier', str(alpha), '{}.npy'.format(parts)))
+        table = induced_rep_table(alpha, parts, irrep_prefix)
+        grouped_inverse_transform(fhat, table, otups, alpha, out=vals)
+        print('{} {} | dim: {} | {:.2f}s | mem: {:.2f}mb'.format(alpha, parts, fhat.shape[0], time.time() - start, check_memory(verbose=False)))
+    return vals.reshape(-1)
+
+def all_states_main(irreps, savename, prefix='/scratch/hopan/cube/'):
+    start = time.time()
+    vals = all_states_ift(irreps, prefix)
+    np.save(savename, vals)
+    print('Done saving {} irreps in {}! | Total time: {:.2f}s'.format(len(irreps), savename, time.time() - start))
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--alpha', type=str, default='(8, 0, 0)')
     parser.add_argument('--parts', type=str, default='((7,1),(),())')
+    parser.add_argument('--ckpt_rows', type=int, default=None, help='checkpoint every this many rows (off by default)')
+    parser.add_argument('--ckpt_mins', type=float, default=None, help='checkpoint every this many minutes (off by default)')
+    parser.add_argument('--all_states', action='store_true', help='single node evaluation at every cube state')
+    parser.add_argument('--all_irreps', action='store_true', help='with --all_states, sum every irrep in the fourier dir')
+    parser.add_argument('--savename', type=str, default='/scratch/hopan/cube/fourier_eval_all.npy')
     args = parser.parse_args()
     alpha = eval(args.alpha)
     parts = eval(args.parts)
-    mpi_main(alpha, parts)
+    if args.all_states:
+        irreps = [(alpha, parts)]
+        if args.all_irreps:
+            irreps = [(a, p) for a, p in cube2_irreps()
+                      if os.path.exists('/scratch/hopan/cube/fourier/{}/{}.npy'.format(a, p))]
+        all_states_main(irreps, args.savename)
+    else:
+        mpi_main(alpha, parts, args.ckpt_rows, args.ckpt_mins)
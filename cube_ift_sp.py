@@ -6,7 +6,6 @@ import time
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
-from mpi4py import MPI
 import argparse
 
 from multiprocessing import Pool
@@ -15,8 +14,10 @@ from utils import load_pkl, load_irrep, check_memory, chunk, load_pkl
 from wreath import cyclic_irreps, block_cyclic_irreps, wreath_rep, wreath_rep_sp
 from young_tableau import wreath_dim
 from perm2 import sn
-from coset_utils import young_subgroup_perm, coset_reps
-from multi import mult_yor_block, coset_size, convert_yor_matrix, clean_line
+from coset_utils import young_subgroup_perm, coset_reps, young_coset_reps
+from multi import coset_size, clean_line
+from mpi_utils import get_comm, partition_rows, gather_rows
+from checkpoint import JobCheckpoints, ckpt_dir
 import torch
 from itertools import product
 
@@ -43,7 +44,14 @@ def load_csv():
     f = open('/local/hopan/cube/cube_sym_mod_tup.txt')
     return [clean_line(l) for l in f.readlines()] 
 
-def par_cube_ift(rank, size, alpha, parts):
+def par_cube_ift(rank, size, alpha, parts, ckpt=None):
+    '''
+    Evaluate the inverse fourier transform term of the irrep (alpha, parts) on this rank's
+    rows using the sparse wreath irreps.
+    ckpt: (optional) JobCheckpoints. This rank's values are checkpointed in it and a
+        restarted job resumes from the last checkpoint.
+    Returns: tuple of numpy array of this rank's values, piece boundaries of every rank
+    '''
     start = time.time()
     try:
         df = load_df('/scratch/hopan/cube/')
@@ -54,20 +62,24 @@ def par_cube_ift(rank, size, alpha, parts):
 
     print('Rank {:3d} / {} | load irrep: {:.2f}s | mem: {:.2f}mb | {} {}'.format(rank, size, time.time() - start, check_memory(verbose=False), alpha, parts))
 
-    cos_reps = coset_reps(sn(8), young_subgroup_perm(alpha))
+    cos_reps = list(young_coset_reps(alpha))
     cyc_irrep_func = cyclic_irreps(alpha)
     cyc_irrs = all_cyc_irreps(cos_reps, cyc_irrep_func)
 
-    chunk_size = len(df) // size
-    start_idx = chunk_size * rank
-    mat = np.zeros(chunk_size, dtype=fhat.dtype)
+    bounds = partition_rows(len(df), size)
+    start_idx, end_idx = bounds[rank], bounds[rank + 1]
+    mat = np.zeros(end_idx - start_idx, dtype=fhat.dtype)
+    row_start = bounds[rank]
+    rank_ckpt = None if ckpt is None else ckpt.rank_chunk(rank, start_idx, end_idx)
+    if rank_ckpt is not None:
+        start_idx = rank_ckpt.resume(start_idx, mat)
     fhat_t_ravel = fhat.T.ravel()
-    #print('Rank {} | {:7d}-{:7d}'.format(rank, start_idx, start_idx + chunk_size))
+    #print('Rank {} | {:7d}-{:7d}'.format(rank, start_idx, end_idx))
     if rank == 0:
         print('Rank {} | elapsed: {:.2f}s | {:.2f}mb | mat shape: {} | done load | {} {}'.format(rank, time.time() - start, check_memory(verbose=False), fhat.shape, alpha, parts))
 
     st = time.time()
-    for idx in range(start_idx, start_idx + chunk_size):
+    for idx in range(start_idx, end_idx):
         row = df.loc[idx]
         otup = tuple(int(i) for i in row[0])
         perm_tup = tuple(int(i) for i in row[1])
@@ -80,52 +92,56 @@ def par_cube_ift(rank, size, alpha, parts):
         #feval = np.dot(fhat.T.ravel(), wmat_inv.ravel())
         #feval = np.dot(fhat_t_ravel, wmat_inv.ravel())
         feval_sp = (wmat_inv_sp.multiply(fhat.T)).sum()
-        mat[idx - start_idx] = fhat.shape[0] * feval_sp
+        mat[idx - row_start] = fhat.shape[0] * feval_sp
+        if rank_ckpt is not None:
+            rank_ckpt.maybe_save(idx + 1, mat)
 
+    if rank_ckpt is not None:
+        rank_ckpt.save(end_idx, mat, done=True)
     if rank == 0:
         elapsed = time.time() - st
-        avg_t = elapsed / chunk_size
+        avg_t = elapsed / max(end_idx - start_idx, 1)
         print('Rank {} | elapsed: {:.2f}s | {:.2f}mb | done add | ift time: {:.2f}s | avg time: {:.6f}s'.format(rank, time.time() - start, check_memory(verbose=False), elapsed, avg_t))
 
     del sp_irrep_dict
     if rank == 0:
         print('Rank {} | elapsed: {:.2f}s | {:.2f}mb | done matrix conversion'.format(rank, time.time() - start, check_memory(verbose=False)))
 
-    return mat 
+    return mat, bounds
 
-def mpi_main(alpha, parts):
+def mpi_main(alpha, parts, ckpt_rows=None, ckpt_mins=None):
+    '''
+    ckpt_rows: checkpoint each rank's values every this many rows
+    ckpt_mins: checkpoint each rank's values every this many minutes
+    '''
     savename = '/scratch/hopan/cube/fourier_sym_eval/{}/{}.npy'.format(alpha, parts)
     if os.path.exists(savename):
         print('File {} exists! Skipping'.format(savename))
         exit()
         #print('File {} exists! Running anyway!'.format(savename))
 
-    comm = MPI.COMM_WORLD
-    size = MPI.COMM_WORLD.Get_size()
-    rank = MPI.COMM_WORLD.Get_rank()
-    name = MPI.Get_processor_name()
+    comm = get_comm()
+    size = comm.Get_size()
+    rank = comm.Get_rank()
     if rank == 0:
         print('starting {} | {}'.format(alpha, parts))
 
+    ckpt = None
+    if ckpt_rows or ckpt_mins:
+        ckpt = JobCheckpoints(ckpt_dir(savename), ckpt_rows, ckpt_mins * 60 if ckpt_mins else None)
+
     _start = time.time()
     start = time.time()
     # mat = par_cube_ft(alpha, parts, irrep_dict, lst)
-    mat = par_cube_ift(rank, size, alpha, parts)
-    #all_mats = comm.gather(mat, root=0)
+    mat, bounds = par_cube_ift(rank, size, alpha, parts, ckpt)
     if rank == 0:
         print('post par cube ft: {:.2f}s | mem: {:.2f}mb'.format(time.time() - start, check_memory(verbose=False)))
 
-    sendmat = mat
-    recvmat = None
-    if rank == 0:
-        recvmat = np.empty([size, *sendmat.shape], dtype=sendmat.dtype)
-        print('Before gather: {:.2f}s | mem {:.2f}mb'.format(time.time() - start, check_memory(verbose=False)))
-    comm.Gather(sendmat, recvmat, root=0)
+    # pieces can differ in length by a row, so gather them with Gatherv
+    res_mat = gather_rows(comm, mat, bounds, root=0)
 
     if rank == 0:
         print('Elapsed for gather: {:.2f}s | mem {:.2f}mb'.format(time.time() - start, check_memory(verbose=False)))
-        #res_mat = np.sum(recvmat, axis=0)
-        res_mat = recvmat.reshape(-1)
         print('All done | {:.2f}s | shape {} | mem {:.2f}mb'.format(time.time() - _start, res_mat.shape, check_memory(verbose=False)))
 
         # save dir
@@ -133,6 +149,8 @@ def mpi_main(alpha, parts):
             os.makedirs('/scratch/hopan/cube/fourier_sym_eval/{}'.format(alpha))
         savename = '/scratch/hopan/cube/fourier_sym_eval/{}/{}'.format(alpha, parts)
         np.save(savename, res_mat)
+        if ckpt is not None:
+            ckpt.cleanup()
         print('Done saving in {}! | Total time: {:.2f}s'.format(savename, time.time() - _start))
 
 def test_main(alpha, parts):
@@ -160,7 +178,7 @@ def test_main(alpha, parts):
     check_memory()
 
     cyc_irrep_func = cyclic_irreps(alpha)
-    cos_reps = coset_reps(sn(8), young_subgroup_perm(alpha))
+    cos_reps = list(young_coset_reps(alpha))
     st = time.time()
     cyc_irrs = all_cyc_irreps(cos_reps, cyc_irrep_func)
     print('Time to compute all cyc irreps: {:.5f}s'.format(time.time() - st))
@@ -247,8 +265,10 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--alpha', type=str, default='(2, 3, 3)')
     parser.add_argument('--parts', type=str, default='((2,), (1, 1, 1), (2, 1))')
+    parser.add_argument('--ckpt_rows', type=int, default=None, help='checkpoint every this many rows (off by default)')
+    parser.add_argument('--ckpt_mins', type=float, default=None, help='checkpoint every this many minutes (off by default)')
     args = parser.parse_args()
     alpha = eval(args.alpha)
     parts = eval(args.parts)
     #test_main(alpha, parts)
-    mpi_main(alpha, parts)
+    mpi_main(alpha, parts, args.ckpt_rows, args.ckpt_mins)
@@ -3,7 +3,7 @@ import os
 import pdb
 import numpy as np
 from perm2 import sn
-from coset_utils import young_subgroup_perm, coset_reps
+from coset_utils import young_subgroup_perm, coset_reps, young_coset_reps
 from wreath import wreath_rep, get_mat, cyclic_irreps, block_cyclic_irreps, get_sparse_mat, WreathCycSn
 from utils import load_pkl, load_sparse_pkl, check_memory
 from young_tableau import wreath_dim
@@ -33,7 +33,7 @@ class Cube2Irrep(object):
         '''
         self.alpha = alpha
         self.parts = parts
-        self.cos_reps = coset_reps(sn(8), young_subgroup_perm(alpha))
+        self.cos_reps = list(young_coset_reps(alpha))
         self.cyc_irrep_func = cyclic_irreps(alpha)
         self.yor_dict = None
 
@@ -5,8 +5,8 @@ import os
 import numpy as np
 from scipy.sparse import csr_matrix
 from perm2 import sn
-from coset_utils import young_subgroup_perm, coset_reps
-from wreath import wreath_rep, cyclic_irreps, block_cyclic_irreps, wreath_rep_sp
+from coset_utils import young_subgroup_perm, coset_reps, young_coset_reps
+from wreath import wreath_rep, cyclic_irreps, block_cyclic_irreps, wreath_rep_sp, induced_rep_table
 from utils import load_pkl, cube2_orientations
 
 sys.path.append('./cube')
@@ -17,13 +17,21 @@ class Cube2SpIrrep(object):
         self.alpha = alpha
         self.parts = parts
 
-        self.cos_reps = coset_reps(sn(8), young_subgroup_perm(alpha)) # num blocks = num cosets
+        self.cos_reps = list(young_coset_reps(alpha)) # num blocks = num cosets
         self.cyc_irrep_func = cyclic_irreps(alpha)
 
         # cache cyclic irreps
         self.cyc_irreps = self.compute_cyclic_irreps()
 
+        if pickledir is None:
+            # compact block monomial irreps, no sparse pickles needed
+            self.ind_irrep_table = induced_rep_table(alpha, parts)
+            self.ind_irrep_dict = None
+            self.block_size = self.ind_irrep_table.blocks.shape[1]
+            return
+
         # load induced perm irrep dict
+        self.ind_irrep_table = None
         try: 
             fname = os.path.join(pickledir, str(alpha), str(parts) + '.pkl')
             print('Loading pkl from: {}'.format(fname))
@@ -47,6 +55,8 @@ class Cube2SpIrrep(object):
 
     def irrep(self, otup, ptup):
         cyc_irrep = self.cyc_irreps[otup] 
+        if self.ind_irrep_table is not None:
+            return self.ind_irrep_table[ptup].with_scalars(cyc_irrep).to_csr()
         perm_irrep = self.ind_irrep_dict[ptup]
 
         # block multiply
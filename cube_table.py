@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from perm2 import perm_rank, perm_unrank
+
+'''
+Packed binary version of the 2x2 cube distance table (cube_sym_mod_tup.txt).
+The table is a directory with one .npy column per field, opened with mmap:
+    orank.npy: uint16 rank of the orientation tuple (see orient_rank)
+    prank.npy: uint16 perm_rank of the permutation tuple
+    dist.npy : uint8 distance
+Rows are kept in the order of the csv so results indexed by row (ex: the
+inverse transforms) line up with the old text files.
+'''
+CUBE_TABLE_DIR = 'cube_sym_mod_tup'
+N_CUBIES = 8
+N_ORIENTATIONS = 3 ** (N_CUBIES - 1)
+N_PERMS = 40320
+MISSING_DIST = 255
+_POW3 = 3 ** np.arange(N_CUBIES - 2, -1, -1, dtype=np.int64)
+
+def orient_rank(otups):
+    '''
+    Rank of a 2x2 cube orientation tuple. The last orientation is determined
+    by the first seven since the total is 0 mod 3, so the rank is the base 3
+    number given by the first seven entries.
+    otups: numpy array of shape (..., 8)
+    Returns: numpy uint16 array of shape (...)
+    '''
+    otups = np.asarray(otups)
+    return (otups[..., :-1].astype(np.int64) @ _POW3).astype(np.uint16)
+
+def orient_unrank(ranks):
+    '''
+    Inverse of orient_rank.
+    ranks: numpy array of shape (...)
+    Returns: numpy uint8 array of shape (..., 8)
+    '''
+    ranks = np.asarray(ranks, dtype=np.int64)
+    otups = np.zeros(ranks.shape + (N_CUBIES,), dtype=np.uint8)
+    otups[..., :-1] = (ranks[..., None] // _POW3) % 3
+    otups[..., -1] = (3 - otups[..., :-1].sum(axis=-1) % 3) % 3
+    return otups
+
+def _str_column(strs):
+    return np.frombuffer(''.join(strs).encode(), dtype=np.uint8).reshape(-1, N_CUBIES) - ord('0')
+
+def convert_csv(csv_fname, outdir, chunk_rows=2**22):
+    '''
+    Convert the csv of orientation string, permutation string, distance to a cube table.
+    csv_fname: file name of the csv
+    outdir: directory to write the table to
+    chunk_rows: number of csv rows to parse at a time
+    Returns: CubeTable
+    '''
+    with open(csv_fname, 'rb') as f:
+        nrows = sum(buf.count(b'\n') for buf in iter(lambda: f.read(2**24), b''))
+
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    cols = {
+        'orank': np.lib.format.open_memmap(os.path.join(outdir, 'orank.npy'), mode='w+', dtype=np.uint16, shape=(nrows,)),
+        'prank': np.lib.format.open_memmap(os.path.join(outdir, 'prank.npy'), mode='w+', dtype=np.uint16, shape=(nrows,)),
+        'dist': np.lib.format.open_memmap(os.path.join(outdir, 'dist.npy'), mode='w+', dtype=np.uint8, shape=(nrows,)),
+    }
+
+    idx = 0
+    reader = pd.read_csv(csv_fname, header=None, dtype={0: str, 1: str, 2: int}, chunksize=chunk_rows)
+    for df in reader:
+        end = idx + len(df)
+        cols['orank'][idx: end] = orient_rank(_str_column(df[0]))
+        cols['prank'][idx: end] = perm_rank(_str_column(df[1]))
+        cols['dist'][idx: end] = df[2].values
+        idx = end
+
+    for c in cols.values():
+        c.flush()
+    del cols
+    return CubeTable(outdir)
+
+class CubeTable:
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.orank = np.load(os.path.join(dirname, 'orank.npy'), mmap_mode='r')
+        self.prank = np.load(os.path.join(dirname, 'prank.npy'), mmap_mode='r')
+        self.dist = np.load(os.path.join(dirname, 'dist.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.dist)
+
+    def rows(self, start, end):
+        '''
+        Returns: tuple of numpy arrays otups (k, 8), ptups (k, 8), dists (k,) for rows [start, end)
+        '''
+        otups = orient_unrank(self.orank[start: end])
+        ptups = perm_unrank(self.prank[start: end], N_CUBIES)
+        return otups, ptups, np.asarray(self.dist[start: end])
+
+    def chunk_bounds(self, rank=0, size=1):
+        '''
+        Split the rows into size contiguous pieces that cover every row. The first
+        len % size pieces get one extra row.
+        Returns: (start, end) of the piece for the given rank
+        '''
+        base, extra = divmod(len(self), size)
+        start = rank * base + min(rank, extra)
+        end = start + base + (1 if rank < extra else 0)
+        return start, end
+
+    def iter_chunks(self, chunk_rows=2**20, rank=0, size=1, bounds=None):
+        '''
+        Iterate over the rows owned by the given rank in chunks of chunk_rows.
+        bounds: (optional) piece boundaries of every rank (see mpi_utils.partition_rows).
+            If not given, the rows are split evenly with chunk_bounds.
+        Yields: tuples of (start row, otups, ptups, dists)
+        '''
+        if bounds is None:
+            start, end = self.chunk_bounds(rank, size)
+        else:
+            start, end = int(bounds[rank]), int(bounds[rank + 1])
+        for st in range(start, end, chunk_rows):
+            yield (st,) + self.rows(st, min(st + chunk_rows, end))
+
+    def dense_dists(self):
+        '''
+        Distances laid out by state: index orank * N_PERMS + prank. States that
+        are not in the table get MISSING_DIST.
+        Returns: numpy uint8 array of length N_ORIENTATIONS * N_PERMS
+        '''
+        dense = np.full(N_ORIENTATIONS * N_PERMS, MISSING_DIST, dtype=np.uint8)
+        for st in range(0, len(self), 2**24):
+            idx = self.orank[st: st + 2**24].astype(np.int64) * N_PERMS + self.prank[st: st + 2**24]
+            dense[idx] = self.dist[st: st + 2**24]
+        return dense
+
+def state_index(otups, ptups):
+    '''
+    Index of the cube states in CubeTable.dense_dists
+    otups: numpy array of shape (..., 8)
+    ptups: numpy array of shape (..., 8)
+    Returns: numpy int64 array of shape (...)
+    '''
+    return orient_rank(otups).astype(np.int64) * N_PERMS + perm_rank(np.asarray(ptups, dtype=np.uint8))
+
+def load_table(prefix):
+    '''
+    prefix: directory holding the cube data
+    Returns: CubeTable if the converted table exists in prefix, otherwise None
+    '''
+    dirname = os.path.join(prefix, CUBE_TABLE_DIR)
+    if os.path.exists(os.path.join(dirname, 'dist.npy')):
+        return CubeTable(dirname)
+    return None
+
+if __name__ == '__main__':
+    prefix = sys.argv[1] if len(sys.argv) > 1 else '/local/hopan/cube/'
+    start = time.time()
+    table = convert_csv(os.path.join(prefix, 'cube_sym_mod_tup.txt'), os.path.join(prefix, CUBE_TABLE_DIR))
+    print('Converted {} rows in {:.2f}s'.format(len(table), time.time() - start))
@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import argparse
+sys.path.append('../')
+sys.path.append('../cube/')
+import numpy as np
+from rank_bfs import WreathPuzzle, perm_puzzle, bfs_to_file, print_layer_sizes, save_generators
+from perm2 import perm_rank
+from utility import S8_GENERATORS
+from s8puzzle import S8Puzzle
+from wreath_puzzle import PYRAMINX_GENERATORS, PYRAMINX_IDENT, CUBE2_GENERATORS, CUBE2_IDENT
+from cube_perms import rot_permutations
+from str_cube import init_2cube, get_wreath
+
+'''
+Build the distance table of a permutation or wreath puzzle from its generators.
+The result is a .npy uint8 array indexed by state rank (see rank_bfs) that PermDF and
+WreathDF load directly, along with the generators saved next to it (see
+rank_bfs.save_generators). A new puzzle only needs an entry in PUZZLES.
+'''
+
+# The 24 rotations of the solved 2x2 cube. Rooting the cube2 bfs at all of them gives the
+# same distances as the fixed core table (cube_sym_mod_tup) over all 88,179,840 states.
+CUBE2_START_STATES = sorted(set(get_wreath(c) for c in rot_permutations(init_2cube())))
+
+# name -> (generators, start states, orientation group size or None for permutation puzzles)
+PUZZLES = {
+    's8': (S8_GENERATORS, S8Puzzle._full_start_states, None),
+    's8_onestart': (S8_GENERATORS, S8Puzzle._one_start_states, None),
+    'pyraminx': (PYRAMINX_GENERATORS, [PYRAMINX_IDENT], 2),
+    'cube2': (CUBE2_GENERATORS, CUBE2_START_STATES, 3),
+    # distances to the single solved orientation CUBE2_IDENT: reaches 3,674,160 states
+    'cube2_onestart': (CUBE2_GENERATORS, [CUBE2_IDENT], 3),
+}
+
+def make_puzzle(generators, start_states, cyc_size=None):
+    '''
+    generators: list of permutation tuples (cyc_size None) or (otup, ptup) wreath tuples
+    start_states: list of states in the same format as the generators
+    cyc_size: orientation group size of a wreath puzzle
+    Returns: tuple of the rank_bfs puzzle and the ranks of the start states
+    '''
+    if cyc_size is None:
+        return perm_puzzle(generators), perm_rank(np.array(start_states, dtype=np.uint8))
+
+    puzzle = WreathPuzzle.from_generators(generators, cyc_size)
+    otups, ptups = zip(*start_states)
+    return puzzle, puzzle.rank(np.array(otups), np.array(ptups, dtype=np.uint8))
+
+def main(args):
+    generators, start_states, cyc_size = PUZZLES[args.puzzle]
+    puzzle, roots = make_puzzle(generators, start_states, cyc_size)
+    savename = args.savename or os.path.join(args.prefix, '{}_dists.npy'.format(args.puzzle))
+    print('Building {} distances: {} generators | {} ranks | saving in: {}'.format(
+        args.puzzle, len(generators), puzzle.nstates, savename))
+
+    start = time.time()
+    dists = bfs_to_file(puzzle, roots, savename, nworkers=args.workers)
+    save_generators(savename, generators, cyc_size)
+    print('Done in {:.2f}s'.format(time.time() - start))
+    print_layer_sizes(dists)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--puzzle', type=str, default='s8', choices=list(PUZZLES))
+    parser.add_argument('--prefix', type=str, default='/local/hopan/')
+    parser.add_argument('--savename', type=str, default='')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    main(args)
@@ -1,28 +1,72 @@
 import pdb
+import sys
+import math
 import random
 from tqdm import tqdm
 import numpy as np
 import pandas as pd
 import pickle
 import torch
+sys.path.append('../')
+from perm2 import perm_rank, tup_rank, perm_unrank
+from rank_bfs import orient_unrank, UNVISITED, load_generators as load_npy_generators
 from utility import S8_GENERATORS, px_mult
 from wreath_puzzle import PYRAMINX_GENERATORS, px_wreath_mul, CUBE2_GENERATORS
 
 def str2tup(s):
     return tuple(int(i) for i in s)
 
+def str2arr(strs):
+    '''
+    Vectorized str2tup over a sequence of equal length digit strings.
+    strs: list/Series of strings
+    Returns: numpy uint8 array of shape (len(strs), len of each string)
+    '''
+    n = len(strs[0])
+    arr = np.frombuffer(''.join(strs).encode(), dtype=np.uint8).reshape(-1, n)
+    return arr - ord('0')
+
+def rank_dist_df(fname, cyc_size=None):
+    '''
+    Load a rank indexed distance array built by rank_bfs (see build_dists.py) in the
+    format of the csv distance files. Rows are in rank order, not bfs order.
+    fname: .npy file name
+    cyc_size: orientation group size for wreath puzzles, None for permutation puzzles
+    Returns: DataFrame with columns state, dist (or otup, ptup, dist for wreath puzzles)
+    '''
+    dists = np.load(fname, mmap_mode='r')
+    k = 1 if cyc_size is None else cyc_size
+    n = 1
+    while k ** (n - 1) * math.factorial(n) < len(dists):
+        n += 1
+    ranks = np.flatnonzero(dists != UNVISITED)
+    oranks, pranks = np.divmod(ranks, math.factorial(n))
+    ptups = perm_unrank(pranks, n)
+    if cyc_size is None:
+        states = [''.join(map(str, p)) for p in ptups.tolist()]
+        return pd.DataFrame({'state': states, 'dist': dists[ranks].astype(int)})
+
+    otups = orient_unrank(oranks, n, k)
+    return pd.DataFrame({'otup': [tuple(o) for o in otups.tolist()],
+                         'ptup': [tuple(p) for p in ptups.tolist()],
+                         'dist': dists[ranks].astype(int)})
+
 class PermDF:
     '''
     Container class for holding mapping from perm tuple -> distance
     Use it to evaluate policies (mapping from perm tuple -> number).
+    Distances are stored in a flat array indexed by the perm_rank of the state,
+    with -1 for states that are not in the distance file.
     '''
     #def __init__(self, fname, ident):
     def __init__(self, fname, ngenerators):
         '''
         Assumption: The first {ngenerator} states of dist 1 from solved state are generators of the puzzle
+        (.npy tables use the generators saved next to them instead, see load_generators)
         '''
         self.df = self.load_df(fname)
-        self.dist_dict = self.load_dist_dict()
+        self.states = str2arr(self.df['state'].values)
+        self.dist_arr = self.load_dist_arr()
         self.max_dist = self.df['dist'].max()
         self.generators = S8_GENERATORS
         self._num_nbrs = ngenerators
@@ -32,13 +76,8 @@ class PermDF:
             self._done_states.append(self._get_state(row))
         self._done_states_set = set(self._done_states)
 
-        self._generators = []
-        d1_elements = self.df[self.df['dist'] == 1]
-        for idx, row in d1_elements.iterrows():
-            self._generators.append(self._get_state(row))
-            if len(self._generators) == ngenerators:
-                break
-        self._all_states = list(self.dist_dict.keys())
+        self._generators = self.load_generators(fname, ngenerators)
+        self._all_states = [tuple(int(i) for i in row) for row in self.states]
 
     def is_done(self, state):
         return state in self._done_states_set
@@ -72,23 +111,63 @@ class PermDF:
         return state
 
     def load_df(self, fname):
+        if fname.endswith('.npy'):
+            return rank_dist_df(fname)
         df = pd.read_csv(fname, header=None, dtype={0: str, 1: int})
         df.columns = ['state', 'dist']
         return df
 
-    def load_dist_dict(self):
-        return {self._get_state(row): row['dist'] for s, row in self.df.iterrows()}
+    def load_generators(self, fname, ngenerators):
+        '''
+        The rows of a .npy table are in rank order, so its dist 1 rows say nothing about
+        the move order: read the generators that build_dists saved next to the table.
+        Returns: list of the first ngenerators generators
+        '''
+        if fname.endswith('.npy'):
+            return load_npy_generators(fname)[:ngenerators]
+
+        generators = []
+        d1_elements = self.df[self.df['dist'] == 1]
+        for idx, row in d1_elements.iterrows():
+            generators.append(self._get_state(row))
+            if len(generators) == ngenerators:
+                break
+        return generators
+
+    def load_dist_arr(self):
+        n = self.states.shape[1]
+        dtype = np.int8 if self.df['dist'].max() < 128 else np.int16
+        dist_arr = np.full(math.factorial(n), -1, dtype=dtype)
+        dist_arr[perm_rank(self.states)] = self.df['dist'].values
+        return dist_arr
 
     def distance(self, state):
-        return self.dist_dict[state]
+        dist = self.dist_arr[tup_rank(state)]
+        if dist < 0:
+            raise KeyError('State {} is not in the distance file'.format(state))
+        return dist
+
+    def distances(self, states):
+        '''
+        states: numpy array of shape (k, n) or list of perm tuples
+        Returns: numpy array of the k distances
+        Raises KeyError if a state is not in the distance file
+        '''
+        states = np.asarray(states, dtype=np.uint8)
+        dists = self.dist_arr[perm_rank(states)]
+        missing = np.flatnonzero(dists < 0)
+        if len(missing):
+            raise KeyError('{} states are not in the distance file, ex: {}'.format(
+                len(missing), tuple(states[missing[0]].tolist())))
+        return dists
 
     def benchmark(self):
-        states = list(self.dist_dict.keys())
+        states = self.all_states()
 
         dist_probs = {}
         probs = []
         for p in states:
-            dist = self.dist_dict[p]
+            dist = self.distance(p)
             true_nbr_vals = {n: self.distance(n) for n in self.nbrs(p)}
             opt_val = min(true_nbr_vals.values())
             opt_nbrs = [n for n, dist in true_nbr_vals.items() if dist == opt_val]
@@ -157,7 +236,7 @@ class PermDF:
 
         for i in (range(cnt)):
             state = states[i]
-            dist = self.dist_dict[state]
+            dist = self.distance(state)
             correct = int(self.opt_nbr(state, policy, to_tensor))
             ncorrect += correct
             dist_corr[dist] = dist_corr.get(dist, 0) + correct
@@ -176,16 +255,16 @@ class PermDF:
         dist_cnts = {}
         ncorrect = 0
 
-        if len(self.dist_dict) > 50000 and distance_check:
+        if len(self.df) > 50000 and distance_check:
             states = []
             for d in distance_check:
                 sample_df = self.df[self.df['dist'] == d]
                 states.extend(self.random_states(d, cnt))
         else:
-            states = self.dist_dict.keys()
+            states = self.all_states()
 
         for state in states:
-            dist = self.dist_dict[state]
+            dist = self.distance(state)
             correct = int(self.opt_nbr(state, policy, to_tensor))
             ncorrect += correct
             dist_corr[dist] = dist_corr.get(dist, 0) + correct
@@ -199,7 +278,7 @@ class PermDF:
         return prop_corr, dist_corr
 
     def opt_move_tup(self, tup):
-        dists = [self.dist_dict[t] for t in tup]
+        dists = [self.distance(t) for t in tup]
         return dists.index(min(dists))
 
     def random_states(self, dist, cnt):
@@ -219,33 +298,37 @@ class WreathDF(PermDF):
     def __init__(self, fname, ngenerators, cyc_size, dist_dict_pkl=None):
         '''
         Assumption: The first {ngenerator} states of dist 1 from solved state are generators of the puzzle
+        (.npy tables use the generators saved next to them instead, see load_generators)
         '''
+        self.cyc_size = cyc_size
         self.df = self.load_df(fname)
         self.dist_dict = self.load_dist_dict(dist_dict_pkl)
         self.max_dist = self.df['dist'].max()
         #self.generators = PYRAMINX_GENERATORS
         self._num_nbrs = ngenerators
-        self.cyc_size = cyc_size
 
         self._done_states = []
         for idx, row in self.df[self.df['dist'] == 0].iterrows():
             self._done_states.append(self._get_state(row))
         self._done_states_set = set(self._done_states)
 
-        self.generators = []
-        d1_elements = self.df[self.df['dist'] == 1]
-        for idx, row in d1_elements[:ngenerators].iterrows():
-            self.generators.append(self._get_state(row))
-            if len(self.generators) == ngenerators:
-                break
+        self.generators = self.load_generators(fname, ngenerators)
         self._all_states = list(self.dist_dict.keys())
 
+    def distance(self, state):
+        return self.dist_dict[state]
+
+    def distances(self, states):
+        return np.array([self.dist_dict[s] for s in states])
+
     def load_dist_dict(self, dist_dict_pkl=None):
         if dist_dict_pkl:
             return pickle.load(open(dist_dict_pkl, 'rb'))
         return {self._get_state(row): row['dist'] for s, row in tqdm(self.df.iterrows())}
 
     def load_df(self, fname):
+        if fname.endswith('.npy'):
+            return rank_dist_df(fname, self.cyc_size)
         df = pd.read_csv(fname, header=None, dtype={0: str, 1: str, 2: int})
         df[0] = df[0].apply(str2tup)
         df[1] = df[1].apply(str2tup)
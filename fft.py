@@ -1,12 +1,14 @@
+import math
 import time
 import pdb
 import numpy as np
 from yor import yor, ysemi
-from young_tableau import FerrersDiagram
+from young_tableau import FerrersDiagram, n_tabs
 from utils import partitions
 from perm import Perm, sn
 from perm2 import Perm2
 from perm2 import sn as sn2
+from perm2 import perm_rank, perm_unrank, TupPerm
 from wreath import wreath_rep, WreathCycSn
 
 
@@ -16,7 +18,7 @@ irrep = yor
 def ft_full(f, n, algo='fft'):
     '''
     Computes the fourier transform using either the fft or the slow fourier transform.
-    f: a function from S_n -> \mathbb{R}
+    f: a function from S_n -> \mathbb{R}, or a numpy vector indexed by perm_rank (fft only)
     n: integer
     algo: string
 
@@ -24,11 +26,13 @@ def ft_full(f, n, algo='fft'):
     '''
     fourier_parts = {}
     parts = partitions(n)
+    if algo == 'fft':
+        fft_res = fft_vec(f, n) if isinstance(f, np.ndarray) else fft_full(f, n)
 
     for p in parts:
-        ferrers = FerrersDiagram(p)
+        ferrers = FerrersDiagram.from_partition(p)
         if algo == 'fft':
-            fourier_parts[ferrers] = fft2(f, ferrers)
+            fourier_parts[ferrers] = fft_res[p]
         elif algo == 'ft1':
             fourier_parts[ferrers] = fourier_transform(f, ferrers)
         elif algo == 'ft2':
@@ -36,6 +40,216 @@ def ft_full(f, n, algo='fft'):
 
     return fourier_parts
 
+def fft_tables(n):
+    '''
+    Precompute everything the full FFT needs at each level of the subgroup chain
+    S_1 < S_2 < ... < S_n.
+    n: integer
+
+    Returns: dict mapping k -> (shifts, irreps) where
+        shifts: list of TupPerm objects (in S_n) of the contiguous cycles (i, i+1, ..., k) for i = 1, ..., k
+        irreps: list of (partition, branch partitions, list of yor matrices of the k cycles)
+    '''
+    tables = {}
+    for k in range(2, n + 1):
+        shifts = [TupPerm(Perm2.cont_cycle(n, i, k).tup_rep) for i in range(1, k + 1)]
+        cycles = [Perm2.cont_cycle(k, i, k) for i in range(1, k + 1)]
+        irreps = []
+        for p in partitions(k):
+            ferrers = FerrersDiagram.from_partition(p)
+            branches = [b.partition for b in ferrers.branch_down()]
+            rhos = [irrep(ferrers, cyc) for cyc in cycles]
+            irreps.append((p, branches, rhos))
+        tables[k] = (shifts, irreps)
+    return tables
+
+def fft_full(f, n, tables=None):
+    '''
+    Compute Clausen's FFT over every irrep of S_n in a single pass down the subgroup chain.
+    The transforms of each coset shifted function over S_{k-1} are computed once and shared
+    by every irrep of S_k, instead of being recomputed for each parent partition like in fft2.
+
+    f: function from S_n (TupPerm objects, which have the same interface as Perm2) -> \mathbb{R}
+    n: integer
+    tables: (optional) output of fft_tables(n)
+
+    Returns: a dictionary mapping partitions of n (tuple of ints) to fourier matrices
+    '''
+    if tables is None:
+        tables = fft_tables(n)
+    return _fft_full(f, n, TupPerm.eye(n), tables)
+
+def _fft_full(f, k, shift, tables):
+    '''
+    f: function from S_n -> \mathbb{R}
+    k: integer, current level of the subgroup chain
+    shift: TupPerm in S_n, product of the coset reps chosen above this level
+    tables: output of fft_tables
+
+    Returns: a dictionary mapping partitions of k to the fourier transform over S_k of
+        pi |-> f(shift * pi)
+    '''
+    if k == 1:
+        return {(1,): np.eye(1) * f(shift)}
+
+    shifts, irreps = tables[k]
+    f_hats = {}
+    for i, cyc in enumerate(shifts):
+        sub_hats = _fft_full(f, k - 1, shift * cyc, tables)
+
+        for p, branches, rhos in irreps:
+            rho_i = rhos[i]
+            # rho_i * (direct sum of the sub transforms), one column block at a time
+            res = np.zeros(rho_i.shape)
+            idx = 0
+            for b in branches:
+                sub = sub_hats[b]
+                d = sub.shape[0]
+                res[:, idx: idx+d] = rho_i[:, idx: idx+d].dot(sub)
+                idx += d
+
+            if p in f_hats:
+                f_hats[p] += res
+            else:
+                f_hats[p] = res
+    return f_hats
+
+FFT_ORDER_CACHE = {}
+def fft_order(n):
+    '''
+    The FFT works on vectors laid out so that each left coset c_k(i) S_{k-1} of the subgroup chain
+    is a contiguous block (c_k(i) is the cycle (i, i+1, ..., k)). This is the lexicographic order of
+    the reversed permutation tuples.
+    n: integer
+
+    Returns: int numpy array order of length n!, such that f[order] is the coset ordered version of
+        f, a vector indexed by perm_rank.
+    '''
+    if n not in FFT_ORDER_CACHE:
+        perms = perm_unrank(np.arange(math.factorial(n)), n)
+        order = np.empty(len(perms), dtype=np.int64)
+        order[perm_rank(perms[:, ::-1])] = np.arange(len(perms))
+        FFT_ORDER_CACHE[n] = order
+    return FFT_ORDER_CACHE[n]
+
+def fft_vec(f, n, tables=None):
+    '''
+    Clausen's FFT over every irrep of S_n for a function given as a dense vector.
+    f: numpy array of length n!, f[perm_rank(g)] is the function value at g
+    n: integer
+    tables: (optional) output of fft_tables(n)
+
+    Returns: a dictionary mapping partitions of n (tuple of ints) to fourier matrices
+    '''
+    f_hats = fft_batch(np.asarray(f)[None], n, tables)
+    return {p: mat[0] for p, mat in f_hats.items()}
+
+def fft_batch(fs, n, tables=None):
+    '''
+    Clausen's FFT over every irrep of S_n for a batch of functions given as dense vectors.
+    The subgroup chain is processed bottom up: the transforms of all cosets (of all functions)
+    at level k-1 are kept as one (num cosets, d, d) array per partition, so coset shifts are reshapes
+    and each level is one matrix product per (irrep, branch) pair shared by the whole batch.
+
+    fs: numpy array of shape (num functions, n!), fs[b, perm_rank(g)] is the value of function b at g
+    n: integer
+    tables: (optional) output of fft_tables(n)
+
+    Returns: a dictionary mapping partitions of n (tuple of ints) to numpy arrays of shape
+        (num functions, d, d) of the fourier matrices of each function
+    '''
+    if tables is None:
+        tables = fft_tables(n)
+    fs = np.asarray(fs)
+    dtype = np.result_type(fs.dtype, np.float64)
+    f_hats = {(1,): fs[:, fft_order(n)].astype(dtype).reshape(-1, 1, 1)}
+
+    for k in range(2, n + 1):
+        _, irreps = tables[k]
+        k_hats = {}
+        for p, branches, rhos in irreps:
+            d = rhos[0].shape[0]
+            res = None
+            idx = 0
+            for b in branches:
+                sub = f_hats[b]
+                db = sub.shape[1]
+                m = sub.shape[0] // k
+                if res is None:
+                    res = np.zeros((m, d, d), dtype=dtype)
+
+                # res[:, :, block] = sum_i rho_i[:, block] * sub_i, done as a single matrix product
+                rho_b = np.stack([rho[:, idx: idx+db] for rho in rhos], axis=1).reshape(d, k * db)
+                sub = sub.reshape(m, k * db, db).transpose(1, 0, 2).reshape(k * db, m * db)
+                res[:, :, idx: idx+db] = rho_b.dot(sub).reshape(d, m, db).transpose(1, 0, 2)
+                idx += db
+            k_hats[p] = res
+        f_hats = k_hats
+
+    return f_hats
+
+def ifft(f_hats, n, tables=None):
+    '''
+    Inverse of fft_vec: f(g) = (1/n!) sum_lambda d_lambda Trace(rho_lambda(g^{-1}) f_hat_lambda),
+    evaluated at every g in S_n at once by running the subgroup chain recursion in reverse.
+
+    f_hats: dict mapping partitions of n (or FerrersDiagrams) to fourier matrices. Missing irreps
+        are treated as zero.
+    n: integer
+    tables: (optional) output of fft_tables(n)
+
+    Returns: numpy array of length n!, indexed by perm_rank
+    '''
+    return ifft_batch({p: np.asarray(mat)[None] for p, mat in f_hats.items()}, n, tables)[0]
+
+def ifft_batch(f_hats, n, tables=None):
+    '''
+    Batched inverse fft. Going down from S_k to S_{k-1}, the fourier transform of the function
+    restricted to the coset c_k(i) S_{k-1} at mu is:
+        (1/k) sum_{lambda: mu in branch_down(lambda)} (d_lambda / d_mu) [rho_lambda(c_k(i))^T f_hat_lambda]_{mu block}
+
+    f_hats: dict mapping partitions of n (or FerrersDiagrams) to numpy arrays of shape (num functions, d, d).
+        Missing irreps are treated as zero.
+    n: integer
+    tables: (optional) output of fft_tables(n)
+
+    Returns: numpy array of shape (num functions, n!), indexed by perm_rank along the last axis
+    '''
+    if tables is None:
+        tables = fft_tables(n)
+    f_hats = {getattr(p, 'partition', p): np.asarray(mat) for p, mat in f_hats.items()}
+    nfuncs = len(next(iter(f_hats.values())))
+    dtype = np.result_type(np.float64, *[mat.dtype for mat in f_hats.values()])
+
+    for k in range(n, 1, -1):
+        _, irreps = tables[k]
+        m = nfuncs * math.factorial(n) // math.factorial(k)
+        sub_hats = {}
+        for p, branches, rhos in irreps:
+            if p not in f_hats:
+                continue
+            f_hat = f_hats[p]
+            d = f_hat.shape[1]
+            idx = 0
+            for b in branches:
+                db = n_tabs(b)
+                if b not in sub_hats:
+                    sub_hats[b] = np.zeros((m * k, db, db), dtype=dtype)
+
+                # stack rho_i[:, block]^T for every coset i and apply to all m transforms at once
+                rho_b = np.concatenate([rho[:, idx: idx+db].T for rho in rhos], axis=0)
+                blk = f_hat[:, :, idx: idx+db].transpose(1, 0, 2).reshape(d, m * db)
+                res = rho_b.dot(blk).reshape(k, db, m, db).transpose(2, 0, 1, 3).reshape(m * k, db, db)
+                sub_hats[b] += (d / (k * db)) * res
+                idx += db
+        f_hats = sub_hats
+
+    if (1,) not in f_hats:
+        return np.zeros((nfuncs, math.factorial(n)), dtype=dtype)
+    fs = np.empty((nfuncs, math.factorial(n)), dtype=dtype)
+    fs[:, fft_order(n)] = f_hats[(1,)].reshape(nfuncs, -1)
+    return fs
+
 def fft2(f, ferrers):
     if ferrers.size == 1:
         #return np.eye(1) * f(Perm([(1, )]))
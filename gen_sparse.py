@@ -9,7 +9,7 @@ import torch.nn
 import glob
 from tqdm import tqdm
 from utils import load_sparse_pkl, load_pkl, check_memory, partition_parts
-from wreath import get_mat
+from wreath import get_mat, InducedRepTable
 
 def convert_idx(idx, in_cols, out_cols):
     '''
@@ -32,29 +32,19 @@ def block_indices(idx, bs):
     x, y = idx
     return [(x*bs + i, y*bs + j) for i in range(bs) for j in range(bs)]
 
-def to_block_sparse(mat_dict, outshape=None):
-    ncosets = len(list(mat_dict.keys()))
-    mat_0 = list(mat_dict.values())[0]
-    bs = mat_0.shape[0]
-    in_cols = ncosets * bs
-
-    if outshape is None:
-        out_cols = (ncosets * bs)**2
-    else:
-        out_cols = outshape[1]
-
-    idxs = []
-    vals_re = []
-
-    for idx, mat in mat_dict.items():
-        indices = [convert_idx(i, in_cols, out_cols) for i in block_indices(idx, bs)]
-        idxs.extend(indices)
-        vals_re = np.concatenate((vals_re, mat.real.ravel()))
-
-    torch_i = torch.LongTensor(idxs).t()
-    torch_v_re = torch.FloatTensor(vals_re)
-    size = (bs**2 * ncosets**2 // out_cols, out_cols)
-    return torch_i, torch_v_re, size
+def to_block_sparse(rep, outshape=None):
+    '''
+    rep: wreath.InducedRep
+    outshape: (optional) shape of the output, defaults to the flattened (1, D^2) matrix
+    Returns: tuple of torch indices, torch real values and the size of the sparse tensor
+    '''
+    size = rep.shape[0]
+    out_cols = size ** 2 if outshape is None else outshape[1]
+    coo = rep.to_csr().tocoo()
+    flat = coo.row.astype(np.int64) * size + coo.col
+    torch_i = torch.from_numpy(np.stack([flat // out_cols, flat % out_cols]))
+    torch_v_re = torch.FloatTensor(coo.data.real)
+    return torch_i, torch_v_re, (size ** 2 // out_cols, out_cols)
 
 def gen_th_pkl(np_pkl, th_pkl):
     if os.path.exists(th_pkl):
@@ -76,13 +66,16 @@ def gen_th_pkl(np_pkl, th_pkl):
     print('trying to open: {}'.format(np_pkl))
     with open(np_pkl, 'rb') as f:
         ydict = pickle.load(f)
+    # shares the young subgroup blocks, so the dict can be freed before building the output
+    table = InducedRepTable.from_block_dict(ydict)
+    del ydict
 
     check_memory()
     print('after loading {}'.format(np_pkl))
 
     sparse_tdict = {}
-    for perm_tup, rep_dict in tqdm(ydict.items()):
-        idx, vreal, size = to_block_sparse(rep_dict)
+    for perm_tup in tqdm(table.keys()):
+        idx, vreal, size = to_block_sparse(table[perm_tup])
         sparse_tdict[perm_tup] = {
             'idx': idx,
             'real': vreal,
@@ -90,7 +83,7 @@ def gen_th_pkl(np_pkl, th_pkl):
 
     check_memory()
     print('making the sparse dict loading {}'.format(th_pkl))
-    del ydict
+    del table
 
     # hacky way to assign this
     sparse_tdict['size'] = size
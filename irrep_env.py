@@ -9,6 +9,7 @@ import pandas as pd
 from str_cube import *
 from cube_env import CubeEnv
 from cube_irrep import Cube2Irrep
+from cube_table import load_table, state_index
 from utils import check_memory
 import numpy as np
 import torch
@@ -28,7 +29,12 @@ class Cube2IrrepEnv(CubeEnv):
         self.parts = parts
         self.sparse = sparse
         self._cubeirrep = Cube2Irrep(alpha, parts, numpy=numpy, sparse=sparse)
-        if os.path.exists('/local/hopan/cube/cube_sym_mod.pkl'):
+        self._dense_dists = None
+        table = load_table('/local/hopan/cube/') or load_table('/scratch/hopan/cube/')
+        if table is not None:
+            # uint8 array indexed by state_index, much smaller than the pickled dict
+            self._dense_dists = table.dense_dists()
+        elif os.path.exists('/local/hopan/cube/cube_sym_mod.pkl'):
             self._distances = pickle.load(open('/local/hopan/cube/cube_sym_mod.pkl', 'rb'))
         elif os.path.exists('/scratch/hopan/cube/cube_sym_mod.pkl'):
             self._distances = pickle.load(open('/scratch/hopan/cube/cube_sym_mod.pkl', 'rb'))
@@ -117,6 +123,9 @@ class Cube2IrrepEnv(CubeEnv):
         return xr, xi
 
     def distance(self, cube):
+        if self._dense_dists is not None:
+            otup, ptup = get_wreath(cube)
+            return int(self._dense_dists[state_index(otup, ptup)])
         return self._distances[cube]
 
     def random_states(self, dist, size, str_rep=True):
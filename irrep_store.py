@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import math
+import pickle
+import numpy as np
+from perm2 import Perm2, TupPerm, tup_rank, tup_unrank, perm_rank
+from young_tableau import FerrersDiagram
+
+'''
+On disk format for the irrep matrices of all of S_n for one partition.
+
+The file is a small header followed by one contiguous (n!, d, d) array where
+row i holds the matrix of the permutation of perm_rank i. The header is:
+    MAGIC (8 bytes) | header length (uint32, little endian) | json header
+padded so that the matrix data starts at a multiple of ALIGN bytes. The data
+is opened with np.memmap so loading is O(1) and all processes on a node that
+open the same file share the page cache.
+'''
+MAGIC = b'SNIRREP1'
+ALIGN = 64
+IRREP_EXT = '.irr'
+
+def irrep_store_path(prefix, partition):
+    '''
+    prefix: directory holding the s_{n} subdirectories
+    partition: tuple of ints
+    Returns: file name of the store for the given partition
+    '''
+    n = sum(partition)
+    return os.path.join(prefix, 's_{}'.format(n), '_'.join(map(str, partition)) + IRREP_EXT)
+
+def _write_header(fname, partition, dim, dtype):
+    header = {
+        'partition': list(partition),
+        'n': sum(partition),
+        'dim': dim,
+        'dtype': np.dtype(dtype).str,
+        'order': 'perm_rank',
+    }
+    hbytes = json.dumps(header).encode()
+    offset = len(MAGIC) + 4 + len(hbytes)
+    offset += (-offset) % ALIGN
+    hbytes += b' ' * (offset - len(MAGIC) - 4 - len(hbytes))
+    with open(fname, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint32(len(hbytes)).tobytes())
+        f.write(hbytes)
+    return offset
+
+def _read_header(fname):
+    with open(fname, 'rb') as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError('{} is not an irrep store file'.format(fname))
+        hlen = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+        header = json.loads(f.read(hlen).decode())
+    header['offset'] = len(MAGIC) + 4 + hlen
+    return header
+
+def write_irrep_store(fname, partition, dim, items, dtype=np.float64):
+    '''
+    Write the irrep matrices of all of S_n to an irrep store file.
+    fname: file name
+    partition: tuple of ints
+    dim: int, dimension of the irrep
+    items: iterable of (perm tuple, d x d numpy matrix) pairs that covers all of S_n
+    dtype: numpy dtype of the stored matrices
+    Returns: IrrepStore opened read only
+    '''
+    n = sum(partition)
+    offset = _write_header(fname, partition, dim, dtype)
+    mats = np.memmap(fname, dtype=dtype, mode='r+', offset=offset,
+                     shape=(math.factorial(n), dim, dim))
+    for tup, mat in items:
+        mats[tup_rank(tup)] = mat
+    mats.flush()
+    del mats
+    return IrrepStore(fname)
+
+def convert_yor_pickle(pkl_fname, fname, partition, dtype=np.float64):
+    '''
+    Convert a (possibly chunked) pickle of {perm tuple: matrix} dicts to an irrep store.
+    pkl_fname: file name of the pickle
+    fname: file name of the irrep store
+    partition: tuple of ints
+    '''
+    def _items():
+        with open(pkl_fname, 'rb') as f:
+            while True:
+                try:
+                    chunk = pickle.load(f)
+                except EOFError:
+                    break
+                for tup, mat in chunk.items():
+                    yield tup, mat
+
+    dim = FerrersDiagram.from_partition(partition).n_tabs()
+    return write_irrep_store(fname, partition, dim, _items(), dtype)
+
+class IrrepStore:
+    '''
+    Read only view of an irrep store file. Behaves like the {perm tuple: matrix}
+    dicts returned by load_yor, so it can be passed to code that expects those.
+    '''
+    def __init__(self, fname):
+        header = _read_header(fname)
+        self.fname = fname
+        self.partition = tuple(header['partition'])
+        self.n = header['n']
+        self.dim = header['dim']
+        self.mats = np.memmap(fname, dtype=np.dtype(header['dtype']), mode='r',
+                              offset=header['offset'],
+                              shape=(math.factorial(self.n), self.dim, self.dim))
+
+    def __len__(self):
+        return self.mats.shape[0]
+
+    def __contains__(self, perm):
+        if isinstance(perm, (Perm2, TupPerm)):
+            perm = perm.tup_rep
+        try:
+            return len(perm) == self.n and sorted(perm) == list(range(1, self.n + 1))
+        except TypeError:
+            return False
+
+    def __getitem__(self, perm):
+        '''
+        perm: perm tuple, Perm2 or TupPerm
+        Returns: d x d numpy matrix
+        '''
+        if isinstance(perm, (Perm2, TupPerm)):
+            perm = perm.tup_rep
+        return self.mats[tup_rank(perm)]
+
+    def get(self, perm, default=None):
+        '''
+        dict.get: the matrix of perm, or default if perm is not a permutation of 1..n
+        '''
+        return self[perm] if perm in self else default
+
+    def take(self, perms):
+        '''
+        Batched lookup. Copies the k matrices out of the memmap, see weighted_sum to
+        sum over all of S_n without doing so.
+        perms: numpy array of shape (k, n) or list of perm tuples
+        Returns: numpy array of shape (k, d, d)
+        '''
+        return self.mats[perm_rank(np.asarray(perms, dtype=np.uint8))]
+
+    def weighted_sum(self, coefs, chunk_mb=64):
+        '''
+        Sum of coefs[r] * mats[r] over all ranks r, streamed over the memmap in rank
+        order so at most chunk_mb megabytes of matrices are read in at a time.
+        coefs: numpy array of length n! indexed by perm_rank
+        chunk_mb: memory budget in megabytes of each chunk of matrices
+        Returns: d x d numpy matrix
+        '''
+        rows = max(1, int(chunk_mb * 2**20) // (self.dim * self.dim * self.mats.dtype.itemsize))
+        total = np.zeros((self.dim, self.dim), dtype=np.result_type(coefs, self.mats.dtype))
+        for st in range(0, len(self), rows):
+            total += np.tensordot(coefs[st: st + rows], self.mats[st: st + rows], axes=1)
+        return total
+
+    def keys(self):
+        for i in range(len(self)):
+            yield tup_unrank(i, self.n)
+
+    def items(self):
+        for i in range(len(self)):
+            yield tup_unrank(i, self.n), self.mats[i]
+
+    def to_dict(self):
+        return dict(self.items())
+
+def convert_dir(pkl_dir):
+    '''
+    Convert every {partition}.pkl file in pkl_dir to an irrep store in the same directory.
+    '''
+    for fname in sorted(os.listdir(pkl_dir)):
+        if not fname.endswith('.pkl'):
+            continue
+        # files are named either 4_3_1.pkl or (4, 3, 1).pkl
+        name = fname[:-len('.pkl')]
+        partition = tuple(int(i) for i in name.strip('()').replace(',', ' ').replace('_', ' ').split())
+        store_fname = irrep_store_path(os.path.dirname(os.path.normpath(pkl_dir)), partition)
+        if os.path.exists(store_fname):
+            print('Skipping {}'.format(partition))
+            continue
+        convert_yor_pickle(os.path.join(pkl_dir, fname), store_fname, partition)
+        print('Converted {}'.format(partition))
+
+if __name__ == '__main__':
+    convert_dir(sys.argv[1])
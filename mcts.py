@@ -14,6 +14,7 @@ from cube_env import CubeEnv
 from utils import get_logger, load_pkl
 import argparse
 from io_utils import get_prefix
+from batch_mcts import BatchMCTS, batch_solve
 
 np.set_printoptions(precision=5)
 '''
@@ -175,7 +176,33 @@ class MCTS(object):
             self.values[s][a] = max(value, self.values[s][a])
             self.visits[s][a] += 1
 
-def solve(state, model, env, log, time_limit=None, max_steps=None, coeff=1):
+class BatchCubeMCTS(BatchMCTS):
+    '''
+    MCTS that evaluates batch_size leaves per search with one model call (see batch_mcts).
+    '''
+    def __init__(self, root_state, model, env, coeff=1, batch_size=16, virtual_loss=1):
+        super(BatchCubeMCTS, self).__init__(root_state, env.action_space.n, coeff, batch_size, virtual_loss)
+        self.model = model
+        self.env = env
+        # the first 6 rows are the moves of neighbors_fixed_core_small, used by CubeEnv.neighbors
+        self.move_table = FIXEDCORE_TABLE[:self.nactions]
+
+    def expand(self, states):
+        nbrs = neighbors_batch(str_to_arr(states), self.move_table).reshape(-1, 24)
+        solved = is_solved_arr(nbrs).reshape(len(states), self.nactions)
+        nbr_strs = arr_to_str(nbrs)
+        return [nbr_strs[i: i + self.nactions] for i in range(0, len(nbr_strs), self.nactions)], solved
+
+    def evaluate(self, states):
+        if isinstance(self.model, NPModel):
+            return np.array([self.model.forward(s) for s in states])
+
+        with torch.no_grad():
+            r_th, i_th = self.env.encode_inv(states)
+            rv, _ = self.model.forward(r_th, i_th)
+        return rv.cpu().numpy()
+
+def solve(state, model, env, log, time_limit=None, max_steps=None, coeff=1, batch_size=1):
     '''
     state: cube state (currently this is a string)
     model: something that implements forward to compute values
@@ -184,7 +211,11 @@ def solve(state, model, env, log, time_limit=None, max_steps=None, coeff=1):
     time_limit: int seconds allowed to run
     max_steps: int number of nodes allowed to explore
     coeff: float, how much to weight exploration
+    batch_size: number of leaves to evaluate per model call. Values > 1 use BatchCubeMCTS.
     '''
+    if batch_size > 1:
+        return batch_solve(BatchCubeMCTS(state, model, env, coeff, batch_size), time_limit, max_steps)
+
     tree = MCTS(state, model, env, coeff)
     # number of steps == max
     nsteps = 0
@@ -221,6 +252,7 @@ def main():
     parser.add_argument('--parts', type=str)
     parser.add_argument('--seed', type=int, default=0)
     parser.add_argument('--coeff', type=float, default=1)
+    parser.add_argument('--batch_size', type=int, default=1)
     args = parser.parse_args()
 
     random.seed(args.seed)
@@ -261,7 +293,8 @@ def main():
     notsolved = []
 
     for c in cubes:
-        res, tree = solve(c, model, env, log, max_steps=args.max_steps, time_limit=args.time_limit, coeff=args.coeff)
+        res, tree = solve(c, model, env, log, max_steps=args.max_steps, time_limit=args.time_limit, coeff=args.coeff,
+                          batch_size=args.batch_size)
         pdb.set_trace()
         if res is None:
             log.info('Unable to solve: {} | total explored: {}'.format(c, tree.nexplored))
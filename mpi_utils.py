@@ -0,0 +1,273 @@
+import os
+import time
+import queue
+import threading
+from collections import defaultdict
+import numpy as np
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+'''
+Helpers for splitting the cube FT/IFT jobs across MPI ranks and combining the results.
+Everything takes a communicator so it can be run with mpiexec or, for local testing,
+with FakeComm ranks running as threads in one process (see run_fake).
+'''
+
+class _FakeInPlace:
+    pass
+
+FAKE_IN_PLACE = _FakeInPlace()
+
+class FakeCommGroup:
+    '''
+    Shared state of a group of FakeComms: one message queue per (source, dest, tag)
+    '''
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.barrier = threading.Barrier(size)
+        self.mailboxes = defaultdict(queue.Queue)
+
+    def mailbox(self, source, dest, tag):
+        with self.lock:
+            return self.mailboxes[(source, dest, tag)]
+
+class FakeComm:
+    '''
+    Stand in for an mpi4py communicator, supporting the calls used in this repo.
+    Each rank is a thread in the same process.
+    '''
+    def __init__(self, group=None, rank=0):
+        self.group = FakeCommGroup(1) if group is None else group
+        self.rank = rank
+
+    def Get_rank(self):
+        return self.rank
+
+    def Get_size(self):
+        return self.group.size
+
+    def Barrier(self):
+        self.group.barrier.wait()
+
+    def Send(self, buf, dest, tag=0):
+        self.group.mailbox(self.rank, dest, tag).put(np.array(buf, copy=True))
+
+    def Recv(self, buf, source, tag=0):
+        buf[...] = self.group.mailbox(source, self.rank, tag).get()
+
+    def send(self, obj, dest, tag=0):
+        self.group.mailbox(self.rank, dest, tag).put(obj)
+
+    def recv(self, source, tag=0):
+        return self.group.mailbox(source, self.rank, tag).get()
+
+    def Bcast(self, buf, root=0):
+        if self.rank == root:
+            for r in range(self.Get_size()):
+                if r != root:
+                    self.Send(buf, r, tag=-1)
+        else:
+            self.Recv(buf, root, tag=-1)
+
+    def bcast(self, obj, root=0):
+        if self.rank == root:
+            for r in range(self.Get_size()):
+                if r != root:
+                    self.send(obj, r, tag=-2)
+            return obj
+        return self.recv(root, tag=-2)
+
+    def allgather(self, obj):
+        for r in range(self.Get_size()):
+            if r != self.rank:
+                self.send(obj, r, tag=-3)
+        return [obj if r == self.rank else self.recv(r, tag=-3) for r in range(self.Get_size())]
+
+    def Reduce(self, sendbuf, recvbuf, op=None, root=0):
+        # only sums are supported
+        if self.rank != root:
+            self.Send(sendbuf, root, tag=-4)
+            return
+        if sendbuf is not FAKE_IN_PLACE:
+            recvbuf[...] = sendbuf
+        tmp = np.empty_like(recvbuf)
+        for r in range(self.Get_size()):
+            if r != root:
+                self.Recv(tmp, r, tag=-4)
+                recvbuf += tmp
+
+    def Allreduce(self, sendbuf, recvbuf, op=None):
+        if sendbuf is FAKE_IN_PLACE:
+            sendbuf = recvbuf.copy()
+        self.Reduce(sendbuf, recvbuf, op, root=0)
+        self.Bcast(recvbuf, root=0)
+
+    def Gatherv(self, sendbuf, recvbuf, root=0):
+        if self.rank != root:
+            self.Send(sendbuf, root, tag=-5)
+            return
+        buf, counts = recvbuf
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        for r in range(self.Get_size()):
+            piece = buf[offsets[r]: offsets[r + 1]]
+            if r == root:
+                piece[...] = sendbuf
+            else:
+                self.Recv(piece, r, tag=-5)
+
+def run_fake(size, func, *args):
+    '''
+    Run func(comm, *args) on size FakeComm ranks, each in its own thread.
+    Returns: list of the return values of each rank
+    '''
+    group = FakeCommGroup(size)
+    results = [None] * size
+    errors = []
+    def _run(rank):
+        try:
+            results[rank] = func(FakeComm(group, rank), *args)
+        except Exception as e:
+            errors.append(e)
+            group.barrier.abort()
+
+    threads = [threading.Thread(target=_run, args=(r,)) for r in range(size)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return results
+
+# world size variables set by mpiexec/mpirun/srun for Open MPI, MPICH/Intel MPI and MVAPICH
+MPI_SIZE_VARS = ['OMPI_COMM_WORLD_SIZE', 'PMI_SIZE', 'MV2_COMM_WORLD_SIZE']
+
+def launched_size():
+    '''
+    Returns: number of ranks the MPI launcher started, 1 if the process was not started by one
+    '''
+    for var in MPI_SIZE_VARS:
+        if os.environ.get(var):
+            return int(os.environ[var])
+    return 1
+
+def get_comm():
+    '''
+    Returns: MPI.COMM_WORLD if mpi4py is available, otherwise a single rank FakeComm.
+    Raises RuntimeError if mpi4py is missing but the process was started as one of
+    several MPI ranks: every rank would otherwise do (and save) the whole job as rank 0.
+    '''
+    if MPI is None:
+        if launched_size() > 1:
+            raise RuntimeError('Started as one of {} MPI ranks but mpi4py is not installed'.format(launched_size()))
+        return FakeComm()
+    return MPI.COMM_WORLD
+
+def _in_place(comm):
+    return FAKE_IN_PLACE if isinstance(comm, FakeComm) else MPI.IN_PLACE
+
+def partition_rows(nrows, size, rank_weights=None, row_cost=None):
+    '''
+    Split the rows [0, nrows) into size contiguous pieces that cover every row.
+    nrows: int
+    size: number of ranks
+    rank_weights: (optional) array of length size of the relative speed of each rank.
+        Faster ranks get proportionally more work.
+    row_cost: (optional) array of length nrows of the cost of each row. Pieces are cut so
+        that each rank gets an equal share (or a rank_weights share) of the total cost.
+    Returns: numpy int64 array of length size + 1 of piece boundaries. Rank r owns rows
+        [bounds[r], bounds[r + 1]).
+    '''
+    if rank_weights is None:
+        rank_weights = np.ones(size)
+    shares = np.cumsum(rank_weights, dtype=np.float64)
+    shares /= shares[-1]
+
+    if row_cost is None:
+        # round the cumulative shares so the pieces always add up to exactly nrows
+        bounds = np.floor(shares * nrows + 0.5).astype(np.int64)
+        bounds[-1] = nrows
+        return np.concatenate([[0], bounds])
+
+    cum_cost = np.cumsum(row_cost, dtype=np.float64)
+    cuts = np.searchsorted(cum_cost, shares[:-1] * cum_cost[-1], side='right')
+    return np.concatenate([[0], cuts, [nrows]]).astype(np.int64)
+
+def measure_rank_weights(comm, func, ntrials=1):
+    '''
+    Time func() on every rank and share the measured speeds with all ranks.
+    func: function with no arguments that processes a fixed, representative probe of work
+    Returns: numpy array of length comm size of relative speeds (1 / elapsed time)
+    '''
+    start = time.time()
+    for _ in range(ntrials):
+        func()
+    elapsed = max(time.time() - start, 1e-9)
+    return 1. / np.array(comm.allgather(elapsed))
+
+def tree_reduce(comm, arr, root=0):
+    '''
+    Sum arr over all ranks with a binomial tree of point to point messages. Partial sums
+    are added into arr in place, so each rank only needs one extra receive buffer and no
+    rank ever holds more than two matrices.
+    Returns: the sum on root, None on the other ranks
+    '''
+    rank, size = comm.Get_rank(), comm.Get_size()
+    rel = (rank - root) % size
+    buf = None
+    step = 1
+    while step < size:
+        if rel % (2 * step) == 0:
+            src = rel + step
+            if src < size:
+                if buf is None:
+                    buf = np.empty_like(arr)
+                comm.Recv(buf, source=(src + root) % size, tag=step)
+                arr += buf
+        else:
+            comm.Send(arr, dest=(rel - step + root) % size, tag=step)
+            return None
+        step *= 2
+    return arr
+
+def reduce_sum(comm, arr, root=0, method='reduce'):
+    '''
+    Sum arr over all ranks.
+    comm: communicator
+    arr: numpy array, the same shape on every rank. It may be overwritten.
+    root: rank that receives the sum
+    method: 'reduce' (MPI Reduce, in place on root), 'allreduce' (every rank gets the sum)
+        or 'tree' (see tree_reduce)
+    Returns: the sum on root (on every rank for allreduce), None on the other ranks
+    '''
+    if method == 'tree':
+        return tree_reduce(comm, arr, root)
+    elif method == 'allreduce':
+        comm.Allreduce(_in_place(comm), arr)
+        return arr
+    elif method == 'reduce':
+        if comm.Get_rank() == root:
+            comm.Reduce(_in_place(comm), arr, root=root)
+            return arr
+        comm.Reduce(arr, None, root=root)
+        return None
+    raise ValueError('Unknown reduce method: {}'.format(method))
+
+def gather_rows(comm, arr, bounds, root=0):
+    '''
+    Gather the per rank pieces of a row indexed result (ex: inverse transform values)
+    with Gatherv, so the pieces can have different lengths.
+    arr: numpy array of length bounds[rank + 1] - bounds[rank]
+    bounds: boundaries returned by partition_rows
+    Returns: numpy array of length bounds[-1] on root, None on the other ranks
+    '''
+    counts = np.diff(bounds)
+    if comm.Get_rank() == root:
+        res = np.empty(bounds[-1], dtype=arr.dtype)
+        comm.Gatherv(arr, (res, counts), root=root)
+        return res
+    comm.Gatherv(arr, None, root=root)
+    return None
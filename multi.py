@@ -8,13 +8,16 @@ import time
 import pdb
 import numpy as np
 from multiprocessing import Pool, Manager
-from utils import tf, chunk, check_memory, load_pkl
-from wreath import cyclic_irreps, block_cyclic_irreps, wreath_rep
+from utils import tf, chunk, check_memory, load_pkl, cube2_irreps
+from wreath import cyclic_irreps, block_cyclic_irreps, wreath_rep, InducedRepTable
 from young_tableau import wreath_dim
-from perm2 import sn
-from coset_utils import young_subgroup_perm, coset_reps
+from perm2 import sn, PermArray, perm_rank, tup_unrank
+from coset_utils import young_subgroup_perm, coset_reps, young_coset_reps, young_coset_reps_arr
+from checkpoint import JobCheckpoints, checkpointed_call, ckpt_dir
 
 TWO_CUBE_SIZE = 88179840
+# blocks with fewer entries than this are accumulated in one batched update
+SMALL_BLOCK = 1024
 def clean_line(line):
     ostr, pstr, dist = line.strip().split(',')
     otup = tuple(map(int, ostr))
@@ -22,32 +25,360 @@ def clean_line(line):
     dist = int(dist)
     return otup, ptup, dist
 
-def mult_yor_block(irrep, scalar, block_scalars, save_dict):
-    for k in irrep.keys():
-        i, j = k
-        if k not in save_dict:
-            save_dict[k] = scalar * block_scalars[i] * irrep[k]
+class BlockAccumulator:
+    '''
+    Running sum of block monomial matrices. The sum is held in a preallocated
+    (n_cosets * block_size) x (n_cosets * block_size) complex matrix, viewed as an
+    (n_cosets, block_size, n_cosets, block_size) array so that block (i, j) is
+    mat4[i, :, j, :]. Adds are done in place, so there is no dict of blocks to
+    allocate and no conversion step at the end.
+    '''
+    def __init__(self, block_size, n_cosets, dtype=np.complex128):
+        self.block_size = block_size
+        self.n_cosets = n_cosets
+        self.mat = np.zeros((block_size * n_cosets, block_size * n_cosets), dtype=dtype)
+        self.mat4 = self.mat.reshape(n_cosets, block_size, n_cosets, block_size)
+        self._tmp = np.zeros((block_size, block_size), dtype=dtype)
+        # scratch space of the small block path of add, one entry per block of an irrep
+        self._rows = np.zeros(n_cosets, dtype=np.intp)
+        self._cols = np.zeros(n_cosets, dtype=np.intp)
+        self._coefs = np.zeros(n_cosets, dtype=dtype)
+        self._blocks = np.zeros((n_cosets, block_size, block_size), dtype=dtype)
+
+    def add(self, irrep, scalar=1, block_scalars=None):
+        '''
+        Add scalar * diag(block_scalars) * irrep.
+        irrep: dict of (i, j) -> block matrix with at most one block per block row
+        scalar: number
+        block_scalars: (optional) numpy array of length n_cosets
+        '''
+        if self.block_size * self.block_size < SMALL_BLOCK:
+            # python overhead dominates for small blocks, so gather the blocks into the
+            # scratch arrays and do all of them in one update
+            k = len(irrep)
+            for idx, ((i, j), block) in enumerate(irrep.items()):
+                self._rows[idx] = i
+                self._cols[idx] = j
+                self._blocks[idx] = block
+            rows, cols, coefs, blocks = self._rows[:k], self._cols[:k], self._coefs[:k], self._blocks[:k]
+            if block_scalars is None:
+                coefs.fill(scalar)
+            else:
+                np.take(block_scalars, rows, out=coefs)
+                coefs *= scalar
+            np.multiply(blocks, coefs[:, None, None], out=blocks)
+            np.add.at(self.mat4, (rows, slice(None), cols, slice(None)), blocks)
+            return
+
+        for (i, j), block in irrep.items():
+            c = scalar if block_scalars is None else scalar * block_scalars[i]
+            np.multiply(block, c, out=self._tmp)
+            target = self.mat4[i, :, j, :]
+            np.add(target, self._tmp, out=target)
+
+    def add_batch(self, irreps, coefs):
+        '''
+        Add many group elements with a single np.add.at.
+        irreps: list of K dicts of (i, j) -> block matrix
+        coefs: numpy array of shape (K, n_cosets), coefs[k, i] scales block row i of irreps[k]
+        '''
+        rows, cols, blocks, scales = [], [], [], []
+        for k, irrep in enumerate(irreps):
+            for (i, j), block in irrep.items():
+                rows.append(i)
+                cols.append(j)
+                blocks.append(block)
+                scales.append(coefs[k, i])
+        vals = np.array(scales)[:, None, None] * np.stack(blocks)
+        np.add.at(self.mat4, (np.array(rows), slice(None), np.array(cols), slice(None)), vals)
+
+    def add_table(self, table, ranks, coefs):
+        '''
+        Add group elements of an InducedRepTable with a single np.add.at.
+        table: wreath.InducedRepTable
+        ranks: numpy array of K perm ranks
+        coefs: numpy array of shape (K, n_cosets), coefs[k, i] scales block row i of element ranks[k]
+        '''
+        m = self.n_cosets
+        rows = np.broadcast_to(np.arange(m), (len(ranks), m)).ravel()
+        cols = table.cols[ranks].ravel()
+        vals = coefs.reshape(-1)[:, None, None] * table.blocks[table.block_idx[ranks].ravel()]
+        np.add.at(self.mat4, (rows, slice(None), cols, slice(None)), vals)
+
+    def to_matrix(self):
+        return self.mat
+
+def coset_size(alpha):
+    alpha_size = 1
+    for a in alpha:
+        alpha_size *= math.factorial(a)
+    return int(math.factorial(sum(alpha)) // alpha_size)
+
+def _group_by_perm(otups, ptups, dists):
+    '''
+    Sort a chunk of states by permutation.
+    Returns: tuple of (unique perm ranks, start index of each perm's run, sorted otups, sorted dists)
+    '''
+    ranks = perm_rank(ptups)
+    order = np.argsort(ranks, kind='stable')
+    ranks = ranks[order]
+    starts = np.flatnonzero(np.r_[True, ranks[1:] != ranks[:-1]])
+    return ranks[starts], starts, np.asarray(otups)[order], np.asarray(dists)[order]
+
+def _add_block_weights(weights, grouped, cos_idx, cyc_irrep_func):
+    uranks, starts, otups, vals = grouped
+    # row k, column i is the orientation of state k permuted by coset rep i
+    block_scalars = cyc_irrep_func(otups[:, cos_idx]) * vals[:, None]
+    weights[uranks] += np.add.reduceat(block_scalars, starts, axis=0)
+
+def perm_block_weights(otups, ptups, dists, cos_reps, cyc_irrep_func, weights=None, chunk_rows=2**16):
+    '''
+    Sum the block cyclic irreps of all the states that share a permutation.
+    Since rho(o, p) = diag(block_cyclic_irreps(o)) * Y(p), the transform of f is
+    sum_p diag(W[p]) * Y(p) where W[p] = sum_{o} f(o, p) * block_cyclic_irreps(o).
+    otups: numpy array of shape (N, n) of orientation tuples
+    ptups: numpy array of shape (N, n) of permutation tuples
+    dists: numpy array of length N of function values
+    cos_reps: PermArray of coset reps
+    cyc_irrep_func: function returned by wreath.cyclic_irreps
+    weights: (optional) numpy array of shape (n!, n_cosets) to accumulate into
+    chunk_rows: number of states to process at once
+    Returns: complex numpy array W of shape (n!, n_cosets), indexed by perm_rank
+    '''
+    n = ptups.shape[1]
+    if weights is None:
+        weights = np.zeros((math.factorial(n), len(cos_reps)), dtype=np.complex128)
+    cos_idx = cos_reps.perms.astype(np.intp) - 1
+
+    for st in range(0, len(ptups), chunk_rows):
+        grouped = _group_by_perm(otups[st: st + chunk_rows], ptups[st: st + chunk_rows], dists[st: st + chunk_rows])
+        _add_block_weights(weights, grouped, cos_idx, cyc_irrep_func)
+
+    return weights
+
+def block_chunk_rows(alpha, chunk_mb):
+    '''
+    Number of states perm_block_weights can process at once for the weak partition alpha
+    with chunk_mb megabytes of temporaries. Per state and coset rep, the chunk holds the
+    permuted orientation tuple (n bytes), its partial sums (8 bytes) and three complex
+    arrays (the cyclic irrep factors, their product and the scaled block scalars).
+    '''
+    n = sum(alpha)
+    return max(1, int(chunk_mb * 2**20) // (coset_size(alpha) * (n + 3 * 16 + 8)))
+
+def weights_mb(alpha):
+    '''
+    Memory in megabytes of the perm_block_weights array for the weak partition alpha
+    '''
+    return math.factorial(sum(alpha)) * coset_size(alpha) * np.dtype(np.complex128).itemsize / 2**20
+
+def plan_passes(irreps, max_mb):
+    '''
+    Split the irreps into groups that can be computed with one pass over the data each.
+    All irreps with the same alpha share one weight array, so the plan packs alphas
+    (largest first) into passes whose weight arrays fit in max_mb.
+    irreps: iterable of (alpha, parts) tuples
+    max_mb: memory budget in megabytes for the weight arrays of one pass
+    Returns: list of passes, each a dict mapping alpha -> list of parts
+    '''
+    by_alpha = {}
+    for alpha, parts in irreps:
+        by_alpha.setdefault(alpha, []).append(parts)
+
+    passes = []
+    pass_mb = []
+    for alpha in sorted(by_alpha, key=weights_mb, reverse=True):
+        mb = weights_mb(alpha)
+        for idx in range(len(passes)):
+            if pass_mb[idx] + mb <= max_mb:
+                passes[idx][alpha] = by_alpha[alpha]
+                pass_mb[idx] += mb
+                break
         else:
-            save_dict[k] += scalar * block_scalars[i] * irrep[k]
+            # alphas bigger than the budget get a pass to themselves
+            passes.append({alpha: by_alpha[alpha]})
+            pass_mb.append(mb)
 
-def convert_yor_matrix(irrep_dict, block_size, cosets):
+    return passes
+
+def multi_perm_block_weights(chunks, alphas, chunk_mb=256):
     '''
-    Alternative:
-        compute block size via young_tableau(parts)
-        compute cosets via (8!) / (alpha!)
+    Compute the perm_block_weights of several alphas with a single pass over the data.
+    chunks: iterable of (otups, ptups, dists) array chunks
+    alphas: list of weak partitions
+    chunk_mb: memory budget in megabytes for the intermediate block scalars
+    Returns: dict mapping alpha -> weight array
     '''
-    shape = (block_size * cosets, block_size * cosets)
-    full_mat = np.zeros(shape, dtype=np.complex128)
+    n = sum(alphas[0])
+    cos_idx = {}
+    cyc_funcs = {}
+    weights = {}
+    for alpha in alphas:
+        cos_reps = young_coset_reps_arr(alpha)
+        cos_idx[alpha] = cos_reps.perms.astype(np.intp) - 1
+        cyc_funcs[alpha] = cyclic_irreps(alpha)
+        weights[alpha] = np.zeros((math.factorial(n), len(cos_reps)), dtype=np.complex128)
 
-    for tup_idx, mat in irrep_dict.items():
-        i, j = tup_idx
-        full_mat[block_size * i: block_size * (i+1), block_size * j : block_size * (j + 1)] = mat
+    sub_rows = min(block_chunk_rows(alpha, chunk_mb) for alpha in alphas)
+    for otups, ptups, dists in chunks:
+        for st in range(0, len(ptups), sub_rows):
+            grouped = _group_by_perm(otups[st: st + sub_rows], ptups[st: st + sub_rows], dists[st: st + sub_rows])
+            for alpha in alphas:
+                _add_block_weights(weights[alpha], grouped, cos_idx[alpha], cyc_funcs[alpha])
 
-    return full_mat
+    return weights
 
-def coset_size(alpha):
-    alpha_size = math.factorial(alpha[0]) * math.factorial(alpha[1]) * math.factorial(alpha[2])
-    return int(math.factorial(8) // alpha_size)
+def multi_irrep_transform(chunk_func, irreps, load_func, save_func, max_mb=4096, chunk_mb=256):
+    '''
+    Compute the wreath transforms of many irreps, reading the data once per pass
+    of plan_passes instead of once per irrep.
+    chunk_func: function with no arguments that returns an iterable of (otups, ptups, dists) chunks
+    irreps: iterable of (alpha, parts) tuples
+    load_func: function of (alpha, parts) that returns the irrep dict
+    save_func: function of (alpha, parts, matrix) called with each finished transform
+    max_mb: memory budget in megabytes for the weight arrays of one pass
+    chunk_mb: memory budget in megabytes for the intermediate block scalars
+    '''
+    passes = plan_passes(irreps, max_mb)
+    for idx, alpha_parts in enumerate(passes):
+        start = time.time()
+        weights = multi_perm_block_weights(chunk_func(), list(alpha_parts.keys()), chunk_mb)
+        print('Pass {} / {} | alphas: {} | data pass: {:.2f}s | mem: {:.2f}mb'.format(
+              idx + 1, len(passes), list(alpha_parts.keys()), time.time() - start, check_memory(verbose=False)))
+
+        for alpha, parts_lst in alpha_parts.items():
+            for parts in parts_lst:
+                irrep_dict = load_func(alpha, parts)
+                mat = weights_transform(weights[alpha], irrep_dict, wreath_dim(parts), coset_size(alpha))
+                save_func(alpha, parts, mat)
+                del irrep_dict
+            del weights[alpha]
+
+def weights_transform(weights, irrep_dict, block_size, n_cosets):
+    '''
+    Compute the wreath transform from the permutation grouped block weights.
+    weights: numpy array of shape (n!, n_cosets) as returned by perm_block_weights
+    irrep_dict: dict mapping perm tuple -> (dict of (i, j) -> block matrix) or an InducedRepTable
+    block_size: int, size of each block
+    n_cosets: int, number of cosets
+    Returns: numpy matrix of shape (block_size * n_cosets, block_size * n_cosets)
+    '''
+    acc = BlockAccumulator(block_size, n_cosets)
+    ranks = np.flatnonzero(np.any(weights != 0, axis=1))
+    if isinstance(irrep_dict, InducedRepTable):
+        # bound the size of the gathered blocks of one batch to ~64mb
+        batch = max(1, 2**22 // (n_cosets * block_size * block_size))
+        for st in range(0, len(ranks), batch):
+            acc.add_table(irrep_dict, ranks[st: st + batch], weights[ranks[st: st + batch]])
+        return acc.to_matrix()
+
+    n = len(next(iter(irrep_dict.keys())))
+    for r in ranks:
+        acc.add(irrep_dict[tup_unrank(int(r), n)], 1, weights[r])
+
+    return acc.to_matrix()
+
+def grouped_transform(otups, ptups, dists, irrep_dict, alpha, parts, chunk_rows=2**18):
+    '''
+    Wreath transform of a function on the 2x2 cube given as arrays of states.
+    Aggregates the orientations per permutation first so the block products are
+    done once per permutation instead of once per state.
+    otups: numpy array of shape (N, n), n = sum(alpha)
+    ptups: numpy array of shape (N, n)
+    dists: numpy array of length N
+    irrep_dict: dict mapping perm tuple -> (dict of (i, j) -> block matrix)
+    alpha: weak partition
+    parts: list/iterable of partitions of the parts of alpha
+    chunk_rows: number of states to process at once (see block_chunk_rows)
+    Returns: numpy matrix
+    '''
+    cos_reps = young_coset_reps_arr(alpha)
+    weights = perm_block_weights(otups, ptups, dists, cos_reps, cyclic_irreps(alpha),
+                                 chunk_rows=chunk_rows)
+    return weights_transform(weights, irrep_dict, wreath_dim(parts), len(cos_reps))
+
+def perm_block_traces(fhat, table, ranks):
+    '''
+    Inner products of the blocks of fhat with the blocks of the induced reps Y(p):
+        T[k, i] = sum(fhat_block(i, cols[p, i]) * conj(Y(p)_block(i, cols[p, i]))), p = ranks[k]
+    fhat: numpy matrix of shape (m * d, m * d)
+    table: InducedRepTable
+    ranks: numpy array of perm ranks
+    Returns: complex numpy array of shape (len(ranks), m)
+    '''
+    m, d = table.cols.shape[1], table.blocks.shape[1]
+    fhat4 = fhat.reshape(m, d, m, d)
+    # (k, m, d, d): block row i of fhat restricted to the block column of Y(p) in row i
+    fblocks = fhat4[np.arange(m)[None, :], :, table.cols[ranks], :]
+    yblocks = table.blocks[table.block_idx[ranks]]
+    return np.einsum('kiab,kiab->ki', fblocks, yblocks.conj())
+
+def grouped_inverse_transform(fhat, table, otups, alpha, out=None, chunk_mb=64):
+    '''
+    Evaluate the inverse transform term d_rho * trace(fhat rho(g^{-1})) at every state
+    (o, p) for the given orientations o and all permutations p.
+    Since rho(o, p) = diag(s(o)) * Y(p), with s(o) the block cyclic irreps, the term is
+    d_rho * sum_i conj(s_i(o)) * T[p, i] (see perm_block_traces). So all the states are one
+    (n_orient, m) x (m, n!) matrix product and no wreath matrix is ever built.
+    fhat: numpy matrix of shape (m * d, m * d), the fourier transform at the irrep
+    table: InducedRepTable of the irrep
+    otups: numpy array of shape (n_orient, n) of orientation tuples
+    alpha: weak partition
+    out: (optional) numpy array of shape (n_orient, n!) to add the values to. If it is
+        real, the real part of the values is added.
+    chunk_mb: memory in megabytes for the gathered fhat blocks of one batch of permutations
+    Returns: numpy array of shape (n_orient, n!) where entry (i, r) is the value at the
+        state (otups[i], perm_unrank(r))
+    '''
+    m, d = table.cols.shape[1], table.blocks.shape[1]
+    cos_idx = young_coset_reps_arr(alpha).perms.astype(np.intp) - 1
+    conj_scalars = fhat.shape[0] * np.conj(cyclic_irreps(alpha)(np.asarray(otups)[:, cos_idx]))
+    if out is None:
+        out = np.zeros((len(otups), len(table)), dtype=np.complex128)
+
+    real_out = np.isrealobj(out)
+    if real_out:
+        # Re(s * t) = [Re s, -Im s] . [Re t, Im t], one real product instead of a complex one
+        stacked_scalars = np.hstack([conj_scalars.real, -conj_scalars.imag])
+
+    batch = max(1, int(chunk_mb * 2**20) // (m * d * d * 16))
+    for st in range(0, len(table), batch):
+        ranks = np.arange(st, min(st + batch, len(table)))
+        traces = perm_block_traces(fhat, table, ranks)
+        if real_out:
+            out[:, st: st + len(ranks)] += stacked_scalars @ np.hstack([traces.real, traces.imag]).T
+        else:
+            out[:, st: st + len(ranks)] += conj_scalars @ traces.T
+    return out
+
+def load_split_arrays(fsplit_lst):
+    '''
+    fsplit_lst: list of split file names, each line of the form otup,ptup,dist
+    Returns: tuple of numpy arrays otups (N, 8), ptups (N, 8), dists (N,)
+    '''
+    otups, ptups, dists = [], [], []
+    for split_f in fsplit_lst:
+        with open(split_f, 'r') as f:
+            ostrs, pstrs, dstrs = zip(*(line.strip().split(',') for line in f))
+        otups.append(np.frombuffer(''.join(ostrs).encode(), dtype=np.uint8).reshape(-1, 8) - ord('0'))
+        ptups.append(np.frombuffer(''.join(pstrs).encode(), dtype=np.uint8).reshape(-1, 8) - ord('0'))
+        dists.append(np.array(dstrs, dtype=np.int64))
+    return np.concatenate(otups), np.concatenate(ptups), np.concatenate(dists)
+
+def grouped_split_transform(fsplit_lst, irrep_dict, alpha, parts, mem_dict=None, ckpt=None):
+    '''
+    Same as text_split_transform but using the permutation grouped transform.
+    The chunk is processed in one go, so ckpt only stores the finished result.
+    '''
+    def _transform():
+        otups, ptups, dists = load_split_arrays(fsplit_lst)
+        return grouped_transform(otups, ptups, dists, irrep_dict, alpha, parts)
+
+    mat = checkpointed_call(ckpt, _transform)
+    if mem_dict is not None:
+        pid = os.getpid()
+        mem_dict[pid] = max(check_memory(verbose=False), mem_dict.get(pid, 0))
+    return mat
 
 def split_transform(fsplit_lst, irrep_dict, alpha, parts, mem_dict=None):
     '''
@@ -57,8 +388,8 @@ def split_transform(fsplit_lst, irrep_dict, alpha, parts, mem_dict=None):
     parts: list/iterable of partitions of the parts of alpha
     '''
     print('     Computing transform on splits: {}'.format(fsplit_lst))
-    cos_reps = coset_reps(sn(8), young_subgroup_perm(alpha))
-    save_dict = {}
+    cos_reps = list(young_coset_reps(alpha))
+    acc = BlockAccumulator(wreath_dim(parts), coset_size(alpha))
     cyc_irrep_func = cyclic_irreps(alpha)
     pid = os.getpid()
 
@@ -71,44 +402,55 @@ def split_transform(fsplit_lst, irrep_dict, alpha, parts, mem_dict=None):
                     dist_tot = sum(dists)
                     perm_rep = irrep_dict[perm_tup]  # perm_rep is a dict of (i, j) -> matrix
                     block_cyclic_rep = block_cyclic_irreps(tup, cos_reps, cyc_irrep_func)
-                    mult_yor_block(perm_rep, dist_tot, block_cyclic_rep, save_dict)
+                    acc.add(perm_rep, dist_tot, block_cyclic_rep)
             if mem_dict is not None:
                 mem_dict[pid] = max(check_memory(verbose=False), mem_dict.get(pid, 0))
             del pkl_dict
 
-    block_size = wreath_dim(parts)
-    n_cosets = coset_size(alpha)
-    mat = convert_yor_matrix(save_dict, block_size, n_cosets)
-    return mat
+    return acc.to_matrix()
 
-def text_split_transform(fsplit_lst, irrep_dict, alpha, parts, mem_dict=None):
+def text_split_transform(fsplit_lst, irrep_dict, alpha, parts, mem_dict=None, ckpt=None):
     '''
     fsplit_pkl: list of split file names of the distance values for a chunk of the total distance values
     irrep_dict: irrep dict
     alpha: weak partition
     parts: list/iterable of partitions of the parts of alpha
+    ckpt: (optional) Checkpoint of this chunk. The partial sum is checkpointed every so many
+        lines and a restarted job skips the lines that were already added.
     '''
     print('     Computing transform on splits: {}'.format(fsplit_lst))
-    cos_reps = coset_reps(sn(8), young_subgroup_perm(alpha))
-    save_dict = {}
+    cos_reps = list(young_coset_reps(alpha))
+    acc = BlockAccumulator(wreath_dim(parts), coset_size(alpha))
     cyc_irrep_func = cyclic_irreps(alpha)
     pid = os.getpid()
 
+    start_line = 0
+    if ckpt is not None:
+        state = ckpt.load()
+        if state is not None and state[1]:
+            return state[2]
+        start_line = ckpt.resume(0, acc.mat)
+
+    line_idx = 0
     for split_f in fsplit_lst:
         with open(split_f, 'r') as f:
             for line in tqdm(f):
+                line_idx += 1
+                if line_idx <= start_line:
+                    continue
                 otup, perm_tup, dist  = clean_line(line)
                 perm_rep = irrep_dict[perm_tup]  # perm_rep is a dict of (i, j) -> matrix
                 block_cyclic_rep = block_cyclic_irreps(otup, cos_reps, cyc_irrep_func)
-                mult_yor_block(perm_rep, dist, block_cyclic_rep, save_dict)
+                acc.add(perm_rep, dist, block_cyclic_rep)
+                if ckpt is not None:
+                    ckpt.maybe_save(line_idx, acc.mat)
 
         if mem_dict is not None:
             mem_dict[pid] = max(check_memory(verbose=False), mem_dict.get(pid, 0))
 
-    block_size = wreath_dim(parts)
-    n_cosets = coset_size(alpha)
-    mat = convert_yor_matrix(save_dict, block_size, n_cosets)
-    return mat
+    if ckpt is not None:
+        ckpt.save(line_idx, acc.mat, done=True)
+    return acc.to_matrix()
 
 
 def full_transform(args, alpha, parts, split_chunks):
@@ -128,12 +470,21 @@ def full_transform(args, alpha, parts, split_chunks):
         print('Making: {}'.format(savedir_alpha))
         os.makedirs(savedir_alpha)
 
+    # one checkpoint per chunk of split files, finished chunks are loaded instead of recomputed
+    job_ckpt = None
+    chunk_ckpts = [None] * len(split_chunks)
+    if args.ckpt_rows or args.ckpt_mins:
+        job_ckpt = JobCheckpoints(ckpt_dir(savename), args.ckpt_rows, args.ckpt_mins * 60 if args.ckpt_mins else None)
+        chunk_ckpts = [job_ckpt.chunk('chunk_{}'.format(i), key=','.join(os.path.basename(f) for f in _fn))
+                       for i, _fn in enumerate(split_chunks)]
+
+    transform_func = grouped_split_transform if args.grouped else text_split_transform
     if args.par > 1:
         print('Par process with {} processes...'.format(len(split_chunks)))
         mem_dict = manager.dict()
         with Pool(len(split_chunks)) as p:
-            arg_tups = [(_fn, irrep_dict, alpha, parts, mem_dict) for _fn in split_chunks]
-            matrices = p.starmap(text_split_transform, arg_tups)
+            arg_tups = [(_fn, irrep_dict, alpha, parts, mem_dict, _ck) for _fn, _ck in zip(split_chunks, chunk_ckpts)]
+            matrices = p.starmap(transform_func, arg_tups)
             np.save(savename, sum(matrices))
     else:
         print('Single thread...')
@@ -143,18 +494,44 @@ def full_transform(args, alpha, parts, split_chunks):
         shape = (block_size * n_cosets, block_size * n_cosets)
         result = np.zeros(shape, dtype=np.complex128)
         mem_dict = {}
-        for _fn in split_chunks:
-            res = text_split_transform(_fn, irrep_dict, alpha, parts)
+        for _fn, _ck in zip(split_chunks, chunk_ckpts):
+            res = transform_func(_fn, irrep_dict, alpha, parts, None, _ck)
             matrices.append(res)
             result += res
         np.save(savename, sum(matrices))
 
+    if job_ckpt is not None:
+        job_ckpt.cleanup()
+
     print('Post loading pickle mem usg: {:.4}mb | Final mem usg: {:.4f}mb'.format(mem_usg, check_memory(False)))
     print('Processes')
     for pid, usg in mem_dict.items():
         print('{} | {:.4f}mb'.format(pid, usg))
     print('Done!')
 
+def all_transform(args, split_files):
+    '''
+    Compute the transforms of all the irreps of the 2x2 cube that have not been saved yet,
+    reading the split files once per pass of plan_passes.
+    '''
+    def chunk_func():
+        for split_f in split_files:
+            yield load_split_arrays([split_f])
+
+    def load_func(alpha, parts):
+        return load_pkl(os.path.join(args.pkldir, str(alpha), '{}.pkl'.format(parts)))
+
+    def save_func(alpha, parts, mat):
+        savedir_alpha = os.path.join(args.savedir, str(alpha))
+        if not os.path.exists(savedir_alpha):
+            os.makedirs(savedir_alpha)
+        np.save(os.path.join(savedir_alpha, '{}'.format(parts)), mat)
+
+    irreps = [(alpha, parts) for alpha, parts in cube2_irreps()
+              if not os.path.exists(os.path.join(args.savedir, str(alpha), '{}.npy'.format(parts)))]
+    print('Computing {} irreps'.format(len(irreps)))
+    multi_irrep_transform(chunk_func, irreps, load_func, save_func, max_mb=args.max_mb)
+
 def main(args):
     print('args: {}'.format(args))
     print('split dir: {}'.format(args.splitdir))
@@ -164,7 +541,11 @@ def main(args):
 
     if not os.path.exists(args.savedir):
         os.makedirs(args.savedir)
-    split_files = [os.path.join(args.splitdir, f) for f in os.listdir(args.splitdir) if args.suffix in f]
+    # sorted so that restarts split the files into the same checkpointed chunks
+    split_files = sorted(os.path.join(args.splitdir, f) for f in os.listdir(args.splitdir) if args.suffix in f)
+    if args.all:
+        all_transform(args, split_files)
+        return
     split_chunks = chunk(split_files, args.par)
     parts = ast.literal_eval(args.parts)
     alpha = ast.literal_eval(args.alpha)
@@ -189,5 +570,10 @@ if __name__ == '__main__':
     parser.add_argument('--parts', type=str, default='((7,1),(),())')
     parser.add_argument('--par', type=int, default=1, help='Amount of parallelism')
     parser.add_argument('--suffix', type=str, default='split', help='special suffix for split files')
+    parser.add_argument('--grouped', action='store_true', help='aggregate orientations per permutation first')
+    parser.add_argument('--all', action='store_true', help='compute every cube irrep with as few data passes as possible')
+    parser.add_argument('--max_mb', type=int, default=4096, help='memory budget for the weights of one pass')
+    parser.add_argument('--ckpt_rows', type=int, default=None, help='checkpoint every this many rows (off by default)')
+    parser.add_argument('--ckpt_mins', type=float, default=None, help='checkpoint every this many minutes (off by default)')
     args = parser.parse_args()
     tf(main, [args])
@@ -1,3 +1,4 @@
+import math
 import numpy as np
 import sys
 import pdb
@@ -136,6 +137,8 @@ class Perm2:
         return str(self.cycle_decomposition)
 
     def __mul__(self, other):
+        if isinstance(other, PermArray):
+            return NotImplemented
         g = self.tup_rep
         h = other.tup_rep
         if self.size != other.size:
@@ -158,6 +161,9 @@ class Perm2:
     def __eq__(self, other):
         return isinstance(self, type(other)) and self.tup_rep == other.tup_rep
 
+    def rank(self):
+        return tup_rank(self.tup_rep)
+
     def _cycle_decomposition(self):
         cyc_decomp = []
         curr_cycle = []
@@ -211,6 +217,192 @@ class Perm2:
     def set_id(self, _id):
         self._id = _id
  
+class TupPerm:
+    '''
+    Lightweight permutation backed by its tuple representation. Has the same interface as
+    Perm2, but the cycle decomposition is computed lazily and it does not register itself
+    in SN_CACHE, so making lots of them is cheap.
+    '''
+    __slots__ = ['tup_rep', '_cyc_decomp', '_id']
+
+    def __init__(self, tup):
+        self.tup_rep = tuple(tup)
+        self._cyc_decomp = None
+        self._id = None
+
+    @staticmethod
+    def from_tup(tup):
+        return TupPerm(tup)
+
+    @staticmethod
+    def eye(size):
+        return TupPerm(range(1, size + 1))
+
+    @property
+    def size(self):
+        return len(self.tup_rep)
+
+    @property
+    def cycle_decomposition(self):
+        if self._cyc_decomp is None:
+            self._cyc_decomp = []
+            seen = set()
+            for i in range(1, self.size + 1):
+                cyc = []
+                curr = i
+                while curr not in seen:
+                    seen.add(curr)
+                    cyc.append(curr)
+                    curr = self.tup_rep[curr - 1]
+                if len(cyc) > 1:
+                    self._cyc_decomp.append(cyc)
+        return self._cyc_decomp
+
+    def __call__(self, x):
+        return self.tup_rep[x - 1] if 0 < x <= self.size else x
+
+    def __getitem__(self, x):
+        return self.tup_rep[x - 1] if 0 < x <= self.size else x
+
+    def __repr__(self):
+        return str(self.cycle_decomposition)
+
+    def __mul__(self, other):
+        if isinstance(other, PermArray):
+            return NotImplemented
+        g = self.tup_rep
+        h = other.tup_rep
+        if len(g) != len(h):
+            raise Exception('Currently cant mult two perms of diff sizes!')
+        return TupPerm(g[i - 1] for i in h)
+
+    def __len__(self):
+        return self.size
+
+    def __hash__(self):
+        return hash(self.tup_rep)
+
+    def __eq__(self, other):
+        return isinstance(other, (TupPerm, Perm2)) and self.tup_rep == other.tup_rep
+
+    def to_tup(self):
+        return self.tup_rep
+
+    def rank(self):
+        return tup_rank(self.tup_rep)
+
+    def inv(self):
+        rev_lst = [0] * self.size
+        for idx, v in enumerate(self.tup_rep):
+            rev_lst[v - 1] = idx + 1
+        return TupPerm(rev_lst)
+
+    @property
+    def id(self):
+        return self._id
+
+    def set_id(self, _id):
+        self._id = _id
+
+class PermArray:
+    '''
+    Container for many permutations of S_n stored as one (k, n) uint8 numpy array of their
+    tuple representations. Group operations are vectorized over all k permutations.
+    '''
+    def __init__(self, perms):
+        '''
+        perms: numpy array (or nested list) of shape (k, n) or (n,) of permutation tuples
+        '''
+        perms = np.asarray(perms, dtype=np.uint8)
+        self.perms = perms.reshape(-1, perms.shape[-1])
+
+    @staticmethod
+    def from_perms(perms):
+        '''
+        perms: iterable of Perm2/TupPerm objects
+        '''
+        return PermArray([p.tup_rep for p in perms])
+
+    @staticmethod
+    def unrank(ranks, n):
+        return PermArray(perm_unrank(ranks, n))
+
+    @staticmethod
+    def sn(n):
+        '''
+        Returns all of S_n in perm_rank order (the same order as sn(n))
+        '''
+        return PermArray.unrank(np.arange(math.factorial(n)), n)
+
+    @staticmethod
+    def eye(n, k=1):
+        return PermArray(np.tile(np.arange(1, n + 1), (k, 1)))
+
+    @property
+    def size(self):
+        return self.perms.shape[1]
+
+    def __len__(self):
+        return self.perms.shape[0]
+
+    def __iter__(self):
+        for p in self.perms:
+            yield TupPerm(p.tolist())
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            return TupPerm(self.perms[idx].tolist())
+        return PermArray(self.perms[idx])
+
+    def __repr__(self):
+        return 'PermArray({} perms of S_{})'.format(len(self), self.size)
+
+    def __mul__(self, other):
+        '''
+        Elementwise composition (self[i] * other[i])(x) = self[i](other[i](x)).
+        Either side can also be a single permutation, which gets broadcast.
+        '''
+        g = self.perms
+        h = other.perms if isinstance(other, PermArray) else np.asarray([other.tup_rep], dtype=np.uint8)
+        h_idx = h.astype(np.intp) - 1
+        if len(g) == 1:
+            return PermArray(g[0][h_idx])
+        elif len(h) == 1:
+            return PermArray(g[:, h_idx[0]])
+        return PermArray(np.take_along_axis(g, h_idx, axis=1))
+
+    def __rmul__(self, other):
+        return PermArray([other.tup_rep]) * self
+
+    def inv(self):
+        return PermArray(np.argsort(self.perms, axis=1) + 1)
+
+    def rank(self):
+        return perm_rank(self.perms)
+
+    def tup_reps(self):
+        return [tuple(p) for p in self.perms.tolist()]
+
+    def cycle_type(self):
+        '''
+        Returns: int numpy array of shape (k, n), where entry [i, l-1] is the number of cycles
+            of length l in permutation i
+        '''
+        idx = self.perms.astype(np.intp) - 1
+        k, n = idx.shape
+        rows = np.arange(k)[:, None]
+        start = np.arange(n)[None, :]
+        lengths = np.zeros((k, n), dtype=np.intp)
+        curr = idx
+        for step in range(1, n + 1):
+            lengths[(curr == start) & (lengths == 0)] = step
+            curr = idx[rows, curr]
+
+        counts = np.zeros((k, n), dtype=np.intp)
+        for l in range(1, n + 1):
+            counts[:, l - 1] = (lengths == l).sum(axis=1) // l
+        return counts
+
 def sn(n, prefix='/local/hopan/'):
     # load mult table?
     if n in SN_CACHE and len(SN_CACHE[n]) == np.math.factorial(n):
@@ -260,6 +452,87 @@ def test():
     #print('Time for orginal perm 2nd time: {:.2f}'.format(end - start))
 '''
 
+def perm_rank(perms):
+    '''
+    Lexicographic (Lehmer code) rank of permutations. This is the order that
+    itertools.permutations enumerates S_n in, so perm_rank(sn(n)[i].tup_rep) == i.
+    perms: numpy array (or tuple/list) of shape (n,) or (k, n), permutations in tuple form
+        with values in 1, ..., n
+    Returns: int numpy array of shape () or (k,)
+    '''
+    perms = np.asarray(perms)
+    n = perms.shape[-1]
+    ranks = np.zeros(perms.shape[:-1], dtype=np.int64)
+    for j in range(n - 1):
+        smaller = (perms[..., j+1:] < perms[..., j:j+1]).sum(axis=-1)
+        ranks += smaller * math.factorial(n - 1 - j)
+    return ranks
+
+def tup_rank(tup):
+    '''
+    Scalar perm_rank for a single permutation tuple. Pure python since this is
+    faster than going through numpy for one permutation.
+    tup: tuple of ints
+    Returns: int
+    '''
+    n = len(tup)
+    rank = 0
+    for j in range(n - 1):
+        x = tup[j]
+        smaller = 0
+        for y in tup[j+1:]:
+            if y < x:
+                smaller += 1
+        rank = rank * (n - j) + smaller
+    return rank
+
+def tup_unrank(rank, n):
+    '''
+    Scalar perm_unrank.
+    rank: int in [0, n!)
+    n: integer
+    Returns: tuple of ints
+    '''
+    remaining = list(range(1, n + 1))
+    tup = []
+    for j in range(n):
+        f = math.factorial(n - 1 - j)
+        tup.append(remaining.pop(rank // f))
+        rank %= f
+    return tuple(tup)
+
+def rank_array(perm_tups, vals, fill=0, dtype=None):
+    '''
+    Store values indexed by permutation in a flat array addressed by perm_rank.
+    perm_tups: numpy array of shape (k, n) or list of permutation tuples
+    vals: array like of length k
+    fill: value for the permutations that are not in perm_tups
+    dtype: (optional) numpy dtype of the output
+    Returns: numpy array of length n!
+    '''
+    perm_tups = np.asarray(perm_tups, dtype=np.uint8)
+    vals = np.asarray(vals)
+    arr = np.full(math.factorial(perm_tups.shape[-1]), fill, dtype=vals.dtype if dtype is None else dtype)
+    arr[perm_rank(perm_tups)] = vals
+    return arr
+
+def perm_unrank(ranks, n):
+    '''
+    Inverse of perm_rank.
+    ranks: int or numpy array of ints in [0, n!)
+    n: integer
+    Returns: uint8 numpy array of shape (n,) or (k, n) of permutations in tuple form
+    '''
+    ranks = np.asarray(ranks, dtype=np.int64)
+    perms = np.zeros(ranks.shape + (n,), dtype=np.int64)
+    for j in range(n):
+        perms[..., j] = (ranks // math.factorial(n - 1 - j)) % (n - j)
+
+    # lehmer code -> permutation: each entry gets bumped past the values fixed to its left
+    for j in range(n - 2, -1, -1):
+        perms[..., j+1:] += (perms[..., j+1:] >= perms[..., j:j+1])
+    return (perms + 1).astype(np.uint8)
+
 def mult_table(n, inv_save, table_save):
     _sn = sn(n)
     table = np.zeros((len(_sn), len(_sn)), dtype=np.uint16)
@@ -7,7 +7,7 @@ import pickle
 sys.path.append('../')
 import numpy as np
 from wreath import young_subgroup_yor, wreath_yor_par, block_cyclic_irreps, dot_tup_inv, get_mat
-from coset_utils import tup_set, coset_reps, young_subgroup_perm, young_subgroup
+from coset_utils import tup_set, coset_reps, young_subgroup_perm, young_subgroup, young_coset_reps
 from perm2 import sn
 from utils import check_memory
 from px_utils import pyraminx_dists
@@ -35,13 +35,11 @@ def block_mult(yor_dict, block_scalars):
         res[k] = block * block_scalars[k[0]]
     return res
 
-def full_wreath_rep(alpha, parts, dist_dict, par=8):
-    s6 = sn(6)
-    s_alpha = young_subgroup_perm(alpha)
-    young_subgroup_reps = coset_reps(s6, s_alpha)
+def full_wreath_rep(alpha, parts, dist_dict):
+    young_subgroup_reps = list(young_coset_reps(alpha))
 
     cyc_func = cyc_irr_func(alpha)
-    yor_dict = wreath_yor_par(alpha, parts, prefix='/local/hopan/irreps/', par=par)
+    yor_dict = wreath_yor_par(alpha, parts, prefix='/local/hopan/irreps/')
 
     wreath_dict = {}
     for otup, ptup in dist_dict.keys():
@@ -64,7 +62,7 @@ def save_dict(alpha, parts, wreath_dict, prefix='/local/hopan/pyraminx/irreps'):
 if __name__ == '__main__':
     alpha = eval(sys.argv[1])
     parts = eval(sys.argv[2])
-    npar = int(sys.argv[3])
+    # sys.argv[3] used to be the number of processes of wreath_yor_par, it is ignored
     savedir = sys.argv[4]
 
     start = time.time()
@@ -72,7 +70,7 @@ if __name__ == '__main__':
     print('load dict time: {}'.format(time.time() - start))
 
     start = time.time()
-    res = full_wreath_rep(alpha, parts, dist_dict, npar)
+    res = full_wreath_rep(alpha, parts, dist_dict)
     end = time.time()
     print('full wreath rep computation: {}'.format(end - start))
     save_dict(alpha, parts, res, prefix=savedir)
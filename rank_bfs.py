@@ -0,0 +1,273 @@
+import os
+import sys
+import math
+import time
+import multiprocessing
+from functools import partial
+import numpy as np
+from perm2 import perm_rank, perm_unrank
+
+'''
+Breadth first search over puzzles whose states can be ranked into [0, nstates).
+
+Instead of a set of state strings and a queue of (state, distance) pairs, the search
+keeps one bit per state for the visited set and the current frontier as an array of
+ranks. Each layer is expanded in chunks with vectorized moves. The output is a uint8
+array of distances indexed by state rank (UNVISITED for unreachable states), which can
+be a memmap so the table never has to fit in memory.
+
+Puzzles implement:
+    nstates: number of possible state ranks
+    neighbors(ranks): (N,) ranks -> (N, number of moves) neighbor ranks, -1 for no move
+
+New permutation or wreath puzzles only need their generators, see perm_puzzle and
+WreathPuzzle.from_generators (exp/build_dists.py builds the tables of the exp puzzles).
+The generators that built a table are saved next to it (see save_generators) since the
+distance table alone does not say which moves a policy over it should use.
+'''
+UNVISITED = 255
+
+def orient_rank(otups, k):
+    '''
+    Rank of orientation tuples in Z_k^n whose entries sum to 0 mod k: the base k number
+    given by the first n - 1 entries. For k = 3, n = 8 this is cube_table.orient_rank.
+    otups: numpy array of shape (..., n)
+    k: int
+    Returns: int64 numpy array of shape (...)
+    '''
+    otups = np.asarray(otups, dtype=np.int64)
+    pows = k ** np.arange(otups.shape[-1] - 2, -1, -1, dtype=np.int64)
+    return otups[..., :-1] @ pows
+
+def orient_unrank(ranks, n, k):
+    '''
+    Inverse of orient_rank.
+    Returns: int64 numpy array of shape (..., n)
+    '''
+    ranks = np.asarray(ranks, dtype=np.int64)
+    pows = k ** np.arange(n - 2, -1, -1, dtype=np.int64)
+    otups = np.zeros(ranks.shape + (n,), dtype=np.int64)
+    otups[..., :-1] = (ranks[..., None] // pows) % k
+    otups[..., -1] = (-otups[..., :-1].sum(axis=-1)) % k
+    return otups
+
+class WreathPuzzle:
+    '''
+    Puzzle whose states are elements (o, p) of Z_k wr S_n, ex: the 2x2 cube (k = 3, n = 8),
+    the pyraminx edges (k = 2, n = 6) or a permutation puzzle (k = 1).
+    p is in tuple form with p[c] the position of piece c, o[i] is the orientation of the
+    piece in position i. A move sends the piece in position a to position perm[a] and adds
+    twist[perm[a]] to its orientation.
+    States are ranked as orient_rank(o) * n! + perm_rank(p), which for the cube is the
+    index used by cube_table.state_index and CubeTable.dense_dists.
+    '''
+    def __init__(self, n, k, moves):
+        '''
+        n: number of pieces
+        k: number of orientations of each piece
+        moves: list of (perm, twist) pairs: perm is a 1-indexed permutation tuple of length n,
+            twist a length n tuple of orientation changes indexed by the destination position
+        '''
+        self.n = n
+        self.k = k
+        self.nperms = math.factorial(n)
+        self.nstates = k ** (n - 1) * self.nperms
+        self.perms = np.array([m[0] for m in moves], dtype=np.intp) - 1
+        self.inv_perms = np.argsort(self.perms, axis=1)
+        self.twists = np.array([m[1] for m in moves], dtype=np.int64)
+
+    @classmethod
+    def from_generators(cls, generators, k):
+        '''
+        generators: list of (otup, ptup) wreath elements, as in exp/wreath_puzzle. The
+            neighbors of a state g are the products generator * g (see px_wreath_mul).
+        k: number of orientations of each piece
+        Returns: WreathPuzzle
+        '''
+        return cls(len(generators[0][1]), k, [(ptup, otup) for otup, ptup in generators])
+
+    def rank(self, otups, ptups):
+        return orient_rank(otups, self.k) * self.nperms + perm_rank(ptups)
+
+    def unrank(self, ranks):
+        '''
+        Returns: tuple of otups (N, n) and ptups (N, n) numpy arrays
+        '''
+        oranks, pranks = np.divmod(np.asarray(ranks, dtype=np.int64), self.nperms)
+        return orient_unrank(oranks, self.n, self.k), perm_unrank(pranks, self.n)
+
+    def neighbors(self, ranks):
+        otups, ptups = self.unrank(ranks)
+        ptups = ptups.astype(np.intp) - 1
+        nbrs = np.empty((len(otups), len(self.perms)), dtype=np.int64)
+        for idx, (perm, inv, twist) in enumerate(zip(self.perms, self.inv_perms, self.twists)):
+            new_o = (otups[:, inv] + twist) % self.k
+            new_p = (perm[ptups] + 1).astype(np.uint8)
+            nbrs[:, idx] = self.rank(new_o, new_p)
+        return nbrs
+
+def perm_puzzle(generators):
+    '''
+    Puzzle on S_n whose neighbors of a state p are the products g * p (see exp/utility.px_mult).
+    generators: list of permutation tuples of length n, as in exp/s8puzzle
+    Returns: WreathPuzzle with one orientation, ranked by perm_rank
+    '''
+    n = len(generators[0])
+    return WreathPuzzle(n, 1, [(g, (0,) * n) for g in generators])
+
+class TilePuzzle:
+    '''
+    n x n sliding tile puzzle. A state is the grid read row by row as a permutation tuple
+    of 1, ..., n^2 where n^2 is the blank, ranked by perm_rank (so the solved grid has
+    rank 0). Only practical for n <= 3 since the visited bits cover all (n^2)! ranks.
+    '''
+    def __init__(self, n):
+        self.n = n
+        self.nstates = math.factorial(n * n)
+
+    def rank(self, grids):
+        '''
+        grids: numpy array of shape (n, n), (N, n, n) or (N, n * n)
+        Returns: int64 numpy array of shape () or (N,)
+        '''
+        grids = np.asarray(grids)
+        if grids.shape[-1] == self.n and grids.ndim > 1 and grids.shape[-2] == self.n:
+            grids = grids.reshape(grids.shape[:-2] + (self.n * self.n,))
+        return perm_rank(grids)
+
+    def neighbors(self, ranks):
+        n = self.n
+        grids = perm_unrank(ranks, n * n)
+        blank = np.argmax(grids == n * n, axis=1)
+        row, col = np.divmod(blank, n)
+        nbrs = np.full((len(grids), 4), -1, dtype=np.int64)
+        for idx, (dr, dc) in enumerate([(-1, 0), (1, 0), (0, -1), (0, 1)]):
+            valid = np.flatnonzero((row + dr >= 0) & (row + dr < n) & (col + dc >= 0) & (col + dc < n))
+            target = blank[valid] + dr * n + dc
+            moved = grids[valid]
+            rows = np.arange(len(valid))
+            moved[rows, blank[valid]] = moved[rows, target]
+            moved[rows, target] = n * n
+            nbrs[valid, idx] = perm_rank(moved)
+        return nbrs
+
+def _get_bits(bits, idx):
+    return ((bits[idx >> 3] >> (idx & 7).astype(np.uint8)) & 1).astype(bool)
+
+def _set_bits(bits, idx):
+    np.bitwise_or.at(bits, idx >> 3, (1 << (idx & 7)).astype(np.uint8))
+
+def _expand(puzzle, ranks):
+    nbrs = puzzle.neighbors(ranks).ravel()
+    return np.unique(nbrs[nbrs >= 0])
+
+def bfs_dists(puzzle, roots, out=None, chunk_size=2**18, nworkers=1, verbose=True):
+    '''
+    Distance from the roots to every reachable state of the puzzle.
+    puzzle: see the module docstring
+    roots: iterable of root state ranks
+    out: (optional) uint8 array (or memmap) of length puzzle.nstates to write the distances to
+    chunk_size: number of frontier states to expand at once
+    nworkers: number of processes that expand the chunks of a layer. The visited bits and
+        the distances stay in this process, workers only return the neighbors of their chunk.
+    Returns: uint8 numpy array of length puzzle.nstates, UNVISITED for unreachable states
+    '''
+    pool = multiprocessing.get_context('fork').Pool(nworkers) if nworkers > 1 else None
+    try:
+        return _bfs(puzzle, roots, out, chunk_size, nworkers, pool, verbose)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+def _bfs(puzzle, roots, out, chunk_size, nworkers, pool, verbose):
+    start = time.time()
+    expand = partial(_expand, puzzle)
+    imap = map if pool is None else pool.imap
+    dists = out if out is not None else np.empty(puzzle.nstates, dtype=np.uint8)
+    dists[:] = UNVISITED
+    visited = np.zeros((puzzle.nstates + 7) // 8, dtype=np.uint8)
+    frontier = np.unique(np.asarray(list(roots), dtype=np.int64))
+    _set_bits(visited, frontier)
+
+    depth = 0
+    nvisited = 0
+    while len(frontier):
+        if depth >= UNVISITED:
+            raise ValueError('Distances do not fit in uint8')
+        dists[frontier] = depth
+        nvisited += len(frontier)
+
+        layers = []
+        # small layers are still split so every worker gets a piece
+        step = max(1, min(chunk_size, -(-len(frontier) // nworkers)))
+        chunks = (frontier[st: st + step] for st in range(0, len(frontier), step))
+        for nbrs in imap(expand, chunks):
+            new = nbrs[~_get_bits(visited, nbrs)]
+            _set_bits(visited, new)
+            layers.append(new)
+
+        if verbose:
+            print('Depth {:2d} | frontier: {:10d} | visited: {:10d} | elapsed: {:.2f}s'.format(
+                depth, len(frontier), nvisited, time.time() - start))
+            sys.stdout.flush()
+        # sorted so writes to a memmapped out are sequential
+        frontier = np.sort(np.concatenate(layers))
+        depth += 1
+    return dists
+
+def layer_sizes(dists):
+    '''
+    dists: distance array returned by bfs_dists
+    Returns: numpy array whose i-th entry is the number of states at distance i
+    '''
+    return np.bincount(dists[dists != UNVISITED])
+
+def print_layer_sizes(dists):
+    sizes = layer_sizes(dists)
+    for dist, size in enumerate(sizes):
+        print('Dist {:3d} | {:10d} states | {:6.2f}%'.format(dist, size, 100. * size / sizes.sum()))
+    print('Total    | {:10d} states | max dist: {}'.format(sizes.sum(), len(sizes) - 1))
+
+def generators_fname(fname):
+    '''
+    fname: .npy distance table file name
+    Returns: file name of the generators of the table, <table root>_gens.npz
+    '''
+    return os.path.splitext(fname)[0] + '_gens.npz'
+
+def save_generators(fname, generators, cyc_size=None):
+    '''
+    Save the generators that built the distance table fname next to it, in order.
+    fname: .npy distance table file name
+    generators: list of permutation tuples (cyc_size None) or (otup, ptup) wreath tuples
+    cyc_size: orientation group size of a wreath puzzle
+    '''
+    if cyc_size is None:
+        np.savez(generators_fname(fname), ptups=np.array(generators, dtype=np.uint8))
+    else:
+        otups, ptups = zip(*generators)
+        np.savez(generators_fname(fname), otups=np.array(otups, dtype=np.uint8),
+                 ptups=np.array(ptups, dtype=np.uint8))
+
+def load_generators(fname):
+    '''
+    Inverse of save_generators.
+    fname: .npy distance table file name
+    Returns: list of permutation tuples or (otup, ptup) wreath tuples
+    '''
+    with np.load(generators_fname(fname)) as data:
+        ptups = [tuple(p) for p in data['ptups'].tolist()]
+        if 'otups' not in data:
+            return ptups
+        return [(tuple(o), p) for o, p in zip(data['otups'].tolist(), ptups)]
+
+def bfs_to_file(puzzle, roots, fname, **kwargs):
+    '''
+    Run bfs_dists writing the distances to the .npy file fname through a memmap.
+    Returns: the memmapped distance array
+    '''
+    out = np.lib.format.open_memmap(fname, mode='w+', dtype=np.uint8, shape=(puzzle.nstates,))
+    bfs_dists(puzzle, roots, out, **kwargs)
+    out.flush()
+    return out
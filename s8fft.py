@@ -1,9 +1,12 @@
+import os
 import pdb
 import time
 import pickle
 from tqdm import tqdm
-from yor import yor
-from perm2 import Perm2
+from yor import yor, load_yor
+from irrep_store import IrrepStore, irrep_store_path
+from perm2 import Perm2, rank_array
+from fft import fft_vec
 from young_tableau import FerrersDiagram
 from utils import partitions
 from multiprocessing import Pool
@@ -27,13 +30,19 @@ def read_file(fname):
         return ptups, dists
 
 def get_irrep_dict(irrep):
+    store_fname = irrep_store_path('/local/hopan/irreps/', irrep)
+    if os.path.exists(store_fname):
+        return IrrepStore(store_fname)
     tfmt = '_'.join(str(i) for i in irrep)
     fname = f'/local/hopan/irreps/s_8/{tfmt}.pkl'
-    return pickle.load(open(fname, 'rb'))
+    return load_yor(fname, irrep)
 
 def fft(perm_tups, dists, irrep):
     f = FerrersDiagram(irrep)
     irrep_dict = get_irrep_dict(irrep)
+    if isinstance(irrep_dict, IrrepStore):
+        return irrep_dict.weighted_sum(dist_vec(perm_tups, dists))
+
     fhat = np.zeros((f.n_tabs(), f.n_tabs()))
 
     for p, d in zip(perm_tups, dists):
@@ -63,6 +72,27 @@ def do_all_ffts(fname):
         fhats.append(fhat)
         print('Done {:2d} / {:2d} | Elapsed: {:.2f}mins'.format(len(fhats), len(s8parts), (time.time() - st) / 60.))
 
+def dist_vec(perm_tups, dists):
+    '''
+    perm_tups: list of permutation tuples
+    dists: list of distances
+    Returns: dense numpy vector of the distances indexed by perm_rank
+    '''
+    return rank_array(perm_tups, dists, dtype=np.float64)
+
+def vec_ffts(fname, n, savedir):
+    '''
+    Compute the fourier transform of the distance function over every irrep of S_n
+    in one pass with fft_vec.
+    '''
+    st = time.time()
+    perm_tups, dists = read_file(fname)
+    fhats = fft_vec(dist_vec(perm_tups, dists), n)
+    for part, fhat in fhats.items():
+        np.save(f'{savedir}/{part}.npy', fhat)
+    print('Done all {} irreps | Elapsed: {:.2f}mins'.format(len(fhats), (time.time() - st) / 60.))
+    return fhats
+
 def par_ft(perms, dists):
     p9s = list(partitions(9))
     args = [(perms, dists, p) for p in p9s]
@@ -0,0 +1,226 @@
+import os
+import sys
+import time
+import math
+import argparse
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+
+from utils import check_memory, cube2_irreps
+from young_tableau import wreath_dim
+from wreath import induced_rep_table
+from multi import coset_size, weights_mb, multi_perm_block_weights, weights_transform
+
+'''
+Compute the fourier transform at every irrep of the 2x2 cube or the pyraminx on a
+local process pool.
+
+All the irreps of one alpha share the perm_block_weights of the data (see
+multi.multi_irrep_transform), so the unit of work is one alpha: one pass over the
+states followed by weights_transform for each of its parts. Alphas range from a few
+to hundreds of weight columns, so instead of a static assignment the scheduler
+estimates the cost and memory of each alpha up front and hands the most expensive
+alpha that fits in the free memory to the next idle worker. Each worker has a
+memory cap of worker_mb. An alpha estimated above the cap takes the memory of as
+many workers as it needs, and those workers stay idle while it runs.
+The state arrays are loaded once before the pool starts and shared with the
+workers through fork. Irreps whose result already exists are skipped, so a killed
+run can be restarted with the same command.
+'''
+
+Task = namedtuple('Task', ['alpha', 'parts_lst', 'cost', 'mb'])
+
+# temporaries of one perm_block_weights chunk (see multi.block_chunk_rows)
+CHUNK_MB = 256
+# gathered blocks of one weights_transform batch and their scaled copy
+TRANSFORM_BATCH_MB = 2 * 64
+
+def alpha_cost(alpha, parts_lst, nstates):
+    '''
+    Relative cost of the transforms of the irreps (alpha, parts) for parts in parts_lst:
+    the block scalars of the data pass (one per state and coset) plus the block products
+    of weights_transform (one block per permutation and coset for each parts).
+    nstates: number of states of the puzzle
+    '''
+    n = sum(alpha)
+    m = coset_size(alpha)
+    return nstates * m + sum(math.factorial(n) * m * wreath_dim(parts) ** 2 for parts in parts_lst)
+
+def irrep_mb(alpha, parts):
+    '''
+    Estimated peak memory in megabytes of weights_transform at (alpha, parts) on top of
+    the weight array: the induced rep table of the irrep, one weights_transform batch
+    and the result plus one temporary of the same size.
+    '''
+    d = wreath_dim(parts)
+    dim = d * coset_size(alpha)
+    table_mb = math.factorial(sum(alpha)) * (coset_size(alpha) * 2 * 4 + d * d * 8) / 2**20
+    return table_mb + TRANSFORM_BATCH_MB + 2 * dim * dim * 16 / 2**20
+
+def alpha_mb(alpha, parts_lst, chunk_mb=CHUNK_MB):
+    '''
+    Estimated peak memory in megabytes of a task: the perm_block_weights array, the
+    temporaries of one of its chunks and the largest irrep of the alpha (the irreps are
+    done one after the other, see irrep_mb).
+    chunk_mb: memory budget of the perm_block_weights chunks (see multi.block_chunk_rows)
+    '''
+    return weights_mb(alpha) + max(chunk_mb, max(irrep_mb(alpha, parts) for parts in parts_lst))
+
+def make_tasks(irreps, nstates, chunk_mb=CHUNK_MB):
+    '''
+    irreps: iterable of (alpha, parts) tuples
+    nstates: number of states of the puzzle
+    chunk_mb: memory budget of the perm_block_weights chunks of each task
+    Returns: list of Tasks, one per alpha, most expensive first
+    '''
+    by_alpha = {}
+    for alpha, parts in irreps:
+        by_alpha.setdefault(alpha, []).append(parts)
+
+    tasks = [Task(alpha, tuple(parts_lst), alpha_cost(alpha, parts_lst, nstates), alpha_mb(alpha, parts_lst, chunk_mb))
+             for alpha, parts_lst in by_alpha.items()]
+    return sorted(tasks, key=lambda t: t.cost, reverse=True)
+
+def task_workers(task, worker_mb):
+    '''
+    Number of workers whose memory the task needs.
+    '''
+    return max(1, math.ceil(task.mb / worker_mb))
+
+def next_task(pending, free_workers, nrunning, worker_mb):
+    '''
+    Pick the index of the next task to start: the most expensive pending task whose
+    memory fits in the caps of the free workers. A task bigger than the caps of all the
+    workers is only started when nothing else runs.
+    pending: list of Tasks, most expensive first
+    free_workers: number of workers whose memory is not used by the running tasks
+    nrunning: number of running tasks
+    worker_mb: memory cap of each worker
+    Returns: index into pending or None if nothing can be started now
+    '''
+    for idx, task in enumerate(pending):
+        if task_workers(task, worker_mb) <= free_workers:
+            return idx
+    if nrunning == 0 and pending:
+        return 0
+    return None
+
+def run_schedule(tasks, func, nworkers, worker_mb, executor=None, verbose=True):
+    '''
+    Run func(alpha, parts_lst) for every task on a pool of nworkers. A task runs within
+    the memory cap of one worker if its estimate fits, otherwise it holds the memory of
+    task_workers(task, worker_mb) workers, which do not start other tasks meanwhile.
+    tasks: list of Tasks (see make_tasks)
+    func: function of (alpha, parts_lst), must be picklable if executor is a process pool
+    nworkers: number of workers
+    worker_mb: memory cap in megabytes of each worker
+    executor: (optional) concurrent.futures executor to use. Defaults to a fork based process pool.
+    Returns: dict mapping (alpha, parts_lst) -> return value of func
+    '''
+    pending = sorted(tasks, key=lambda t: t.cost, reverse=True)
+    total_cost = max(sum(t.cost for t in tasks), 1)
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(nworkers, mp_context=multiprocessing.get_context('fork'))
+
+    running = {}
+    results = {}
+    done_cost = 0
+    start = time.time()
+    try:
+        while pending or running:
+            while pending and len(running) < nworkers:
+                used = sum(task_workers(t, worker_mb) for t in running.values())
+                idx = next_task(pending, nworkers - used, len(running), worker_mb)
+                if idx is None:
+                    break
+                task = pending.pop(idx)
+                running[executor.submit(func, task.alpha, task.parts_lst)] = task
+
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                task = running.pop(fut)
+                results[(task.alpha, task.parts_lst)] = fut.result()
+                done_cost += task.cost
+                if verbose:
+                    elapsed = time.time() - start
+                    rate = done_cost / elapsed if elapsed > 0 else 0
+                    eta = (total_cost - done_cost) / rate if rate > 0 else float('nan')
+                    print('[{:4d}/{:4d}] {} ({} irreps) | {:5.1f}% of cost | elapsed: {:.1f}s | {:.2f} alphas/min | eta: {:.1f}s'.format(
+                        len(results), len(tasks), task.alpha, len(task.parts_lst), 100. * done_cost / total_cost,
+                        elapsed, 60. * len(results) / max(elapsed, 1e-9), eta))
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return results
+
+# state arrays of the puzzle, set before the pool forks
+_DATA = {}
+
+def _transform_alpha(alpha, parts_lst):
+    start = time.time()
+    weights = multi_perm_block_weights([_DATA['arrays']], [alpha], _DATA['chunk_mb'])[alpha]
+    savedir = os.path.join(_DATA['savedir'], str(alpha))
+    os.makedirs(savedir, exist_ok=True)
+    for parts in parts_lst:
+        table = induced_rep_table(alpha, parts, _DATA['irrep_prefix'])
+        mat = weights_transform(weights, table, wreath_dim(parts), coset_size(alpha))
+        np.save(os.path.join(savedir, str(parts)), mat)
+        del table, mat
+    return time.time() - start, check_memory(verbose=False)
+
+def load_pyraminx_arrays(prefix):
+    '''
+    Returns: tuple of otups (N, 6), ptups (N, 6) uint8 and dists (N,) arrays of the pyraminx
+    '''
+    from pyraminx.px_utils import dist_df
+    df = dist_df(os.path.join(prefix, 'dists.txt'))
+    otups = np.array(df[0].tolist(), dtype=np.uint8)
+    ptups = np.array(df[1].tolist(), dtype=np.uint8)
+    return otups, ptups, df[2].values
+
+def puzzle_irreps(puzzle):
+    if puzzle == 'cube':
+        return list(cube2_irreps())
+    elif puzzle == 'pyraminx':
+        from pyraminx.px_utils import alpha_parts
+        return alpha_parts()
+    raise ValueError('Unknown puzzle: {}'.format(puzzle))
+
+def main(args):
+    if args.puzzle == 'cube':
+        from cube_ft import load_arrays
+        arrays = load_arrays(args.prefix)
+    else:
+        arrays = load_pyraminx_arrays(args.prefix)
+
+    savedir = os.path.join(args.prefix, 'fourier')
+    irreps = [(alpha, parts) for alpha, parts in puzzle_irreps(args.puzzle)
+              if not os.path.exists(os.path.join(savedir, str(alpha), '{}.npy'.format(parts)))]
+    tasks = make_tasks(irreps, len(arrays[2]), args.chunk_mb)
+    print('{} irreps in {} alphas to compute | total cost: {:.3e} | largest: {} ({:.0f}mb)'.format(
+        len(irreps), len(tasks), sum(t.cost for t in tasks), tasks[0].alpha if tasks else None,
+        tasks[0].mb if tasks else 0))
+
+    _DATA['arrays'] = arrays
+    _DATA['irrep_prefix'] = args.irrep_prefix
+    _DATA['savedir'] = savedir
+    _DATA['chunk_mb'] = args.chunk_mb
+    start = time.time()
+    results = run_schedule(tasks, _transform_alpha, args.workers, args.worker_mb)
+    busy = sum(t for t, _ in results.values())
+    print('Done {} alphas in {:.2f}s | worker utilization: {:.1f}%'.format(
+        len(results), time.time() - start, 100. * busy / max(args.workers * (time.time() - start), 1e-9)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--puzzle', type=str, default='cube', choices=['cube', 'pyraminx'])
+    parser.add_argument('--prefix', type=str, default='/scratch/hopan/cube/')
+    parser.add_argument('--irrep_prefix', type=str, default='/local/hopan/')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--worker_mb', type=int, default=8192, help='memory cap of each worker')
+    parser.add_argument('--chunk_mb', type=int, default=CHUNK_MB, help='memory of the per chunk temporaries of each task')
+    args = parser.parse_args()
+    main(args)
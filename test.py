@@ -1,12 +1,17 @@
 import unittest
+import os
+import math
+import tempfile
 from young_tableau import FerrersDiagram, YoungTableau
 from yor import *
+from irrep_store import convert_yor_pickle, IRREP_EXT
+from perm2 import tup_rank
 from utils import partitions
 import pdb
-from fft import fft, fourier_transform, fourier_transform2, fft2
+from fft import fft, fourier_transform, fourier_transform2, fft2, fft_full, fft_vec, fft_batch, ft_full, ifft, ifft_batch, fft_tables
 import numpy as np
 from perm import Perm
-from perm2 import Perm2
+from perm2 import Perm2, perm_rank
 
 
 class TestYoungTableau(unittest.TestCase):
@@ -73,6 +78,83 @@ class TestYoungTableau(unittest.TestCase):
         self.assertTrue(np.allclose(p23, yor(ferr, Perm2({2:3, 3:2}, 4))))
         self.assertTrue(np.allclose(p34, yor(ferr, Perm2({3:4, 4:3}, 4))))
 
+    def test_yor_sparse(self):
+        ferr = FerrersDiagram((3, 2, 1))
+        for t in [(1, 2), (3, 4), (5, 6)]:
+            gen = yor_trans_sparse(ferr, t)
+            dense = yor_trans(ferr, t)
+            mat = np.random.random(dense.shape)
+            self.assertTrue(np.allclose(apply_trans(gen, mat), mat.dot(dense)))
+            self.assertTrue(np.allclose(apply_trans(gen, mat, left=True), dense.dot(mat)))
+
+        g = Perm2.from_tup((3, 6, 1, 5, 2, 4))
+        h = Perm2.from_tup((2, 1, 4, 3, 6, 5))
+        self.assertTrue(np.allclose(yor_sparse(ferr, (g * h).tup_rep),
+                                    yor_sparse(ferr, g.tup_rep).dot(yor_sparse(ferr, h.tup_rep))))
+
+    def test_yor_table(self):
+        ferr = FerrersDiagram((3, 2))
+        table = dict(yor_table(ferr))
+        self.assertEqual(len(table), math.factorial(5))
+        for perm in sn(5):
+            self.assertTrue(np.allclose(table[perm.tup_rep], yor(ferr, perm)))
+
+    def test_irrep_store(self):
+        ferr = FerrersDiagram((3, 2))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pkl_fname = os.path.join(tmpdir, '3_2.pkl')
+            save_yor_table(ferr, pkl_fname, max_mb=0.01)
+            store = convert_yor_pickle(pkl_fname, os.path.join(tmpdir, '3_2' + IRREP_EXT), (3, 2))
+            # bulk loads leave the matrix cache alone
+            ncached = len(YOR_CACHE)
+            self.assertEqual(len(load_yor(pkl_fname, (3, 2))), 120)
+            self.assertEqual(len(YOR_CACHE), ncached)
+            self.assertEqual(store.partition, (3, 2))
+            self.assertEqual(store.mats.shape, (120, 5, 5))
+
+            perms = sn(5)
+            for perm in perms:
+                self.assertTrue(np.allclose(store[perm.tup_rep], yor(ferr, perm)))
+            tups = [p.tup_rep for p in perms[::7]]
+            self.assertTrue(np.allclose(store.take(tups), np.stack([store[t] for t in tups])))
+            self.assertTrue((2, 1, 3, 5, 4) in store)
+            self.assertFalse((1, 1, 1, 1, 1) in store)
+            self.assertIsNone(store.get((1, 1, 1, 1, 1)))
+            self.assertTrue(np.allclose(store.get((2, 1, 3, 5, 4)), store[(2, 1, 3, 5, 4)]))
+
+            coefs = np.random.rand(120)
+            exp = sum(coefs[tup_rank(p.tup_rep)] * yor(ferr, p) for p in perms)
+            self.assertTrue(np.allclose(store.weighted_sum(coefs, chunk_mb=0.001), exp))
+
+            fname = os.path.join(tmpdir, 'store' + IRREP_EXT)
+            save_yor_store(ferr, fname)
+            loaded = load_yor(fname, (3, 2))
+            self.assertTrue(np.allclose(loaded.mats, store.mats))
+
+    def test_matrix_cache(self):
+        mat = np.zeros((16, 16)) # 2kb
+        cache = MatrixCache(max_mb=5 * mat.nbytes / 2 ** 20, part_mb={(2, 1): 2 * mat.nbytes / 2 ** 20})
+        for i in range(4):
+            cache.put(((2, 1), i), mat.copy())
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(((2, 1), 3) in cache)
+        self.assertTrue(((2, 1), 1) not in cache)
+
+        for i in range(4):
+            cache.put(((3,), i), mat.copy())
+        self.assertEqual(len(cache), 5)
+        self.assertTrue(cache.get(((2, 1), 2)) is None)
+        self.assertTrue(cache.get(((3,), 3)) is not None)
+        self.assertEqual(cache.stats, {'hits': 1, 'misses': 1, 'evictions': 3})
+
+    def test_yor_cache(self):
+        ferr = FerrersDiagram((3, 2))
+        g = Perm2.from_tup((2, 3, 1, 5, 4))
+        yor(ferr, g)
+        hits = YOR_CACHE.stats['hits']
+        self.assertTrue(np.allclose(yor(ferr, g), yor_sparse(ferr, g.tup_rep)))
+        self.assertEqual(YOR_CACHE.stats['hits'], hits + 1)
+
     def test_fft(self):
         # any random function
         f = lambda p: 1 if p[1] == 2 else 1.5
@@ -84,6 +166,69 @@ class TestYoungTableau(unittest.TestCase):
             self.assertTrue(np.allclose(ft, ft2))
             self.assertTrue(np.allclose(fft_res, ft))
 
+    def test_fft_full(self):
+        f = lambda p: p[1] + 0.5 * p[3] * p[4]
+        n = 6
+        fft_res = fft_full(f, n)
+        self.assertEqual(set(fft_res.keys()), set(partitions(n)))
+        for partition in partitions(n):
+            ferrers = FerrersDiagram(partition)
+            ft = fourier_transform2(f, ferrers)
+            self.assertTrue(np.allclose(fft_res[partition], ft))
+
+        full = ft_full(f, n, 'fft')
+        for ferrers, mat in full.items():
+            self.assertTrue(np.allclose(mat, fft_res[ferrers.partition]))
+
+    def test_fft_vec(self):
+        f = lambda p: p[1] + 0.5 * p[3] * p[4]
+        n = 6
+        f_vec = np.zeros(math.factorial(n))
+        for perm in sn(n):
+            f_vec[perm_rank(perm.tup_rep)] = f(perm)
+
+        fft_res = fft_full(f, n)
+        vec_res = fft_vec(f_vec, n)
+        for partition in partitions(n):
+            self.assertTrue(np.allclose(fft_res[partition], vec_res[partition]))
+
+    def test_fft_batch(self):
+        n = 5
+        fs = np.random.random((3, math.factorial(n)))
+        batch_res = fft_batch(fs, n)
+        for b in range(len(fs)):
+            vec_res = fft_vec(fs[b], n)
+            for partition, mats in batch_res.items():
+                self.assertTrue(np.allclose(mats[b], vec_res[partition]))
+
+    def test_ifft(self):
+        n = 6
+        f = np.random.random(math.factorial(n))
+        full = ft_full(f, n, 'fft')
+        self.assertTrue(np.allclose(ifft(full, n), f))
+
+        fs = np.random.random((3, math.factorial(5)))
+        self.assertTrue(np.allclose(ifft_batch(fft_batch(fs, 5), 5), fs))
+
+        # tables built elsewhere: the tableaux cache of this process may be empty
+        tables = fft_tables(5)
+        fhats = fft_batch(fs, 5)
+        cache = dict(FerrersDiagram.TABLEAUX_CACHE)
+        FerrersDiagram.TABLEAUX_CACHE.clear()
+        try:
+            self.assertTrue(np.allclose(ifft_batch(fhats, 5, tables), fs))
+        finally:
+            FerrersDiagram.TABLEAUX_CACHE.update(cache)
+
+        # a single irrep should match the direct inverse formula
+        p = (4, 2)
+        fhat = full[FerrersDiagram.from_partition(p)]
+        partial = ifft({p: fhat}, n)
+        for perm in random.sample(sn(n), 10):
+            rho_inv = yor(FerrersDiagram.from_partition(p), perm.inv())
+            direct = fhat.shape[0] * np.trace(rho_inv.dot(fhat)) / math.factorial(n)
+            self.assertTrue(np.isclose(partial[perm_rank(perm.tup_rep)], direct))
+
     def test_yor_random(self):
         n = 9
         cnt = 10
@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+from batch_mcts import BatchMCTS, batch_solve
+
+class PermMCTS(BatchMCTS):
+    # S_5 with adjacent transpositions, valued by minus the number of misplaced entries
+    gens = [(2, 1, 3, 4, 5), (1, 3, 2, 4, 5), (1, 2, 4, 3, 5), (1, 2, 3, 5, 4)]
+
+    def expand(self, states):
+        nbrs = [[tuple(g[i - 1] for i in s) for g in self.gens] for s in states]
+        solved = np.array([[n == (1, 2, 3, 4, 5) for n in ns] for ns in nbrs])
+        return nbrs, solved
+
+    def evaluate(self, states):
+        return -(np.array(states) != np.arange(1, 6)).sum(axis=1)
+
+class TestBatchMCTS(unittest.TestCase):
+    def test_batch_mcts(self):
+        np.random.seed(0)
+        root = (5, 4, 3, 2, 1)
+        tree = PermMCTS(root, 4, batch_size=8, capacity=4)
+        sol, tree = batch_solve(tree, max_steps=10000)
+        self.assertIsNotNone(sol)
+        state = root
+        for a in sol:
+            state = tuple(PermMCTS.gens[a][i - 1] for i in state)
+        self.assertEqual(state, (1, 2, 3, 4, 5))
+
+        # the tree outgrew its initial capacity and every pending visit was undone
+        self.assertTrue(tree.capacity > 4)
+        self.assertEqual(len(tree.node_idx), len(tree.states))
+        self.assertEqual(tree.pending.sum(), 0)
+        self.assertTrue(tree.visits[0].sum() > 0)
+
+        # walkers on the same unvisited node spread over its actions
+        tree = PermMCTS(root, 4, batch_size=4)
+        tree.search()
+        leaves, path_nodes, path_actions = tree.search_leaves(4)
+        self.assertEqual(sorted(path_actions[0]), [0, 1, 2, 3])
+        self.assertEqual(len(set(leaves)), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -29,5 +29,41 @@ class TestCoset(unittest.TestCase):
         H = wreath.young_subgroup_perm(alpha)
         self.check_coset(G, H)
 
+    def test_coset_reps_arr(self):
+        alpha = (2, 3, 2)
+        H = wreath.young_subgroup_perm(alpha)
+        reps = cu.coset_reps(perm2.sn(7), H)
+        reps_arr = cu.coset_reps(perm2.PermArray.sn(7), H)
+        self.assertEqual([p.tup_rep for p in reps], reps_arr.tup_reps())
+
+    def test_coset_action_table(self):
+        alpha = (2, 1, 2)
+        H = wreath.young_subgroup_perm(alpha)
+        G = perm2.sn(5)
+        reps = cu.coset_reps(G, H)
+        action, residual = cu.coset_action_table(alpha)
+        self.assertEqual(action.shape, (len(G), len(reps)))
+
+        for r, g in enumerate(G):
+            self.assertEqual(sorted(action[r]), list(range(len(reps))))
+            for j, t_j in enumerate(reps):
+                # g t_j = t_i h
+                t_i = reps[action[r, j]]
+                h = H[residual[r, j]]
+                self.assertEqual((g * t_j).tup_rep, (t_i * h).tup_rep)
+
+    def test_young_coset_reps(self):
+        for alpha in [(2, 3, 2), (0, 4, 3), (3, 1, 1, 2)]:
+            H = wreath.young_subgroup_perm(alpha)
+            reps = cu.coset_reps(perm2.sn(sum(alpha)), H)
+            young_reps = list(cu.young_coset_reps(alpha))
+            self.assertEqual([p.tup_rep for p in reps], [p.tup_rep for p in young_reps])
+            self.assertEqual(cu.young_coset_count(alpha), len(reps))
+
+            for idx, rep in enumerate(young_reps):
+                self.assertEqual(cu.coset_unrank(idx, alpha), rep.tup_rep)
+                for h in H[::7]:
+                    self.assertEqual(cu.coset_index(rep * h, alpha), idx)
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,10 +2,16 @@ import pdb
 import unittest
 import sys
 sys.path.append('./cube/')
-from collections import Counter
+from collections import Counter, deque
 from cube_perms import rot_permutations
 from wreath import WreathCycSn
 from str_cube import *
+import os
+import tempfile
+import numpy as np
+from cube_table import convert_csv, state_index
+from rank_bfs import WreathPuzzle, TilePuzzle, perm_puzzle, bfs_dists, layer_sizes, save_generators, load_generators, UNVISITED
+from perm2 import perm_rank
 
 def group_wreath(cube_str):
     otup, ptup = get_wreath(cube_str)
@@ -78,6 +84,99 @@ class TestCube(unittest.TestCase):
         te = time.time()
         print('Total time: {:.2f}s'.format(te - ts))
 
+    def test_cube_arr(self):
+        cubes = [scramble(init_2cube(), 20) for _ in range(50)]
+        states = str_to_arr(cubes)
+        self.assertEqual(arr_to_str(states), cubes)
+        self.assertEqual(arr_to_str(states[0]), cubes[0])
+        for m in ALL_MOVES:
+            self.assertEqual(arr_to_str(rotate_arr(states, m)), [rotate(c, m) for c in cubes])
+
+        nbrs = neighbors_batch(states)
+        self.assertEqual(nbrs.shape, (50, 12, 24))
+        for c, nbr in zip(cubes, nbrs):
+            self.assertEqual(arr_to_str(nbr), neighbors_fixed_core(c))
+
+        otups, ptups = wreath_batch(states)
+        for c, otup, ptup in zip(cubes, otups, ptups):
+            self.assertEqual(get_wreath(c), (tuple(otup), tuple(ptup)))
+        self.assertTrue(is_solved_arr(str_to_arr([CUBE2_START]))[0])
+
+    def test_rank_bfs(self):
+        puzzle = WreathPuzzle(8, 3, cube_wreath_moves())
+        cubes = [scramble(init_2cube(), 20) for _ in range(50)]
+        otups, ptups = wreath_batch(str_to_arr(cubes))
+        ranks = puzzle.rank(otups, ptups)
+        self.assertTrue(np.array_equal(ranks, state_index(otups, ptups)))
+        self.assertTrue(np.array_equal(np.concatenate(puzzle.unrank(ranks), axis=1), np.concatenate([otups, ptups], axis=1)))
+
+        nbr_states = neighbors_batch(str_to_arr(cubes)).reshape(-1, 24)
+        self.assertTrue(np.array_equal(puzzle.neighbors(ranks).ravel(), puzzle.rank(*wreath_batch(nbr_states))))
+
+        # 2x2 tile puzzle: the blank cycles around the 4 squares, so half of S_4 is reachable
+        tile = TilePuzzle(2)
+        dists = bfs_dists(tile, [tile.rank(np.array([[1, 2], [3, 4]]))], verbose=False)
+        self.assertEqual((dists != UNVISITED).sum(), 12)
+        self.assertEqual(dists.max(where=dists != UNVISITED, initial=0), 6)
+        self.assertEqual(dists[tile.rank((1, 4, 3, 2))], 1)
+
+    def test_rank_bfs_generators(self):
+        moves = cube_wreath_moves()
+        puzzle = WreathPuzzle.from_generators([(o, p) for p, o in moves], 3)
+        ranks = np.arange(0, puzzle.nstates, 997)
+        self.assertTrue(np.array_equal(puzzle.neighbors(ranks), WreathPuzzle(8, 3, moves).neighbors(ranks)))
+
+        # S_6 generated by a 6-cycle and a transposition, compared against a tuple bfs
+        gens = [(2, 3, 4, 5, 6, 1), (2, 1, 3, 4, 5, 6)]
+        ident = (1, 2, 3, 4, 5, 6)
+        exp = {ident: 0}
+        to_visit = deque([ident])
+        while to_visit:
+            curr = to_visit.popleft()
+            for g in gens:
+                nbr = tuple(g[i - 1] for i in curr)
+                if nbr not in exp:
+                    exp[nbr] = exp[curr] + 1
+                    to_visit.append(nbr)
+
+        dists = bfs_dists(perm_puzzle(gens), [0], chunk_size=50, nworkers=2, verbose=False)
+        self.assertEqual(layer_sizes(dists).sum(), 720)
+        self.assertTrue(np.array_equal(dists[perm_rank(np.array(list(exp), dtype=np.uint8))], list(exp.values())))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'dists.npy')
+            save_generators(fname, gens)
+            self.assertEqual(load_generators(fname), gens)
+            wreath_gens = [(o, p) for p, o in moves]
+            save_generators(fname, wreath_gens, 3)
+            self.assertEqual(load_generators(fname), wreath_gens)
+
+    def test_cube_table(self):
+        c = init_2cube()
+        cubes = [scramble_fixedcore(c, 50) for _ in range(100)]
+        rows = [get_wreath(s) for s in cubes]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_fname = os.path.join(tmpdir, 'cube.txt')
+            with open(csv_fname, 'w') as f:
+                for i, (otup, ptup) in enumerate(rows):
+                    f.write('{},{},{}\n'.format(''.join(map(str, otup)), ''.join(map(str, ptup)), i % 15))
+
+            table = convert_csv(csv_fname, os.path.join(tmpdir, 'table'), chunk_rows=7)
+            self.assertEqual(len(table), len(rows))
+            otups, ptups, dists = table.rows(0, len(table))
+            for i, (otup, ptup) in enumerate(rows):
+                self.assertEqual(tuple(otups[i]), tuple(otup))
+                self.assertEqual(tuple(ptups[i]), tuple(ptup))
+                self.assertEqual(dists[i], i % 15)
+
+            starts = [st for r in range(3) for st, _, _, _ in table.iter_chunks(chunk_rows=10, rank=r, size=3)]
+            self.assertEqual(sum(len(range(*table.chunk_bounds(r, 3))) for r in range(3)), len(rows))
+            self.assertEqual(starts[0], 0)
+
+            dense = table.dense_dists()
+            idx = state_index(np.array([rows[5][0]]), np.array([rows[5][1]]))
+            self.assertEqual(dense[idx[0]], 5)
+
 if __name__ == '__main__':
     unittest.main()
 
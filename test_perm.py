@@ -35,6 +35,51 @@ class TestPerm(unittest.TestCase):
         self.assertTrue((p1 * p2).tup_rep == exp_12)
         self.assertTrue((p2 * p1).tup_rep == exp_21)
 
+    def test_rank(self):
+        n = 5
+        perms = list(permutations(range(1, n+1)))
+        ranks = perm_rank(np.array(perms))
+        self.assertTrue(np.array_equal(ranks, np.arange(len(perms))))
+        self.assertTrue(np.array_equal(perm_unrank(ranks, n), np.array(perms)))
+        self.assertEqual(perm_rank((2, 1, 3, 4, 5)), 24)
+        self.assertEqual(tuple(perm_unrank(24, n)), (2, 1, 3, 4, 5))
+
+    def test_tup_rank(self):
+        n = 5
+        perms = list(permutations(range(1, n+1)))
+        for i, p in enumerate(perms):
+            self.assertEqual(tup_rank(p), i)
+            self.assertEqual(tup_unrank(i, n), p)
+            self.assertEqual(Perm2.from_tup(p).rank(), i)
+            self.assertEqual(TupPerm.from_tup(p).rank(), i)
+
+        arr = rank_array([(2, 1, 3), (3, 2, 1)], [4, 7], fill=-1)
+        self.assertTrue(np.array_equal(arr, np.array([-1, -1, 4, -1, -1, 7])))
+
+    def test_perm_array(self):
+        n = 5
+        G = PermArray.sn(n)
+        perms = sn(n)
+        self.assertEqual(G.tup_reps(), [p.tup_rep for p in perms])
+
+        g = perms[17]
+        prods = G * PermArray([g.tup_rep])
+        self.assertEqual(prods.tup_reps(), [(p * g).tup_rep for p in perms])
+        self.assertEqual((g * G).tup_reps(), [(g * p).tup_rep for p in perms])
+        self.assertEqual(G.inv().tup_reps(), [p.inv().tup_rep for p in perms])
+        self.assertTrue(np.array_equal(PermArray.unrank(G.rank(), n).perms, G.perms))
+
+        cyc_type = PermArray([(2, 1, 4, 5, 3), (1, 2, 3, 4, 5)]).cycle_type()
+        self.assertEqual(cyc_type.tolist(), [[0, 1, 1, 0, 0], [5, 0, 0, 0, 0]])
+
+    def test_tup_perm(self):
+        p1 = TupPerm((2, 3, 4, 1, 5))
+        p2 = Perm2.from_trans((1, 5), 5)
+        self.assertEqual((p1 * p2).tup_rep, (5, 3, 4, 1, 2))
+        self.assertEqual((p1 * p1.inv()).tup_rep, (1, 2, 3, 4, 5))
+        self.assertEqual(p1.cycle_decomposition, Perm2.from_tup(p1.tup_rep).cycle_decomposition)
+        self.assertEqual(p1[4], 1)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,88 @@
+import os
+import time
+import tempfile
+import threading
+import tracemalloc
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scheduler
+from scheduler import Task, make_tasks, next_task, run_schedule, task_workers, alpha_mb
+from multi import block_chunk_rows, perm_block_weights, weights_mb, grouped_transform
+from coset_utils import young_coset_reps_arr
+from wreath import cyclic_irreps, induced_rep_table
+
+class TestScheduler(unittest.TestCase):
+    def test_scheduler(self):
+        irreps = [((2, 3, 3), ((2,), (3,), (2, 1))), ((8, 0, 0), ((8,), (), ())), ((2, 3, 3), ((1, 1), (3,), (3,)))]
+        tasks = make_tasks(irreps, 88179840)
+        self.assertEqual([t.alpha for t in tasks], [(2, 3, 3), (8, 0, 0)])
+        self.assertEqual(tasks[0].parts_lst, (((2,), (3,), (2, 1)), ((1, 1), (3,), (3,))))
+        self.assertEqual(tasks[0].mb, alpha_mb((2, 3, 3), tasks[0].parts_lst))
+
+        # workers needed: 5, 2, 1
+        pending = [Task('a', 0, 10, 50), Task('b', 0, 5, 20), Task('c', 0, 1, 5)]
+        self.assertEqual(next_task(pending, 3, 1, 10), 1)
+        self.assertIsNone(next_task(pending, 0, 1, 10))
+        self.assertEqual(next_task(pending[:2], 1, 0, 10), 0)
+
+        # the running tasks never use more than the caps of the workers, except for the
+        # task that is bigger than all of them and runs alone
+        tasks = [Task(i, 0, cost, mb) for i, (cost, mb) in enumerate([(9, 300), (8, 60), (7, 60), (3, 30), (2, 20), (1, 10)])]
+        lock = threading.Lock()
+        state = {'workers': 0, 'max_workers': 0, 'big_alone': True, 'n': 0}
+        nworkers = {t.alpha: task_workers(t, 40) for t in tasks}
+        def func(alpha, parts_lst):
+            with lock:
+                if alpha == 0 and state['n'] > 0:
+                    state['big_alone'] = False
+                state['n'] += 1
+                state['workers'] += nworkers[alpha]
+                if alpha != 0:
+                    state['max_workers'] = max(state['max_workers'], state['workers'])
+            time.sleep(0.01)
+            with lock:
+                state['n'] -= 1
+                state['workers'] -= nworkers[alpha]
+            return alpha * 2
+
+        with ThreadPoolExecutor(3) as ex:
+            res = run_schedule(tasks, func, nworkers=3, worker_mb=40, executor=ex, verbose=False)
+        self.assertEqual(res, {(t.alpha, 0): t.alpha * 2 for t in tasks})
+        self.assertTrue(state['big_alone'])
+        self.assertTrue(state['max_workers'] <= 3)
+
+    def test_transform_alpha(self):
+        # one data pass per alpha gives the same transforms as one pass per irrep
+        alpha = (1, 2, 2)
+        parts_lst = [((1,), (2,), (1, 1)), ((1,), (1, 1), (2,))]
+        otups = np.random.randint(0, 3, (500, 5)).astype(np.uint8)
+        ptups = np.array([np.random.permutation(5) + 1 for _ in range(500)], dtype=np.uint8)
+        dists = np.random.randint(0, 10, 500)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            scheduler._DATA.update(arrays=(otups, ptups, dists), irrep_prefix='/local/hopan/', savedir=tmpdir, chunk_mb=1)
+            tasks = make_tasks([(alpha, parts) for parts in parts_lst], len(dists))
+            with ThreadPoolExecutor(1) as ex:
+                run_schedule(tasks, scheduler._transform_alpha, nworkers=1, worker_mb=1024, executor=ex, verbose=False)
+            for parts in parts_lst:
+                exp = grouped_transform(otups, ptups, dists, induced_rep_table(alpha, parts), alpha, parts)
+                mat = np.load(os.path.join(tmpdir, str(alpha), '{}.npy'.format(parts)))
+                self.assertTrue(np.allclose(mat, exp))
+
+    def test_block_chunk_rows(self):
+        # the chunk temporaries of perm_block_weights stay within the chunk budget
+        alpha = (2, 3, 3)
+        cos_reps = young_coset_reps_arr(alpha)
+        rows = block_chunk_rows(alpha, 4)
+        otups = np.random.randint(0, 3, (3 * rows, 8)).astype(np.uint8)
+        ptups = np.array([np.random.permutation(8) + 1 for _ in range(3 * rows)], dtype=np.uint8)
+        weights = np.zeros((40320, len(cos_reps)), dtype=np.complex128)
+        tracemalloc.start()
+        perm_block_weights(otups, ptups, np.ones(3 * rows), cos_reps, cyclic_irreps(alpha), weights, chunk_rows=rows)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertTrue(peak <= 4.5 * 2**20)
+        self.assertTrue(alpha_mb(alpha, [((2,), (3,), (2, 1))], chunk_mb=256) >= weights_mb(alpha) + 256)
+
+if __name__ == '__main__':
+    unittest.main()
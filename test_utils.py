@@ -2,6 +2,12 @@ import unittest
 from utils import *
 from complex_utils import *
 from gen_sparse import convert_idx, block_indices
+import mpi_utils
+from mpi_utils import run_fake, partition_rows, reduce_sum, gather_rows, get_comm
+from checkpoint import JobCheckpoints, ckpt_dir
+import os
+import tempfile
+from unittest import mock
 import numpy as np
 import torch
 
@@ -93,5 +99,85 @@ class TestUtils(unittest.TestCase):
         th_res_np = make_complex(real.numpy(), imag.numpy())
         self.assertTrue(np.allclose(np_res, th_res_np))
 
+
+    def test_mpi_utils(self):
+        for nrows, size in [(10, 3), (2, 4), (1000, 7)]:
+            bounds = partition_rows(nrows, size)
+            self.assertEqual(bounds[0], 0)
+            self.assertEqual(bounds[-1], nrows)
+            self.assertTrue(np.diff(bounds).max() - np.diff(bounds).min() <= 1)
+
+        # cost and speed weighted splits still cover every row
+        cost = np.arange(1, 101)
+        bounds = partition_rows(100, 4, row_cost=cost)
+        self.assertEqual(bounds[-1], 100)
+        self.assertTrue(np.all(np.diff(bounds) >= 0))
+        shares = [cost[bounds[r]: bounds[r + 1]].sum() for r in range(4)]
+        self.assertTrue(max(shares) - min(shares) <= cost.max())
+        bounds = partition_rows(100, 2, rank_weights=[1, 3])
+        self.assertEqual(list(bounds), [0, 25, 100])
+
+        size = 5
+        mats = [np.random.random((3, 4)) for _ in range(size)]
+        total = sum(mats)
+        def _reduce(comm, method):
+            return reduce_sum(comm, mats[comm.Get_rank()].copy(), root=1, method=method)
+
+        for method in ['reduce', 'tree']:
+            res = run_fake(size, _reduce, method)
+            self.assertTrue(np.allclose(res[1], total))
+            self.assertTrue(all(res[r] is None for r in range(size) if r != 1))
+        for res in run_fake(size, _reduce, 'allreduce'):
+            self.assertTrue(np.allclose(res, total))
+
+        vals = np.arange(11.)
+        bounds = partition_rows(len(vals), 3)
+        def _gather(comm):
+            rank = comm.Get_rank()
+            return gather_rows(comm, vals[bounds[rank]: bounds[rank + 1]], bounds)
+        res = run_fake(3, _gather)
+        self.assertTrue(np.array_equal(res[0], vals))
+
+        # without mpi4py only a process that was not launched as several ranks may run alone
+        env = {var: '' for var in mpi_utils.MPI_SIZE_VARS}
+        with mock.patch.object(mpi_utils, 'MPI', None), mock.patch.dict(os.environ, env):
+            self.assertEqual(get_comm().Get_size(), 1)
+            os.environ['PMI_SIZE'] = '4'
+            self.assertRaises(RuntimeError, get_comm)
+
+    def test_checkpoint(self):
+        vals = np.random.random((20, 3))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            job = JobCheckpoints(ckpt_dir(os.path.join(tmpdir, 'res.npy')), every_rows=4)
+            ckpts = [job.rank_chunk(r, 10 * r, 10 * (r + 1)) for r in range(2)]
+
+            # interrupted run: rank 0 finishes, rank 1 stops after row 17
+            for ck, (st, en) in zip(ckpts, [(0, 10), (10, 17)]):
+                res = np.zeros(3)
+                for i in range(ck.resume(st, res), en):
+                    res += vals[i]
+                    ck.maybe_save(i + 1, res)
+            ckpts[0].save(10, ckpts[0].load()[2] + vals[8:10].sum(axis=0), done=True)
+            self.assertEqual(ckpts[1].load()[0], 14)
+
+            # restart picks up from the last checkpoint
+            ck = job.rank_chunk(1, 10, 20)
+            res = np.zeros(3)
+            start = ck.resume(10, res)
+            self.assertEqual(start, 14)
+            for i in range(start, 20):
+                res += vals[i]
+            ck.save(20, res, done=True)
+            # finished chunks load their partial sums, which the callers reduce
+            self.assertTrue(all(c.load()[1] for c in ckpts))
+            self.assertTrue(np.allclose(sum(c.load()[2] for c in ckpts), vals.sum(axis=0)))
+
+            # a checkpoint for a different row range is ignored
+            self.assertIsNone(job.rank_chunk(1, 10, 19).load())
+            self.assertEqual(list(job.load_bounds(np.array([0, 10, 20]))), [0, 10, 20])
+            self.assertEqual(list(job.load_bounds(np.array([0, 12, 20]))), [0, 10, 20])
+            job.cleanup()
+            self.assertFalse(os.path.exists(job.dirname))
+
 if __name__ == '__main__':
     unittest.main()
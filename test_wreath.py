@@ -4,10 +4,13 @@ import random
 import numpy as np
 import perm2
 import unittest
-from wreath import wreath_yor, get_mat, WreathCycSn, cyclic_irreps, wreath_rep
+from wreath import wreath_yor, get_mat, WreathCycSn, cyclic_irreps, wreath_rep, induced_rep_table, InducedRepTable
 from utils import load_irrep
 from coset_utils import young_subgroup_perm, coset_reps
 from cube_irrep import Cube2Irrep
+from multi import grouped_transform, multi_irrep_transform, plan_passes, weights_mb, grouped_inverse_transform
+import multi
+from multi import BlockAccumulator
 
 sys.path.append('./cube')
 from str_cube import *
@@ -34,6 +37,131 @@ class TestWreath(unittest.TestCase):
         eye_mat = get_mat(eye * perm2.Perm2.from_tup(g), ydict)
         self.assertTrue(np.allclose(eye_mat, eye_g_mat))
 
+    def test_induced_rep(self):
+        alpha = (1, 2, 2)
+        _parts = ((1,), (2,), (1,1))
+        ydict = wreath_yor(alpha, _parts)
+        table = induced_rep_table(alpha, _parts)
+        nblocks = table.cols.shape[1]
+        scalars = np.exp(2j * np.pi * np.random.rand(nblocks))
+        x = np.random.randn(nblocks * table.blocks.shape[1], 2)
+
+        for g in random.sample(list(ydict.keys()), 20):
+            mat = get_mat(g, ydict, scalars)
+            rep = table[g].with_scalars(scalars)
+            self.assertTrue(np.allclose(rep.to_dense(), mat, atol=1e-6))
+            self.assertTrue(np.allclose(rep.to_csr().toarray(), mat, atol=1e-6))
+            self.assertTrue(np.allclose(rep.apply(x), mat.dot(x), atol=1e-5))
+            self.assertTrue(np.isclose(rep.trace(), np.trace(mat), atol=1e-5))
+            self.assertTrue(np.allclose(get_mat(g, table), get_mat(g, ydict)))
+
+        # blocks loaded from disk are separate objects, they should still be shared
+        copied = {g: {ij: mat.copy() for ij, mat in rep.items()} for g, rep in ydict.items()}
+        dict_table = InducedRepTable.from_block_dict(copied)
+        self.assertEqual(dict_table.n, 5)
+        self.assertLessEqual(len(dict_table.blocks), len(table.blocks))
+        for g in random.sample(list(ydict.keys()), 20):
+            self.assertTrue(np.allclose(get_mat(g, dict_table), get_mat(g, ydict)))
+
+    def test_grouped_transform(self):
+        alpha = (0, 3, 2)
+        _parts = ((), (2,1), (1,1))
+        ydict = wreath_yor(alpha, _parts)
+        cos_reps = coset_reps(perm2.sn(5), young_subgroup_perm(alpha))
+        cyc_func = cyclic_irreps(alpha)
+
+        rng = np.random.RandomState(0)
+        ptups = perm2.PermArray.sn(5).perms[rng.randint(0, 120, size=300)]
+        otups = rng.randint(0, 3, size=(300, 5)).astype(np.uint8)
+        dists = rng.randint(0, 10, size=300)
+
+        mat = grouped_transform(otups, ptups, dists, ydict, alpha, _parts, chunk_rows=64)
+        table_mat = grouped_transform(otups, ptups, dists, induced_rep_table(alpha, _parts), alpha, _parts)
+        self.assertTrue(np.allclose(mat, table_mat))
+        expected = sum(d * wreath_rep(tuple(o), tuple(p), ydict, cos_reps, cyc_func)
+                       for o, p, d in zip(otups, ptups, dists))
+        self.assertTrue(np.allclose(mat, expected, atol=1e-4))
+
+    def test_grouped_inverse_transform(self):
+        alpha = (1, 2, 2)
+        _parts = ((1,), (2,), (1,1))
+        ydict = wreath_yor(alpha, _parts)
+        table = induced_rep_table(alpha, _parts)
+        cos_reps = coset_reps(perm2.sn(5), young_subgroup_perm(alpha))
+        cyc_func = cyclic_irreps(alpha)
+
+        rng = np.random.RandomState(0)
+        dim = table.cols.shape[1] * table.blocks.shape[1]
+        fhat = rng.randn(dim, dim) + 1j * rng.randn(dim, dim)
+        otups = rng.randint(0, 3, size=(6, 5))
+        vals = grouped_inverse_transform(fhat, table, otups, alpha, chunk_mb=0.01)
+        for i, otup in enumerate(otups):
+            for r in rng.randint(0, 120, size=10):
+                ptup = perm2.tup_unrank(int(r), 5)
+                wmat = wreath_rep(tuple(otup), ptup, ydict, cos_reps, cyc_func)
+                expected = dim * np.dot(fhat.T.ravel(), wmat.conj().T.ravel())
+                self.assertTrue(np.allclose(vals[i, r], expected, atol=1e-4))
+
+        out = np.ones(vals.shape)
+        grouped_inverse_transform(fhat, table, otups, alpha, out=out)
+        self.assertTrue(np.allclose(out, 1 + vals.real))
+
+    def test_block_accumulator(self):
+        alpha = (1, 2, 2)
+        _parts = ((1,), (2,), (1,1))
+        ydict = wreath_yor(alpha, _parts)
+        table = induced_rep_table(alpha, _parts)
+        m = table.cols.shape[1]
+        d = table.blocks.shape[1]
+        perms = random.sample(list(ydict.keys()), 10)
+        coefs = np.random.randn(len(perms), m) + 1j * np.random.randn(len(perms), m)
+
+        acc = BlockAccumulator(d, m)
+        for p, c in zip(perms, coefs):
+            acc.add(ydict[p], 2, c)
+        expected = sum(2 * get_mat(p, ydict, c).astype(np.complex128) for p, c in zip(perms, coefs))
+        self.assertTrue(np.allclose(acc.to_matrix(), expected))
+
+        # in place per block path that is used for large blocks
+        small_block = multi.SMALL_BLOCK
+        multi.SMALL_BLOCK = 0
+        acc = BlockAccumulator(d, m)
+        for p, c in zip(perms, coefs):
+            acc.add(ydict[p], 2, c)
+        multi.SMALL_BLOCK = small_block
+        self.assertTrue(np.allclose(acc.to_matrix(), expected))
+
+        acc = BlockAccumulator(d, m)
+        acc.add_batch([ydict[p] for p in perms + perms], np.concatenate([coefs, coefs]))
+        self.assertTrue(np.allclose(acc.to_matrix(), expected))
+
+        acc = BlockAccumulator(d, m)
+        ranks = perm2.perm_rank(np.array(perms + perms))
+        acc.add_table(table, ranks, np.concatenate([coefs, coefs]))
+        self.assertTrue(np.allclose(acc.to_matrix(), expected))
+
+    def test_multi_irrep_transform(self):
+        irreps = [((0, 3, 2), ((), (2,1), (1,1))), ((0, 3, 2), ((), (3,), (2,))), ((1, 2, 2), ((1,), (2,), (1,1)))]
+        ydicts = {irr: wreath_yor(*irr) for irr in irreps}
+
+        rng = np.random.RandomState(1)
+        ptups = perm2.PermArray.sn(5).perms[rng.randint(0, 120, size=200)]
+        otups = rng.randint(0, 3, size=(200, 5)).astype(np.uint8)
+        dists = rng.randint(0, 10, size=200)
+        chunk_func = lambda: ((otups[i: i+50], ptups[i: i+50], dists[i: i+50]) for i in range(0, 200, 50))
+
+        # both alphas fit in one pass, only one fits when the budget is small
+        self.assertEqual(len(plan_passes(irreps, max_mb=10)), 1)
+        self.assertEqual(len(plan_passes(irreps, max_mb=weights_mb((1, 2, 2)))), 2)
+
+        results = {}
+        save_func = lambda alpha, parts, mat: results.__setitem__((alpha, parts), mat)
+        multi_irrep_transform(chunk_func, irreps, lambda a, p: ydicts[(a, p)], save_func, max_mb=0, chunk_mb=0.001)
+        self.assertEqual(len(results), len(irreps))
+        for alpha, parts in irreps:
+            expected = grouped_transform(otups, ptups, dists, ydicts[(alpha, parts)], alpha, parts)
+            self.assertTrue(np.allclose(results[(alpha, parts)], expected))
+
     def test_wreath_full(self):
         o1, p1 = get_wreath('YYRMRMWWRWRYWMYMGGGGBBBB') # 14
         o2, p2 = get_wreath('YYBWGYRWMRBWMRMGYBRBGGMW') # 3
@@ -1,10 +1,12 @@
 import os
 import sys
+import argparse
 sys.path.append('../')
 from utils import check_memory
 import pdb
 from collections import deque
 from tile_env import TileEnv, neighbors
+from rank_bfs import TilePuzzle, bfs_to_file, UNVISITED
 
 def np_to_tup(grid):
     return tuple(i for row in grid for i in row)
@@ -36,12 +38,26 @@ def bfs(root, fname):
     check_memory()
     return dist_dict
 
-def main():
-    n = int(sys.argv[1])
-    if len(sys.argv) > 2:
-        prefix = sys.argv[2]
-    else:
-        prefix = '/local/hopan/tile/'
+def rank_bfs(n, fname):
+    '''
+    BFS from the solved grid over permutation ranks of the grid (see rank_bfs.TilePuzzle)
+    fname: .npy file to write the uint8 distance of every grid rank to
+    Returns: memmapped distance array
+    '''
+    print('Writing to: {}'.format(fname))
+    puzzle = TilePuzzle(n)
+    res = bfs_to_file(puzzle, [puzzle.rank(TileEnv.solved_grid(n))], fname)
+    check_memory()
+    return res
+
+def main(args):
+    n = args.n
+    prefix = args.prefix
+    if args.rank:
+        res = rank_bfs(n, os.path.join(prefix, 'tile{}_dists.npy'.format(n)))
+        print('Num states: {}'.format((res != UNVISITED).sum()))
+        return
+
     fname = os.path.join(prefix, 'tile{}.txt'.format(n))
     print('Saving in: {}'.format(fname))
     start_state = TileEnv.solved_grid(n)
@@ -49,4 +65,9 @@ def main():
     print('Num states: {}'.format(len(res)))
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('n', type=int)
+    parser.add_argument('prefix', type=str, nargs='?', default='/local/hopan/tile/')
+    parser.add_argument('--rank', action='store_true')
+    args = parser.parse_intermixed_args()
+    main(args)
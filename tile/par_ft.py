@@ -9,21 +9,47 @@ from young_tableau import FerrersDiagram
 from multiprocessing import Pool
 from perm2 import Perm2
 from utils import check_memory
+from checkpoint import JobCheckpoints, ckpt_dir
 import pandas as pd
 import numpy as np
 
-def fts(df, ferrers):
+def fts(df, ferrers, ckpt=None):
+    '''
+    df: DataFrame chunk of (perm string, value) rows
+    ferrers: FerrersDiagram of the irrep
+    ckpt: (optional) Checkpoint of this chunk. The partial sum is checkpointed every so many
+        rows and a restarted job skips the rows that were already added.
+    '''
     res = None
-    for idx, row in df.iterrows():
+    start = 0
+    if ckpt is not None:
+        state = ckpt.load()
+        if state is not None:
+            start, done, res = state
+            if done:
+                return res
+
+    for i, (idx, row) in enumerate(df.iterrows()):
+        if i < start:
+            continue
         ptup = tuple(int(x) for x in row[0])
         perm = Perm2.from_tup(ptup)
         if res is None:
             res = row[1] * yor(ferrers, perm, use_cache=False)
         else:
             res += (row[1] * yor(ferrers, perm, use_cache=False))
+        if ckpt is not None:
+            ckpt.maybe_save(i + 1, res)
+
+    if ckpt is not None and res is not None:
+        ckpt.save(len(df), res, done=True)
     return res 
 
-def par_ft(partition, fname, savedir, ncpu=16):
+def par_ft(partition, fname, savedir, ncpu=16, ckpt_rows=None, ckpt_mins=None):
+    '''
+    ckpt_rows: checkpoint each chunk's partial sum every this many rows
+    ckpt_mins: checkpoint each chunk's partial sum every this many minutes
+    '''
     if not os.path.exists(savedir):
         try:
             print('Directory {} doesnt exist. creating it now'.format(savedir))
@@ -38,17 +64,26 @@ def par_ft(partition, fname, savedir, ncpu=16):
     check_memory()
 
     df_chunk = np.array_split(df, ncpu)
-    arg_tups = [(chunk, ferrers) for chunk in df_chunk]
     savename = os.path.join(savedir, str(partition))
     print('Saving in: {}'.format(savename))
     if os.path.exists(savename):
         print('{} exists. Not running'.format(savename))
 
+    job_ckpt = None
+    chunk_ckpts = [None] * len(df_chunk)
+    if ckpt_rows or ckpt_mins:
+        job_ckpt = JobCheckpoints(ckpt_dir(savename), ckpt_rows, ckpt_mins * 60 if ckpt_mins else None)
+        chunk_ckpts = [job_ckpt.chunk('chunk_{}'.format(i), key='{}-{}'.format(chunk.index[0], chunk.index[-1]) if len(chunk) else '')
+                       for i, chunk in enumerate(df_chunk)]
+    arg_tups = [(chunk, ferrers, ck) for chunk, ck in zip(df_chunk, chunk_ckpts)]
+
     with Pool(ncpu) as p:
         map_res = p.starmap(fts, arg_tups)
         # sum of these matrices is what we wnat
         fourier_mat = sum(map_res)
         np.save(savename, fourier_mat)
+        if job_ckpt is not None:
+            job_ckpt.cleanup()
         return fourier_mat
 
 def test_one():
@@ -68,13 +103,15 @@ if __name__ == '__main__':
     parser.add_argument('--ncpu', type=int, default=8)
     parser.add_argument('--fname', type=str, default='/local/hopan/tile/tile3.txt') 
     parser.add_argument('--savedir', type=str, default='/local/hopan/tile/fourier_eval') 
+    parser.add_argument('--ckpt_rows', type=int, default=None, help='checkpoint every this many rows (off by default)')
+    parser.add_argument('--ckpt_mins', type=float, default=None, help='checkpoint every this many minutes (off by default)')
     args = parser.parse_args()
     args.partition = eval(args.partition)
     print('Arguments:')
     print(args)
 
     start =time.time()
-    res = par_ft(args.partition, args.fname, args.savedir, args.ncpu)
+    res = par_ft(args.partition, args.fname, args.savedir, args.ncpu, args.ckpt_rows, args.ckpt_mins)
     print('Done | Fourier matrix size: {}'.format(res.shape))
     end = time.time()
     print('Elapsed time: {:.2f}s'.format(end - start))
@@ -9,7 +9,8 @@ from yor import yor
 from young_tableau import FerrersDiagram
 from multiprocessing import Pool
 from perm2 import Perm2
-from utils import check_memory
+from utils import check_memory, partitions
+from fft import ifft
 import pandas as pd
 import numpy as np
 
@@ -44,6 +45,19 @@ def inv_transform(perm_df, ferrers):
  
     return ifts
 
+def fast_inv_transform(fhat_dir, n, parts=None):
+    '''
+    Evaluate the inverse transform at every element of S_n at once with fft.ifft
+    fhat_dir: directory of the saved fourier matrices ({partition}.npy)
+    n: integer
+    parts: (optional) list of partitions to use. Defaults to all partitions of n
+    Returns: numpy array of length n!, indexed by perm2.perm_rank
+    '''
+    if parts is None:
+        parts = partitions(n)
+    fhats = {p: np.load(os.path.join(fhat_dir, '{}.npy'.format(p))) for p in parts}
+    return ifft(fhats, n)
+
 def par_inv_ft(partition, fname, savedir, ncpu=16):
     if not os.path.exists(savedir):
         try:
@@ -15,6 +15,7 @@ from io_utils import get_prefix
 from tile_env import *
 from tile_env import neighbors as tile_neighbors
 from tile_utils import tup_to_str
+from batch_mcts import BatchMCTS, batch_solve
 
 np.set_printoptions(precision=5)
 
@@ -156,7 +157,32 @@ class MCTS(object):
         return np.flatnonzero(dists == dists.max())
         #return max(TileEnv.MOVES, key=lambda x: get_val(x, nbrs))
 
-def solve(state, model, env, log, time_limit=None, max_steps=None, coeff=1):
+class BatchTileMCTS(BatchMCTS):
+    '''
+    MCTS that evaluates batch_size leaves per search with one model call (see batch_mcts).
+    States are perm tuples of the grid.
+    '''
+    def __init__(self, root_grid, model, env, coeff=1, batch_size=16, virtual_loss=1):
+        super(BatchTileMCTS, self).__init__(grid_to_tup(root_grid), env.action_space.n, coeff, batch_size, virtual_loss)
+        self.root_grid = root_grid
+        self.model = model
+        self.env = env
+
+    def expand(self, states):
+        nbrs = []
+        for state in states:
+            grid_nbrs_dict = tile_neighbors(tup_to_grid(state))
+            nbrs.append([grid_to_tup(grid_nbrs_dict[a]) for a in TileEnv.MOVES])
+        solved = np.array([[TileEnv.is_solved_perm(s) for s in state_nbrs] for state_nbrs in nbrs])
+        return nbrs, solved
+
+    def evaluate(self, states):
+        onehots = np.array([tup_to_onehot(t) for t in states])
+        with torch.no_grad():
+            vals = self.model.forward(torch.from_numpy(onehots).float())
+        return vals.cpu().numpy().reshape(len(states), -1).max(axis=1)
+
+def solve(state, model, env, log, time_limit=None, max_steps=None, coeff=1, batch_size=1):
     '''
     state: cube state (currently this is a string)
     model: something that implements forward to compute values
@@ -165,7 +191,11 @@ def solve(state, model, env, log, time_limit=None, max_steps=None, coeff=1):
     time_limit: int seconds allowed to run
     max_steps: int number of nodes allowed to explore
     coeff: float, how much to weight exploration
+    batch_size: number of leaves to evaluate per model call. Values > 1 use BatchTileMCTS.
     '''
+    if batch_size > 1:
+        return batch_solve(BatchTileMCTS(state, model, env, coeff, batch_size), time_limit, max_steps)
+
     tree = MCTS(state, model, env, coeff)
     # number of steps == max
     nsteps = 0
@@ -198,6 +228,7 @@ def main():
     parser.add_argument('--seed', type=int, default=0)
     parser.add_argument('--tile_size', type=int, default=3)
     parser.add_argument('--coeff', type=float, default=1)
+    parser.add_argument('--batch_size', type=int, default=1)
     args = parser.parse_args()
 
     random.seed(args.seed)
@@ -219,7 +250,8 @@ def main():
 
     for c in grid_puzzles:
         # c is a grid
-        res, tree = solve(c, model, env, log, max_steps=args.max_steps, time_limit=args.time_limit, coeff=args.coeff)
+        res, tree = solve(c, model, env, log, max_steps=args.max_steps, time_limit=args.time_limit, coeff=args.coeff,
+                          batch_size=args.batch_size)
         if res is None:
             log.info('Unable to solve: {} | total explored: {}'.format(c, tree.nexplored))
             notsolved.append(c)
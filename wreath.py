@@ -1,17 +1,19 @@
 from multiprocessing import Manager, Process
 import os
 import sys
+import math
 import time
 from functools import reduce
 import pdb
 from yor import load_yor
+from irrep_store import IrrepStore, irrep_store_path
 import numpy as np
 from scipy.sparse import csr_matrix
 from utils import check_memory, chunk
 import perm2
 from young_tableau import FerrersDiagram
-from yor import yor
-from coset_utils import coset_reps, young_subgroup_perm, young_subgroup, tup_set
+from yor import yor, yor_table
+from coset_utils import coset_reps, young_subgroup_perm, young_subgroup, tup_set, coset_action_table
 import torch
 
 def dot(perm, cyc):
@@ -43,13 +45,18 @@ def dot_tup_inv(perm, tup):
 def block_cyclic_irreps(tup, coset_reps, cyclic_irrep_func):
     '''
     tup: tuple
-    coset_reps: list of Perm2 objects
+    coset_reps: list of Perm2 objects or a PermArray
     cyclic_irrep_func: function from tuple -> cyclic_irrep
     Return a dictionary mapping coset rep index -> cyclic irrep
     Ex:
         coset_reps = [pi_0, pi_1, ...]
         Returns: {0: cyclic_irrep_func(f \dot pi_0), 1: cyclic_irrep_func(f \dot pi_1), ...}
     '''
+    if isinstance(coset_reps, perm2.PermArray):
+        # row i is the tuple permuted by coset rep i
+        tups = np.asarray(tup)[coset_reps.perms.astype(np.intp) - 1]
+        return np.asarray(cyclic_irrep_func(tups), dtype=np.complex64)
+
     scalars = np.zeros(len(coset_reps), dtype=np.complex64)
     for idx, rep in enumerate(coset_reps):
         tup_g = dot_tup_inv(rep, tup) # original tuple is f(x) |-> f(g(x))
@@ -123,22 +130,23 @@ class WreathCycSn:
 def cyclic_irreps(weak_partition):
     '''
     Returns a function that computes the cyclic irrep portion
-    of the wreath product irreps of the 2x2 cube.
-    weak_partition: a tuple of length 3
+    of the wreath product irreps of Z_k wr S_n, where k = len(weak_partition)
+    (k = 3 for the 2x2 cube, k = 2 for the pyraminx).
+    weak_partition: a tuple of length k
 
-    Returns a function that takes in an 8 tuple and returns the
-        product of the cyclic irreps (float)
+    Returns a function that takes in an n tuple and returns the
+        product of the cyclic irreps (float). The function also takes numpy arrays
+        of shape (..., n) and returns an array of shape (...)
     '''
-    idx0 = weak_partition[0]
-    idx1 = weak_partition[0] + weak_partition[1]
-    g_x = ((0,) * weak_partition[0]) + ((1,) * weak_partition[1]) + ((2,) * weak_partition[2])
+    k = len(weak_partition)
+    idx = np.cumsum((0,) + tuple(weak_partition))
     def func(tup):
-        p1 = sum(tup[:idx0])
-        p2 = sum(tup[idx0: idx1])
-        p3 = sum(tup[idx1:])
-        return np.exp(2j * np.pi * 0 * p1 / 3.) * \
-               np.exp(2j * np.pi * 1 * p2 / 3.) * \
-               np.exp(2j * np.pi * 2 * p3 / 3.)
+        tup = np.asarray(tup)
+        res = 1
+        for j in range(1, k):
+            pj = tup[..., idx[j]: idx[j + 1]].sum(axis=-1)
+            res = res * np.exp(2j * np.pi * j * pj / k)
+        return res
 
     return func
 
@@ -152,7 +160,10 @@ def load_partition(partition, prefix='/local/hopan/irreps/'):
     if n == 0:
         return None
 
-    if os.path.exists(prefix):
+    store_fname = irrep_store_path(prefix, partition)
+    if os.path.exists(store_fname):
+        return IrrepStore(store_fname)
+    elif os.path.exists(prefix):
         prefix = '/local/hopan/irreps'
         fname = os.path.join(prefix,  's_{}/{}.pkl'.format(n, '_'.join(map(str, partition))))
         yd = load_yor(fname, partition)
@@ -163,14 +174,8 @@ def load_partition(partition, prefix='/local/hopan/irreps/'):
         yd = load_yor(fname, partition)
         return yd
     else:
-        n = sum(partition)
-        _sn = perm2.sn(n)
-        ferr = FerrersDiagram(partition)
-        rep_dict = {}
-        for p in _sn:
-            rep_dict[p.tup_rep] = yor(ferr, p)
-
-        return rep_dict
+        ferr = FerrersDiagram.from_partition(partition)
+        return dict(yor_table(ferr))
 
 def canonical_order(tup_rep):
     new_tup_rep = []
@@ -223,25 +228,21 @@ def young_subgroup_yor(alpha, _parts, prefix='/local/hopan/irreps/'):
 
     return wreath_dict
 
-def _proc_yor(perms, young_yor, young_sub_set, reps, rep_dict):
-    '''
-    perms: list of perm objects or tuples?
-    young_yor: 
-    young_sub_set:
-    reps:
-    rep_dict: save dict
-    '''
-    for g in perms:
-        g_rep = {}
-        for i, t_i in enumerate(reps):
-            for j, t_j in enumerate(reps):
-                tiinv_g_tj = t_i.inv() * g * t_j
-                if tiinv_g_tj.tup_rep in young_sub_set:
-                    g_rep[(i, j)] = young_yor[tiinv_g_tj.tup_rep]
-                    break
-        rep_dict[g.tup_rep] = g_rep
-
-def wreath_yor_par(alpha, _parts, prefix='/local/hopan/', par=8):
+def _wreath_yor_from_table(alpha, young_yor):
+    n = sum(alpha)
+    young_sub = young_subgroup_perm(alpha)
+    h_blocks = [young_yor[h.tup_rep] for h in young_sub]
+    action, residual = coset_action_table(alpha)
+    tups = perm2.perm_unrank(np.arange(math.factorial(n)), n)
+
+    rep_dict = {}
+    for g, g_action, g_residual in zip(tups, action, residual):
+        # key the blocks by block row like the original search did
+        rep_dict[tuple(g.tolist())] = {(int(g_action[j]), int(j)): h_blocks[g_residual[j]]
+                                       for j in np.argsort(g_action)}
+    return rep_dict
+
+def wreath_yor(alpha, _parts, prefix='/local/hopan/'):
     '''
     alpha: weak partition of 8 into 3 parts?
     _parts: list of partitions of each part of alpha
@@ -252,67 +253,167 @@ def wreath_yor_par(alpha, _parts, prefix='/local/hopan/', par=8):
         alpha = (0, 0, 0, 0, 1, 1, 1, 1)
         _parts = [(2,2), (3,1)]
     '''
-    #print('Wreath yor with {} processes'.format(par))
-    n = sum(alpha)
-    _sn = perm2.sn(n, prefix)
-    young_sub = young_subgroup_perm(alpha)
-    young_sub_set = tup_set(young_sub)
     young_yor = young_subgroup_yor(alpha, _parts, os.path.join(prefix, 'irreps'))
-    reps = coset_reps(_sn, young_sub)
+    return _wreath_yor_from_table(alpha, young_yor)
 
-    sn_chunks = chunk(_sn, par)
-    manager = Manager()
-    rep_dict = manager.dict()
-    nprocs = []
+# Building from coset_action_table is linear in |G| * m, so the worker process version
+# is gone. The name is kept for old callers.
+wreath_yor_par = wreath_yor
 
-    for i in range(par):
-        perms = sn_chunks[i]
-        proc = Process(target=_proc_yor, args=[perms, young_yor, young_sub_set, reps, rep_dict])
-        nprocs.append(proc)
+class InducedRep:
+    '''
+    Block monomial matrix of an induced representation evaluated at one group element.
+    Block row i has exactly one nonzero block, sitting in block column cols[i]:
+        scalars[i] * blocks[i]
+    The blocks are views into a table shared by all group elements (see InducedRepTable).
+    '''
+    def __init__(self, cols, blocks, scalars=None):
+        '''
+        cols: numpy int array of length m (number of cosets)
+        blocks: numpy array of shape (m, d, d)
+        scalars: (optional) numpy array of length m of block scalars
+        '''
+        self.cols = cols
+        self.blocks = blocks
+        self.scalars = scalars
 
-    for p in nprocs:
-        p.start()
-    for p in nprocs:
-        p.join()
+    @property
+    def nblocks(self):
+        return len(self.cols)
 
-    return rep_dict
+    @property
+    def block_size(self):
+        return self.blocks.shape[1]
 
+    @property
+    def shape(self):
+        size = self.nblocks * self.block_size
+        return (size, size)
 
-def wreath_yor(alpha, _parts, prefix='/local/hopan/'):
+    @property
+    def dtype(self):
+        if self.scalars is None:
+            return self.blocks.dtype
+        return np.result_type(self.blocks.dtype, self.scalars.dtype)
+
+    def with_scalars(self, scalars):
+        '''
+        scalars: numpy array of length m, ex: the output of block_cyclic_irreps
+        Returns: InducedRep with each block row scaled by scalars
+        '''
+        return InducedRep(self.cols, self.blocks, scalars)
+
+    def _scaled_blocks(self):
+        if self.scalars is None:
+            return self.blocks
+        return self.scalars[:, None, None] * self.blocks
+
+    def apply(self, x):
+        '''
+        Multiply the matrix with a vector or a matrix.
+        x: numpy array of shape (m * d,) or (m * d, k)
+        Returns: numpy array of the same shape as x
+        '''
+        m, d = self.nblocks, self.block_size
+        xb = x.reshape(m, d, -1)[self.cols]
+        res = np.matmul(self._scaled_blocks(), xb)
+        return res.reshape(x.shape)
+
+    def to_dense(self):
+        m, d = self.nblocks, self.block_size
+        mat = np.zeros((m, d, m, d), dtype=self.dtype)
+        mat[np.arange(m), :, self.cols, :] = self._scaled_blocks()
+        return mat.reshape(m * d, m * d)
+
+    def to_csr(self):
+        m, d = self.nblocks, self.block_size
+        # row i * d + r holds the d entries of row r of block i, in columns cols[i] * d + c
+        indices = (self.cols[:, None, None] * d + np.arange(d)[None, None, :]).repeat(d, axis=1)
+        indptr = np.arange(0, m * d * d + 1, d)
+        return csr_matrix((self._scaled_blocks().ravel(), indices.ravel(), indptr), shape=self.shape)
+
+    def trace(self):
+        diag = np.flatnonzero(self.cols == np.arange(self.nblocks))
+        traces = np.trace(self.blocks[diag], axis1=1, axis2=2)
+        if self.scalars is not None:
+            traces = traces * self.scalars[diag]
+        return traces.sum()
+
+class InducedRepTable:
     '''
-    alpha: weak partition of 8 into 3 parts?
+    InducedReps of every element of S_n stored as flat arrays in perm_rank order:
+        cols: (n!, m) coset permutation of each group element
+        block_idx: (n!, m) index into blocks of the block in each block row
+        blocks: (|H|, d, d) Young subgroup matrices shared by all elements
+    Indexing by a permutation tuple (or Perm2) returns an InducedRep, so the table
+    can be used where the {perm tuple: {(i, j): matrix}} dicts of wreath_yor are used.
+    '''
+    def __init__(self, n, cols, block_idx, blocks):
+        '''
+        n: size of the permutations
+        cols, block_idx, blocks: see the class docstring
+        '''
+        self.n = n
+        self.cols = cols
+        self.block_idx = block_idx
+        self.blocks = blocks
+
+    @staticmethod
+    def from_block_dict(yor_dict):
+        '''
+        yor_dict: dict mapping perm tuple -> (dict of (i, j) -> matrix), as returned by wreath_yor
+        Returns: InducedRepTable
+        '''
+        n = len(next(iter(yor_dict.keys())))
+        m = len(next(iter(yor_dict.values())))
+        cols = np.zeros((len(yor_dict), m), dtype=np.int32)
+        block_idx = np.zeros((len(yor_dict), m), dtype=np.int32)
+        blocks = []
+        block_ids = {}
+        ranks = perm2.perm_rank(np.array(list(yor_dict.keys()), dtype=np.uint8))
+        for r, g_rep in zip(ranks, yor_dict.values()):
+            for (i, j), mat in g_rep.items():
+                cols[r, i] = j
+                # blocks are shared between group elements, dedupe on the matrix entries
+                key = mat.tobytes()
+                if key not in block_ids:
+                    block_ids[key] = len(blocks)
+                    blocks.append(mat)
+                block_idx[r, i] = block_ids[key]
+
+        return InducedRepTable(n, cols, block_idx, np.stack(blocks))
+
+    def __len__(self):
+        return len(self.cols)
+
+    def __getitem__(self, g):
+        if isinstance(g, (perm2.Perm2, perm2.TupPerm)):
+            g = g.tup_rep
+        r = perm2.tup_rank(g)
+        return InducedRep(self.cols[r], self.blocks[self.block_idx[r]])
+
+    def keys(self):
+        for r in range(len(self)):
+            yield perm2.tup_unrank(r, self.n)
+
+def induced_rep_table(alpha, _parts, prefix='/local/hopan/'):
+    '''
+    Vectorized, compact version of wreath_yor.
+    alpha: weak partition
     _parts: list of partitions of each part of alpha
-    Return a dict mapping group elmeent in S_8 -> rep
-    The rep actually needs to be a dictionary of tuples (i, j) -> matrix
-    where the i, j denote the i, j block in the matrix.
-    Ex:
-        alpha = (0, 0, 0, 0, 1, 1, 1, 1)
-        _parts = [(2,2), (3,1)]
+    Returns: InducedRepTable
     '''
-    n = sum(alpha)
-    _sn = perm2.sn(n, prefix)
-    young_sub = young_subgroup_perm(alpha)
-    young_sub_set = tup_set(young_sub)
     young_yor = young_subgroup_yor(alpha, _parts, os.path.join(prefix, 'irreps'))
-    reps = coset_reps(_sn, young_sub)
-    rep_dict = {}
+    blocks = np.stack([young_yor[h.tup_rep] for h in young_subgroup_perm(alpha)])
+    action, residual = coset_action_table(alpha)
 
-    # this part can be parallelized
-    # loop over the group
-    # things we need are: group element inv, group element multiplication
-    # then grabbing the yor for the appropriate yor thing
-    for g in _sn:
-        g_rep = {}
-        for i, t_i in enumerate(reps):
-            for j, t_j in enumerate(reps):
-                tiinv_g_tj = t_i.inv() * g * t_j
-                if tiinv_g_tj.tup_rep in young_sub_set:
-                    g_rep[(i, j)] = young_yor[tiinv_g_tj.tup_rep]
-                    break
-
-        rep_dict[g.tup_rep] = g_rep 
-
-    return rep_dict
+    # block row action[g, j] has its block in column j
+    rows = np.arange(len(action))[:, None]
+    cols = np.zeros(action.shape, dtype=np.int32)
+    block_idx = np.zeros(action.shape, dtype=np.int32)
+    cols[rows, action] = np.arange(action.shape[1])
+    block_idx[rows, action] = residual
+    return InducedRepTable(sum(alpha), cols, block_idx, blocks)
 
 def get_mat(g, yor_dict, block_scalars=None):
     '''
@@ -321,6 +422,12 @@ def get_mat(g, yor_dict, block_scalars=None):
 
     Returns matrix for this ydict
     '''
+    if isinstance(yor_dict, InducedRepTable):
+        rep = yor_dict[g]
+        if block_scalars is not None:
+            rep = rep.with_scalars(np.asarray(block_scalars))
+        return rep.to_dense().astype(np.complex64)
+
     if type(g) == tuple:
         yg = yor_dict[g]
     else:
@@ -6,15 +6,111 @@ import pdb
 import math
 import itertools
 import time
+from collections import OrderedDict
 from utils import check_memory, partitions
 import numpy as np
 from young_tableau import YoungTableau, FerrersDiagram
 from perm2 import sn
+from irrep_store import IrrepStore, IRREP_EXT, irrep_store_path, write_irrep_store
 
-# TODO: make this a tiered dict?
-YOR_CACHE = {}
-YOR_T_CACHE = {}
-CACHE = {'hit': 0, 'sparse_hit': 0}
+class MatrixCache:
+    '''
+    LRU cache of numpy matrices keyed by (partition, permutation tuple) with a memory budget.
+    Entries are evicted least recently used first once the total memory budget (or the budget
+    of the entry's partition) is exceeded.
+    '''
+    def __init__(self, max_mb=None, part_mb=None):
+        '''
+        max_mb: total memory budget in megabytes. None for an unbounded cache
+        part_mb: (optional) dict mapping partition -> memory budget in megabytes for the
+            entries of that partition
+        '''
+        self._data = OrderedDict()
+        self._part_data = {}
+        self.nbytes = 0
+        self.part_nbytes = {}
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.set_budget(max_mb, part_mb)
+
+    def set_budget(self, max_mb=None, part_mb=None):
+        self.max_bytes = None if max_mb is None else int(max_mb * (2 ** 20))
+        self.part_max_bytes = {p: int(mb * (2 ** 20)) for p, mb in (part_mb or {}).items()}
+        self._evict()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        '''
+        Returns the cached matrix or None, and updates the hit/miss counters
+        '''
+        mat = self._data.get(key)
+        if mat is None:
+            self.stats['misses'] += 1
+            return None
+
+        self.stats['hits'] += 1
+        self._data.move_to_end(key)
+        self._part_data[key[0]].move_to_end(key)
+        return mat
+
+    def put(self, key, mat):
+        if key in self._data:
+            self._remove(key)
+
+        part = key[0]
+        self._data[key] = mat
+        self._part_data.setdefault(part, OrderedDict())[key] = mat
+        self.nbytes += mat.nbytes
+        self.part_nbytes[part] = self.part_nbytes.get(part, 0) + mat.nbytes
+        self._evict(part)
+
+    def clear(self):
+        self._data.clear()
+        self._part_data.clear()
+        self.nbytes = 0
+        self.part_nbytes.clear()
+
+    def _remove(self, key):
+        mat = self._data.pop(key)
+        self._part_data[key[0]].pop(key)
+        self.nbytes -= mat.nbytes
+        self.part_nbytes[key[0]] -= mat.nbytes
+
+    def _evict(self, part=None):
+        parts = self.part_max_bytes.keys() if part is None else [part]
+        for p in parts:
+            max_bytes = self.part_max_bytes.get(p)
+            while max_bytes is not None and self.part_nbytes.get(p, 0) > max_bytes:
+                self._remove(next(iter(self._part_data[p])))
+                self.stats['evictions'] += 1
+
+        while self.max_bytes is not None and self.nbytes > self.max_bytes:
+            self._remove(next(iter(self._data)))
+            self.stats['evictions'] += 1
+
+YOR_CACHE = MatrixCache(max_mb=1024)
+YOR_T_CACHE = MatrixCache()
+YOR_T_SPARSE_CACHE = {}
+
+def set_yor_cache_budget(max_mb, part_mb=None):
+    '''
+    max_mb: total memory budget in megabytes for cached yor matrices. None for unbounded
+    part_mb: (optional) dict mapping partition -> memory budget in megabytes
+    '''
+    YOR_CACHE.set_budget(max_mb, part_mb)
+
+def yor_cache_stats():
+    '''
+    Returns a dict of the hit/miss/eviction counters and memory usage of the yor caches
+    '''
+    return {
+        'yor': dict(YOR_CACHE.stats, size=len(YOR_CACHE), mb=YOR_CACHE.nbytes / (2 ** 20)),
+        'yor_trans': dict(YOR_T_CACHE.stats, size=len(YOR_T_CACHE), mb=YOR_T_CACHE.nbytes / (2 ** 20)),
+    }
 
 def cycle_to_adj_transpositions(cyc, n):
     '''
@@ -24,9 +120,18 @@ def cycle_to_adj_transpositions(cyc, n):
     Generate perm = [cyc(i) for i in range(1, n+1)]
     TODO: can we do this without creating the mapping list
     '''
-    # do bubble sort to turn this into a product of adjacent transpositions
     cyc_map = lambda x: x if x not in cyc else cyc[(cyc.index(x) + 1) % len(cyc)]
     perm = [ cyc_map(i) for i in range(1, n+1)]
+    return tup_to_adj_transpositions(perm)
+
+def tup_to_adj_transpositions(tup):
+    '''
+    tup: tuple of ints, permutation in tuple form
+    Returns: list of adjacent transpositions (k, k+1) whose product (in order) is the permutation
+    '''
+    # do bubble sort to turn this into a product of adjacent transpositions
+    perm = list(tup)
+    n = len(perm)
     factors = []
 
     for i in range(n):
@@ -60,28 +165,20 @@ def yor(ferrers, permutation, use_cache=True):
     Returns: an irrep matrix of size d x d, where d is the number of standard tableaux of the
     given FerrersDiagram shape
     '''
-    if (ferrers, permutation.tup_rep) in YOR_CACHE:
-        CACHE['hit'] += 1
-        return YOR_CACHE[(ferrers.partition, permutation.tup_rep)]
+    key = (ferrers.partition, permutation.tup_rep)
+    if use_cache:
+        res = YOR_CACHE.get(key)
+        if res is not None:
+            return res
 
     if all(map(lambda x: len(x) <= 1, permutation.cycle_decomposition)):
         # TODO: make a static/class function for this
-        n = len(FerrersDiagram.TABLEAUX_CACHE[ferrers.partition])
-        YOR_CACHE[(ferrers.partition, permutation.tup_rep)] = np.eye(n)
-        return YOR_CACHE[(ferrers.partition, permutation.tup_rep)]
+        res = np.eye(len(FerrersDiagram.TABLEAUX_CACHE[ferrers.partition]))
+    else:
+        res = yor_sparse(ferrers, permutation.tup_rep)
 
-    res = None
-    for cycle in permutation.cycle_decomposition:
-        ts = []
-        for t in cycle_to_adj_transpositions(cycle, ferrers.size):
-            y = yor_trans(ferrers, t)
-            ts.append(t)
-            if res is None:
-                res = y
-            else:
-                res = res.dot(y)
     if use_cache:
-        YOR_CACHE[(ferrers.partition, permutation.tup_rep)] = res
+        YOR_CACHE.put(key, res)
     return res
 
 def yor_trans(ferrers, transposition):
@@ -95,9 +192,10 @@ def yor_trans(ferrers, transposition):
     given FerrersDiagram shape
     '''
     assert transposition[0] < transposition[1]
-    if (ferrers, transposition) in YOR_T_CACHE:
-        CACHE['hit'] += 1
-        return YOR_T_CACHE[(ferrers, transposition)]
+    key = (ferrers.partition, transposition)
+    rep = YOR_T_CACHE.get(key)
+    if rep is not None:
+        return rep
 
     tabs = ferrers.tableaux
     rep = np.zeros((len(tabs), len(tabs)))
@@ -113,9 +211,71 @@ def yor_trans(ferrers, transposition):
             rep[j, i] = rep[i, j]
             rep[j, j] = 1. / other.dist(*transposition)
 
-    YOR_T_CACHE[(ferrers, transposition)] = rep
+    YOR_T_CACHE.put(key, rep)
     return rep
 
+def yor_trans_sparse(ferrers, transposition):
+    '''
+    Sparse form of yor_trans. Each row of the YOR matrix of an adjacent transposition (k, k+1)
+    has at most two nonzeros: the diagonal and the entry of the tableau with k and k+1 swapped.
+    ferrers: a FerrersDiagram object
+    transposition: a 2-tuple of ints
+
+    Returns: tuple of numpy arrays (diag, partner, off), each of length d, where row i of
+        yor_trans(ferrers, transposition) is diag[i] at column i and off[i] at column partner[i]
+    '''
+    key = (ferrers.partition, transposition)
+    if key in YOR_T_SPARSE_CACHE:
+        return YOR_T_SPARSE_CACHE[key]
+
+    tabs = ferrers.tableaux
+    diag = np.zeros(len(tabs))
+    partner = np.arange(len(tabs))
+    off = np.zeros(len(tabs))
+    for tab in tabs:
+        i = tab.idx
+        diag[i] = 1. / tab.dist(*transposition)
+        other = tab.transpose(transposition)
+        if other is not None:
+            partner[i] = other.idx
+            off[i] = np.sqrt(1 - diag[i] ** 2)
+
+    YOR_T_SPARSE_CACHE[key] = (diag, partner, off)
+    return YOR_T_SPARSE_CACHE[key]
+
+def apply_trans(gen, mat, left=False):
+    '''
+    Multiply mat by an adjacent transposition YOR matrix in O(size of mat) time.
+    gen: output of yor_trans_sparse
+    mat: numpy array of shape (d,) or (..., d, d). Vectors are treated as row vectors
+        (column vectors if left=True)
+    left: if True compute gen * mat, otherwise mat * gen
+
+    Returns: numpy array of the same shape as mat
+    '''
+    diag, partner, off = gen
+    if left:
+        mat = np.swapaxes(mat, -1, -2) if mat.ndim > 1 else mat
+    res = mat * diag + mat[..., partner] * off
+    if left and mat.ndim > 1:
+        res = np.swapaxes(res, -1, -2)
+    return res
+
+def yor_sparse(ferrers, tup, mat=None):
+    '''
+    Compute the YOR matrix of a permutation by applying the sparse adjacent transposition
+    generators one at a time: O(n^2 d^2) instead of O(n^2 d^3) for dense products.
+    ferrers: FerrersDiagram
+    tup: tuple of ints, permutation in tuple form
+    mat: (optional) numpy array to right multiply by the YOR matrix instead of the identity
+
+    Returns: numpy matrix of size d x d (or mat * yor matrix)
+    '''
+    res = np.eye(len(ferrers.tableaux)) if mat is None else mat
+    for t in tup_to_adj_transpositions(tup):
+        res = apply_trans(yor_trans_sparse(ferrers, t), res)
+    return res
+
 def ysemi(ferrers, permutation):
     '''
     Compute the irreps of the given shape using Young's Seminormal Form
@@ -181,52 +341,111 @@ def ysemi_t(f, transposition):
 
     return rep
 
+def yor_table(ferrers):
+    '''
+    Generator for the YOR matrices of every permutation of S_n, n = ferrers.size.
+    Every permutation is uniquely c_2(j_2)^{-1} c_3(j_3)^{-1} ... c_n(j_n)^{-1}, where
+    c_k(j)^{-1} = (k-1, k)(k-2, k-1)...(j, j+1). Walking this spanning tree of the Cayley graph
+    of adjacent transpositions depth first gets each matrix from its parent's with a single
+    sparse generator application, and only keeps n matrices alive at a time.
+    ferrers: FerrersDiagram
+
+    Yields: (permutation tuple, yor matrix)
+    '''
+    n = ferrers.size
+    gens = [yor_trans_sparse(ferrers, (k, k+1)) for k in range(1, n)]
+
+    def _walk(k, tup, mat):
+        # tup, mat: an element of S_k (embedded in S_n) and its matrix
+        if k == n:
+            yield tup, mat
+            return
+
+        for j in range(k+1, 0, -1):
+            if j <= k:
+                # right multiply by the transposition (j, j+1)
+                tup = tup[:j-1] + (tup[j], tup[j-1]) + tup[j+1:]
+                mat = apply_trans(gens[j-1], mat)
+            yield from _walk(k+1, tup, mat)
+
+    yield from _walk(1, tuple(range(1, n+1)), np.eye(len(ferrers.tableaux)))
+
+def save_yor_table(ferrers, fname, max_mb=1000):
+    '''
+    Stream the YOR matrices of all of S_n to a pickle file as a sequence of dict chunks
+    so that at most max_mb of matrices are held in memory. Read it back with load_yor.
+    ferrers: FerrersDiagram
+    fname: string, file to save to
+    max_mb: int, memory budget in megabytes for one chunk
+    '''
+    d = len(ferrers.tableaux)
+    chunk_size = max(1, int(max_mb * (2 ** 20)) // (d * d * 8))
+    with open(fname, 'wb') as f:
+        chunk = {}
+        for tup, mat in yor_table(ferrers):
+            chunk[tup] = mat
+            if len(chunk) >= chunk_size:
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+                chunk = {}
+        if len(chunk) > 0:
+            pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def save_yor_store(ferrers, fname):
+    '''
+    Write the YOR matrices of all of S_n to an irrep store (see irrep_store.py).
+    ferrers: FerrersDiagram
+    fname: string, file to save to
+    Returns: IrrepStore
+    '''
+    d = len(ferrers.tableaux)
+    return write_irrep_store(fname, ferrers.partition, d, yor_table(ferrers))
+
 # TODO: Benchmarking function should go elsewhere
-def benchmark(n):
+def benchmark(n, prefix='/local/hopan/irreps/'):
     '''
-    Benchmark time/memory usage for generating all YoungTableau for S_8
+    Benchmark time/memory usage for generating the yor matrices of all of S_n
     '''
     tstart = time.time()
     _partitions = partitions(n)
-    s_n = sn(n)
     print('Starting...')
-    times = []
     for idx, p in enumerate(_partitions):
         start = time.time()
-        sdict = {}
         f = FerrersDiagram(p)
-        if os.path.exists('/local/hopan/irreps/s_9/{}.pkl'.format(p)):
+        fname = irrep_store_path(prefix, p)
+        if os.path.exists(fname):
             print('Skipping {}'.format(p))
             continue
-        for perm in s_n:
-            start = time.time()
-            y = yor(f, perm)
-            end = time.time()
-            if random.random() > 0.1 and len(times) < 1000:
-                times.append(end - start)
-            if len(times) >= 1000:
-                pdb.set_trace()
-            sdict[perm.tup_rep] = y
+        save_yor_store(f, fname)
 
         done = time.time() - start
         print('Elapsed: {:.2f}mins | Done {} / {} | Partition: {}'.format(done / 60., idx, len(_partitions), p))
 
-        with open('/local/hopan/irreps/s_{}/{}.pkl'.format(n, p), 'wb') as f:
-            pickle.dump(sdict, f, protocol=pickle.HIGHEST_PROTOCOL)
-
     tend = time.time() - tstart
     print('Total time compute yor matrices for S_{}: {:3f}'.format(n, tend))
-    print(CACHE)
+    print(yor_cache_stats())
+    check_memory()
 
 def load_yor(fname, partition):
+    '''
+    Load a pickle of yor matrices. The file can hold a single dict or a sequence of
+    dict chunks (as written by save_yor_table).
+    Irrep store files (IRREP_EXT) are memory mapped instead and returned as an IrrepStore.
+    Neither goes through YOR_CACHE: the caller holds every matrix already, and putting a
+    large irrep in the bounded cache would only evict the hot entries.
+    '''
     #print('loading yor from: {}'.format(fname))
+    if fname.endswith(IRREP_EXT):
+        return IrrepStore(fname)
+
+    yor_dict = {}
     with open(fname, 'rb') as f:
-        yor_dict = pickle.load(f)
-        # mapping form permutation in list form to numpy array
-        for perm, mat in yor_dict.items():
-            YOR_CACHE[(partition, perm)] = mat
+        while True:
+            try:
+                yor_dict.update(pickle.load(f))
+            except EOFError:
+                break
 
-        return yor_dict
+    return yor_dict
 
 if __name__ == '__main__':
     n = int(sys.argv[1])